@@ -1,7 +1,9 @@
-import io
-from decimal import Decimal, getcontext
-from tkinter import messagebox
-import matplotlib.pyplot as plt
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from decimal import getcontext
+from functools import lru_cache
+from matplotlib.figure import Figure
 import numpy as np
 import pydicom
 from PIL import Image as PILImage  # Alias PIL's Image to PILImage
@@ -9,8 +11,13 @@ from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.platypus import Paragraph, Spacer, Image, Table, TableStyle
-import logging
 from logs.logger import setup_logger
+from Analysis.progress import notify
+from Analysis.results import QAResults, ReportElements
+from Analysis.dicom_headers import memmap_dicom_pixels
+from Analysis.figures import DeferredFigure, render_figure
+from Analysis import profile_engine
+from Analysis.profile_engine import points_to_arrays
 
 log = setup_logger("FFF_FA_2D.py")
 
@@ -29,11 +36,6 @@ footer_style = ParagraphStyle('FooterStyle',
 getcontext().prec = 2
 
 class PointXY:
-    maxSlope = float('-inf')
-    minSlope = float('inf')
-    Y1 = 0
-    Y2 = 0
-
     def __init__(self, index, x, y):
         self.index = index
         self.x = x
@@ -44,92 +46,29 @@ class PointXY:
         dy = p.y - self.y
         dx = p.x - self.x
         self.slope = dy / dx if dx != 0 else float('inf')
-        if self.slope > PointXY.maxSlope:
-            PointXY.maxSlope = self.slope
-            PointXY.Y1 = self.y
-        if self.slope < PointXY.minSlope:
-            PointXY.minSlope = self.slope
-            PointXY.Y2 = self.y
 
 class Process:
     @staticmethod
-    def calculate(points):
-        for i in range(len(points) - 1):
-            points[i].calcSlope(points[i + 1])
-
-        max_slope = Decimal(PointXY.maxSlope)
-        min_slope = Decimal(PointXY.minSlope)
-
-        RDV = (PointXY.Y1 + PointXY.Y2) / 2
-        upperY = RDV * 1.6
-        lowerY = RDV * 0.4
-
-        negUpperX = Process.predictX(upperY, points, -1)
-        posUpperX = Process.predictX(upperY, points, 1)
-
-        negLowerX = Process.predictX(lowerY, points, -1)
-        posLowerX = Process.predictX(lowerY, points, 1)
-
-        deltaNegativeX = abs(negLowerX - negUpperX)
-        deltaPositiveX = abs(posLowerX - posUpperX)
-
-        negAvgX = Process.predictX(RDV, points, -1)
-        posAvgX = Process.predictX(RDV, points, 1)
-        diffAvgX = posAvgX - negAvgX
-
-        negX90Y = Process.predictX(90, points, -1)
-        posX90Y = Process.predictX(90, points, 1)
-        diffX90Y = posX90Y - negX90Y
-
-        negX75Y = Process.predictX(75, points, -1)
-        posX75Y = Process.predictX(75, points, 1)
-        diffX75Y = posX75Y - negX75Y
-
-        negX60Y = Process.predictX(60, points, -1)
-        posX60Y = Process.predictX(60, points, 1)
-        diffX60Y = posX60Y - negX60Y
-
-        results = {
-            'max_slope': max_slope,
-            'min_slope': min_slope,
-            'RDV': RDV,
-            'PLu': negUpperX,
-            'PLd': negLowerX,
-            'Penumbra_Left(mm)': deltaNegativeX * 10,
-            'PRu': posUpperX,
-            'PRd': posLowerX,
-            'Penumbra_Right(mm)': deltaPositiveX * 10,
-            'IPL': negAvgX,
-            'IPR': posAvgX,
-            'Field size(mm)': diffAvgX * 10,
-            '90-': negX90Y,
-            '90+': posX90Y,
-            'X90%': diffX90Y,
-            '75-': negX75Y,
-            '75+': posX75Y,
-            'X75%': diffX75Y,
-            '60-': negX60Y,
-            '60+': posX60Y,
-            'X60%': diffX60Y
-        }
-
-        for key, value in results.items():
-            print(f"{key} = {value:.2f}")
+    def calculate(points, interpolate=True):
+        x, dose = points_to_arrays(points)
+        results = profile_engine.calculate(x, dose, interpolate=interpolate)
 
+        log.debug(", ".join(f"{key} = {value:.2f}" for key, value in results.items()))
         return results
 
     @staticmethod
-    def predictX(y, points, isNeg):
-        minDiffWithY = float('inf')
-        predictedX = float('inf')
-
-        for p in points:
-            diffWithY = abs(p.y - y)
-            if diffWithY < minDiffWithY and (p.x * isNeg) > 0:
-                minDiffWithY = diffWithY
-                predictedX = p.x
+    def calculate_many(point_lists, interpolate=True):
+        """Analyse several profiles (e.g. Inline and Crossline) in parallel; results keep input order."""
+        all_results = profile_engine.calculate_many([points_to_arrays(points) for points in point_lists],
+                                                    interpolate=interpolate)
+        for results in all_results:
+            log.debug(", ".join(f"{key} = {value:.2f}" for key, value in results.items()))
+        return all_results
 
-        return predictedX
+    @staticmethod
+    def predictX(y, points, isNeg):
+        x, dose = points_to_arrays(points)
+        return float(profile_engine.predict_x(y, x, dose, isNeg)[0])
 
 def invert_image(pixel_array):
     """Invert pixel values (utility kept but not applied to the whole image by default)."""
@@ -138,42 +77,185 @@ def invert_image(pixel_array):
 
 def read_dicom(file_path):
     """
-    Read DICOM and return raw pixel array (do NOT invert image here).
-    Return (original_pixel_array) to allow preview using original data.
+    Read DICOM and return the raw pixel array (do NOT invert image here).
+    Uncompressed images are memory-mapped, so only the rows/columns that are
+    sliced out (profiles, preview) are ever read from disk; other images are
+    decoded by pydicom. The array keeps its stored dtype - callers cast the
+    pieces they use.
     """
-    dataset = pydicom.dcmread(file_path)
-    pixel_array = dataset.pixel_array.astype(np.float32)
+    pixel_array = memmap_dicom_pixels(file_path)
+    if pixel_array is None:
+        pixel_array = pydicom.dcmread(file_path).pixel_array
     return pixel_array
 
 
+# Scale used when no spacing is known: the former fixed x / 40 conversion (0.25 mm per pixel)
+DEFAULT_PIXEL_SPACING_MM = (0.25, 0.25)
+
+
+@lru_cache(maxsize=256)
+def _dicom_pixel_spacing(file_path, mtime, size):
+    """Header-only read of the (row, col) pixel spacing in mm at the isocentre plane; cached per file version."""
+    dataset = pydicom.dcmread(file_path, stop_before_pixels=True)
+    spacing = dataset.get('ImagePlanePixelSpacing')
+    # ImagePlanePixelSpacing is measured at the imager, so project it back to the isocentre
+    sid = dataset.get('RTImageSID')
+    sad = dataset.get('RadiationMachineSAD')
+    magnification = float(sid) / float(sad) if spacing and sid and sad else 1.0
+    if not spacing:
+        spacing = dataset.get('PixelSpacing')
+    if not spacing:
+        return None
+    return float(spacing[0]) / magnification, float(spacing[1]) / magnification
+
+
+def read_pixel_spacing(file_path, file_type, calibration_mm=None):
+    """
+    Pixel spacing (row, col) in mm at the isocentre plane.
+    DICOM: PixelSpacing/ImagePlanePixelSpacing with SID/SAD magnification from the header.
+    TIFF (or DICOM without spacing): calibration_mm - a single value or (row, col) - supplied by
+    the user, else the legacy 0.25 mm.
+    """
+    if file_type.upper() == 'DICOM':
+        stat = os.stat(file_path)
+        spacing = _dicom_pixel_spacing(file_path, stat.st_mtime_ns, stat.st_size)
+        if spacing is not None:
+            return spacing
+    if calibration_mm is not None:
+        if np.ndim(calibration_mm) == 0:
+            return float(calibration_mm), float(calibration_mm)
+        return float(calibration_mm[0]), float(calibration_mm[1])
+    log.warning(f"No pixel spacing for {file_path}; using {DEFAULT_PIXEL_SPACING_MM[0]} mm per pixel")
+    return DEFAULT_PIXEL_SPACING_MM
+
+
 def read_tiff(file_path):
-    """Read TIFF and return raw pixel array (do NOT invert image here)."""
+    """Read TIFF and return raw pixel array in its stored dtype (do NOT invert image here)."""
     img = PILImage.open(file_path)
-    pixel_array = np.array(img).astype(np.float32)
+    pixel_array = np.asarray(img)
     return pixel_array
 
 
-def extract_profile_points(pixel_array, axis=0, invert_profile=False):
+def preview_step(shape, max_size=512):
+    """Stride that brings the larger image side down to at most max_size pixels."""
+    return max(1, -(-max(shape[:2]) // max_size))
+
+
+def downsample_preview(pixel_array, max_size=512):
+    """Strided, float32 preview of the image no larger than max_size pixels per side."""
+    step = preview_step(pixel_array.shape, max_size)
+    return np.asarray(pixel_array[::step, ::step], dtype=np.float32)
+
+
+def find_field_centre(pixel_array, invert=False):
+    """
+    Centroid (row, col) of the irradiated field in full-resolution pixels, found on the
+    downsampled preview by thresholding halfway between the image minimum and maximum.
+    """
+    step = preview_step(pixel_array.shape)
+    preview = downsample_preview(pixel_array)
+    if preview.ndim > 2:
+        preview = preview.mean(axis=2)
+    if invert:
+        preview = preview.max() - preview
+
+    mask = preview > (preview.min() + preview.max()) / 2
+    if not mask.any():
+        h, w = pixel_array.shape[:2]
+        return h // 2, w // 2
+    rows, cols = np.nonzero(mask)
+    return int(round(rows.mean() * step)), int(round(cols.mean() * step))
+
+
+@lru_cache(maxsize=32)
+def _line_sampling_map(shape, centre, angle, band_width):
+    """
+    Precomputed bilinear interpolation map for a profile through centre at angle degrees
+    (0 = along a row like Inline, 90 = down a column like Crossline), averaged over
+    band_width parallel lines. Returns (r, r0, c0, fr, fc); r is the distance from centre in pixels.
+    """
+    h, w = shape
+    theta = np.deg2rad(angle)
+    d_row, d_col = np.sin(theta), np.cos(theta)
+    n_row, n_col = np.cos(theta), -np.sin(theta)
+    offsets = np.arange(band_width) - (band_width - 1) / 2
+
+    # Longest symmetric line through the centre that stays inside the image
+    limits = []
+    for c, d, size in ((centre[0], d_row, h), (centre[1], d_col, w)):
+        if abs(d) > 1e-9:
+            limits.append(min(c, size - 1 - c) / abs(d))
+    r_max = max(int(np.floor(min(limits))), 1)
+    r = np.arange(-r_max, r_max + 1, dtype=np.float64)
+
+    rows = centre[0] + r[np.newaxis, :] * d_row + offsets[:, np.newaxis] * n_row
+    cols = centre[1] + r[np.newaxis, :] * d_col + offsets[:, np.newaxis] * n_col
+    r0 = np.clip(np.floor(rows), 0, h - 2).astype(np.intp)
+    c0 = np.clip(np.floor(cols), 0, w - 2).astype(np.intp)
+    fr = np.clip(rows - r0, 0.0, 1.0)
+    fc = np.clip(cols - c0, 0.0, 1.0)
+    return r, r0, c0, fr, fc
+
+
+def sample_line(pixel_array, centre, angle, band_width=1):
+    """Band-averaged profile along an arbitrary angle; returns (r, values) as float arrays."""
+    r, r0, c0, fr, fc = _line_sampling_map(tuple(pixel_array.shape[:2]), tuple(centre), float(angle), int(band_width))
+    # Only the pixels under the line are read (important for memory-mapped images)
+    rows = np.unique(np.concatenate([r0.ravel(), r0.ravel() + 1]))
+    block = np.asarray(pixel_array[rows], dtype=np.float32)
+    if block.ndim > 2:
+        block = block.mean(axis=2)
+    lr0 = np.searchsorted(rows, r0)
+    values = ((1 - fr) * (1 - fc) * block[lr0, c0] + (1 - fr) * fc * block[lr0, c0 + 1] +
+              fr * (1 - fc) * block[lr0 + 1, c0] + fr * fc * block[lr0 + 1, c0 + 1])
+    return r, values.mean(axis=0)
+
+
+def extract_profile_points(pixel_array, axis=0, invert_profile=False, band_width=1, centre=None, angle=None,
+                           pixel_spacing_mm=DEFAULT_PIXEL_SPACING_MM):
     """
     Extract profile points from pixel_array along axis.
     axis==0 -> inline (middle row), axis==1 -> crossline (middle column).
     invert_profile: if True, invert profile intensity values (max - value) before normalization.
+    band_width: number of neighbouring rows/columns averaged into the profile.
+    centre: (row, col) the profile passes through; defaults to the image centre.
+    angle: sample at an arbitrary angle in degrees (0 = inline, 90 = crossline) instead of axis.
+    pixel_spacing_mm: (row, col) pixel size at the isocentre, see read_pixel_spacing.
     Returns list of PointXY objects (same shape as original pipeline expects).
     """
     h, w = pixel_array.shape[:2]
-
-    if axis == 1:
-        # crossline (middle column -> vertical profile)
-        profile = pixel_array[:, w // 2].astype(np.float32)
-        length = profile.shape[0]
-        half = length // 2
-        x_values = np.linspace(-half, half, length)
+    band_width = max(int(band_width), 1)
+    row_mm, col_mm = pixel_spacing_mm
+
+    if angle is not None:
+        r, profile = sample_line(pixel_array, centre if centre is not None else (h // 2, w // 2), angle, band_width)
+        x_values = r
+        theta = np.deg2rad(angle)
+        step_mm = np.hypot(np.sin(theta) * row_mm, np.cos(theta) * col_mm)
     else:
-        # inline (middle row -> horizontal profile)
-        profile = pixel_array[h // 2, :].astype(np.float32)
+        c_row, c_col = centre if centre is not None else (h // 2, w // 2)
+        if axis == 1:
+            # crossline (column band -> vertical profile)
+            start = int(np.clip(c_col - band_width // 2, 0, max(w - band_width, 0)))
+            band = pixel_array[:, start:start + band_width]
+            profile = band.astype(np.float32).mean(axis=1)
+            c_pos = c_row
+            step_mm = row_mm
+        else:
+            # inline (row band -> horizontal profile)
+            start = int(np.clip(c_row - band_width // 2, 0, max(h - band_width, 0)))
+            band = pixel_array[start:start + band_width, :]
+            profile = band.astype(np.float32).mean(axis=0)
+            c_pos = c_col
+            step_mm = col_mm
+        if profile.ndim > 1:
+            profile = profile.mean(axis=-1)
         length = profile.shape[0]
-        half = length // 2
-        x_values = np.linspace(-half, half, length)
+        if centre is None:
+            half = length // 2
+            x_values = np.linspace(-half, half, length)
+        else:
+            x_values = np.arange(length) - c_pos
 
     # If vendor/flag indicates inverted greyscale (Elekta), invert the 1D profile here
     if invert_profile:
@@ -182,11 +264,35 @@ def extract_profile_points(pixel_array, axis=0, invert_profile=False):
     max_val = np.max(profile) if np.max(profile) != 0 else 1.0
     norm_profile = (profile / max_val) * 100.0
 
-    # Build PointXY objects centered on x (convert units to cm later if required by Process)
-    points = [PointXY(i, x_values[i] / 40.0, float(norm_profile[i])) for i in range(len(norm_profile))]
+    # Pixel offsets to cm at the isocentre in one vectorised step
+    x_cm = x_values * (step_mm / 10.0)
+
+    # Build PointXY objects centered on x
+    points = [PointXY(i, x, y) for i, (x, y) in enumerate(zip(x_cm.tolist(), norm_profile.tolist()))]
 
     return points
 
+
+def extract_profiles(pixel_array, invert_profile=False, band_width=1, auto_centre=False, angles=(),
+                     pixel_spacing_mm=DEFAULT_PIXEL_SPACING_MM):
+    """
+    Extract the Inline and Crossline profiles plus any extra angled profiles.
+    auto_centre: pass the profiles through the detected field centroid instead of the image centre.
+    pixel_spacing_mm: (row, col) pixel size at the isocentre, see read_pixel_spacing.
+    Returns ([(name, points), ...], centre) where centre is None for the image centre.
+    """
+    centre = find_field_centre(pixel_array, invert_profile) if auto_centre else None
+    options = dict(invert_profile=invert_profile, band_width=band_width, centre=centre,
+                   pixel_spacing_mm=pixel_spacing_mm)
+    profiles = [
+        ('Inline', extract_profile_points(pixel_array, axis=0, **options)),
+        ('Crossline', extract_profile_points(pixel_array, axis=1, **options)),
+    ]
+    for angle in angles or ():
+        profiles.append((f'{angle:g} deg', extract_profile_points(pixel_array, angle=angle, **options)))
+    return [(name, points) for name, points in profiles if points], centre
+
+
 def process_dicom_or_tiff(file_path, file_type):
     """
     Read file and return (points_inline, points_crossline, original_pixel_array, pixel_array)
@@ -194,7 +300,8 @@ def process_dicom_or_tiff(file_path, file_type):
     """
     if file_type.upper() == 'DICOM':
         pixel_array = read_dicom(file_path)
-        original_pixel_array = pixel_array.copy()
+        # read-only (memory-mapped or freshly decoded) data, so no defensive copy is needed
+        original_pixel_array = pixel_array
     elif file_type.upper() == 'TIFF':
         pixel_array = read_tiff(file_path)
         original_pixel_array = None
@@ -208,58 +315,72 @@ def process_dicom_or_tiff(file_path, file_type):
     return points_inline, points_crossline, original_pixel_array, pixel_array
 
 
-def plot_image_with_inline_crossline(pixel_array, image_type):
+def plot_image_with_inline_crossline(pixel_array, image_type, centre=None):
     """
     Plot the DICOM or TIFF image with Inline (vertical) and Crossline (horizontal) axes.
+    Only a downsampled preview is materialised; it is drawn in full-resolution pixel coordinates.
+    centre: (row, col) the profiles pass through; defaults to the image centre.
     Returns the image with axes as a BytesIO object.
     """
-    plt.figure(figsize=(9, 9))
-    plt.imshow(pixel_array, cmap='gray')  # Display the image in grayscale
+    return render_figure(draw_inline_crossline_preview, downsample_preview(pixel_array), pixel_array.shape[:2],
+                         image_type, centre)
+
+
+def draw_inline_crossline_preview(preview, shape, image_type, centre=None):
+    """
+    Draw a downsampled preview of an image of the given full-resolution shape with the
+    Inline and Crossline axes through centre; returns the Figure.
+    """
+    h, w = shape[:2]
+    c_row, c_col = centre if centre is not None else (h // 2, w // 2)
+    fig = Figure(figsize=(9, 9))
+    ax = fig.add_subplot()
+    ax.imshow(preview, cmap='gray',
+               extent=(-0.5, w - 0.5, h - 0.5, -0.5))  # Display the image in grayscale
 
     # Add Inline (vertical) and Crossline (horizontal) axes
-    plt.axvline(pixel_array.shape[1] // 2, color='blue', linestyle='--', label='Inline')  # Inline axis (vertical)
-    plt.axhline(pixel_array.shape[0] // 2, color='green', linestyle='--', label='Crossline')  # Crossline axis (horizontal)
+    ax.axvline(c_col, color='blue', linestyle='--', label='Inline')  # Inline axis (vertical)
+    ax.axhline(c_row, color='green', linestyle='--', label='Crossline')  # Crossline axis (horizontal)
 
     # Labeling the axes Inline (vertical) and Crossline (horizontal)
-    plt.text(pixel_array.shape[1] // 2 + 20, pixel_array.shape[0] // 2 - 50, 'Inline', color='blue', fontsize=12,
+    ax.text(c_col + 20, c_row - 50, 'Inline', color='blue', fontsize=12,
              fontweight='bold', rotation=90)
-    plt.text(pixel_array.shape[1] // 2 - 150, pixel_array.shape[0] // 2 + 40, 'Crossline', color='green', fontsize=12,
+    ax.text(c_col - 150, c_row + 40, 'Crossline', color='green', fontsize=12,
              fontweight='bold')
 
-    plt.title(f'{image_type} Image with Inline and Crossline Axes')
-
-    # Save the plot to a BytesIO object in PNG format
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight')
-    buf.seek(0)
-    plt.close()
-
-    return buf  # Return BytesIO object containing the PNG image
+    ax.set_title(f'{image_type} Image with Inline and Crossline Axes')
+    return fig
 
 
 def plot_to_image(points, results, profile_type):
     """Plot the profile points and return the image as bytes, with labeled points and larger point sizes."""
+    return render_figure(draw_profile_figure, points, results, profile_type)
+
+
+def draw_profile_figure(points, results, profile_type):
+    """Draw the profile with labeled points and larger point sizes; returns the Figure."""
     x = [point.x for point in points]
     y = [point.y for point in points]
 
-    plt.figure(figsize=(10, 6))
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
 
     # Plot the profile line (with larger markers for visibility)
-    plt.plot(x, y, marker='o', linestyle='-', color='b', markersize=3)  # Increase marker size to 5
+    ax.plot(x, y, marker='o', linestyle='-', color='b', markersize=3)  # Increase marker size to 5
 
     # Plot the 90%, 75%, and 60% dose lines
-    plt.plot([results['90-'], results['90+']], [90, 90], 'm-', lw=1.5, label="90% Dose")
-    plt.plot([results['75-'], results['75+']], [75, 75], 'y-', lw=1.5, label="75% Dose")
-    plt.plot([results['60-'], results['60+']], [60, 60], 'k-', lw=1.5, label="60% Dose")
+    ax.plot([results['90-'], results['90+']], [90, 90], 'm-', lw=1.5, label="90% Dose")
+    ax.plot([results['75-'], results['75+']], [75, 75], 'y-', lw=1.5, label="75% Dose")
+    ax.plot([results['60-'], results['60+']], [60, 60], 'k-', lw=1.5, label="60% Dose")
 
     # Plot RDV*1.6 and RDV*0.4 lines
-    plt.plot([results['PLu'], results['PRu']], [results['RDV'] * 1.6, results['RDV'] * 1.6], 'g-', lw=1.5,
+    ax.plot([results['PLu'], results['PRu']], [results['RDV'] * 1.6, results['RDV'] * 1.6], 'g-', lw=1.5,
              label="1.6 * RDV")
-    plt.plot([results['PLd'], results['PRd']], [results['RDV'] * 0.4, results['RDV'] * 0.4], 'c-', lw=1.5,
+    ax.plot([results['PLd'], results['PRd']], [results['RDV'] * 0.4, results['RDV'] * 0.4], 'c-', lw=1.5,
              label="0.4 * RDV")
 
     # Plot the IPL and IPR line (midline)
-    plt.plot([results['IPL'], results['IPR']], [results['RDV'], results['RDV']], 'r-', lw=1.5, label="RDV")
+    ax.plot([results['IPL'], results['IPR']], [results['RDV'], results['RDV']], 'r-', lw=1.5, label="RDV")
 
     # Scatter and label key points (increase point size and add labels)
     point_labels = [
@@ -275,7 +396,7 @@ def plot_to_image(points, results, profile_type):
 
     for label, x_value, y_value in point_labels:
         # Plot scatter points with larger red dots
-        plt.scatter(x_value, y_value, color='red', s=30, zorder=5)  # Use a larger size for scatter points
+        ax.scatter(x_value, y_value, color='red', s=30, zorder=5)  # Use a larger size for scatter points
 
         # Adjust label positioning based on whether x_value is negative or positive
         if x_value < 0:
@@ -289,43 +410,34 @@ def plot_to_image(points, results, profile_type):
 
         # Add label with the adjusted horizontal alignment and offset
         bbox_props = dict(boxstyle="round,pad=0.3", edgecolor="black", facecolor="white")
-        plt.text(x_value + x_offset, y_value, label, color='black', ha=ha, fontsize=10, bbox=bbox_props)
+        ax.text(x_value + x_offset, y_value, label, color='black', ha=ha, fontsize=10, bbox=bbox_props)
 
     # X-axis centered at 0
-    plt.axvline(0, color='gray', linestyle='--', lw=1)  # Add a vertical line at x = 0 for reference
+    ax.axvline(0, color='gray', linestyle='--', lw=1)  # Add a vertical line at x = 0 for reference
 
     # Set labels and title
-    plt.xlabel('Field width (cm)', fontsize=12)
-    plt.ylabel('Dose (%)', fontsize=12)
+    ax.set_xlabel('Field width (cm)', fontsize=12)
+    ax.set_ylabel('Dose (%)', fontsize=12)
 
-    if profile_type == 'Inline':
-        plt.title('Beam Profile Inline', fontsize=14, fontweight='bold')
-    elif profile_type == 'Crossline':
-        plt.title('Beam Profile Crossline', fontsize=14, fontweight='bold')
+    if profile_type:
+        ax.set_title(f'Beam Profile {profile_type}', fontsize=14, fontweight='bold')
     else:
-        plt.title('Beam Profile', fontsize=14, fontweight='bold')
+        ax.set_title('Beam Profile', fontsize=14, fontweight='bold')
 
     # Set x-axis limits (optional: to ensure points are visible)
-    plt.xlim([min(x) * 1.1, max(x) * 1.1])
+    ax.set_xlim([min(x) * 1.1, max(x) * 1.1])
 
     # Set y-axis limits to ensure full range of the dose is visible (optional)
-    plt.ylim([min(y) * 0.9, max(y) * 1.1])
+    ax.set_ylim([min(y) * 0.9, max(y) * 1.1])
 
     # Add a grid and background color
-    plt.grid(True, linestyle='--', alpha=0.7)
-    plt.gca().set_facecolor('lightgrey')
+    ax.grid(True, linestyle='--', alpha=0.7)
+    ax.set_facecolor('lightgrey')
 
     # Add legend
-    plt.legend(loc='upper right')
-
-    # Save the plot to a BytesIO object
-    buf = io.BytesIO()
-    plt.tight_layout()
-    plt.savefig(buf, format='png', bbox_inches='tight')
-    buf.seek(0)
-    plt.close()
-
-    return buf
+    ax.legend(loc='upper right')
+    fig.tight_layout()
+    return fig
 
 
 def add_FAresults_to_pdf(elements, results, profile_type, img_data, energy, depth):
@@ -359,65 +471,187 @@ def add_FAresults_to_pdf(elements, results, profile_type, img_data, energy, dept
     elements.append(table)
     elements.append(Spacer(1, 12))
 
-    image = Image(img_data)
+    image = img_data if isinstance(img_data, DeferredFigure) else Image(img_data)
     image.drawHeight = 5 * inch
     image.drawWidth = 7 * inch
     elements.append(image)
     elements.append(Spacer(1, 12))
-def process_fffFA_analysis(file_path, file_type, energy, depth, vendor='Elekta', invert_profile=False):
+
+
+def resolve_profile_inversion(vendor, invert_profile=False):
+    """Decide whether the 1D profiles need inverting for the given vendor."""
+    vendor_name = str(vendor).strip().lower()
+
+    if vendor_name == 'elekta':
+        return True  # Elekta images require profile inversion
+    elif vendor_name == 'varian':
+        return False  # Varian images used as-is
+    # fallback: do NOT invert unless explicitly forced
+    return bool(invert_profile)
+
+
+def process_fffFA_analysis(file_path, file_type, energy, depth, vendor='Elekta', invert_profile=False,
+                           band_width=1, auto_centre=False, angles=(), calibration_mm=None, progress=None):
     """
     Main entry for FFF 2D analysis.
     vendor: 'Elekta' or 'Varian' (string). Varian implies profile inversion by default.
     invert_profile: explicit override (True forces inversion).
-    Returns: elements (list) - same structure as original function (PDF elements).
+    band_width: pixels averaged across each profile (1 = single row/column).
+    auto_centre: centre the profiles on the detected field centroid.
+    angles: extra profile angles in degrees (e.g. (45, 135) for the diagonals).
+    calibration_mm: pixel size at the isocentre for TIFF (or DICOM without spacing in its header).
+    Returns: elements (list) - same structure as original function (PDF elements); .results holds the numbers.
     """
     log.info(f"Processing FFF FA Analysis for {file_type} file: {file_path}")
     try:
         # read raw pixels (no image inversion)
+        notify(progress, "Reading image", 0.05)
         points_inline, points_crossline, original_pixel_array, pixel_array = process_dicom_or_tiff(file_path, file_type)
+        pixel_spacing_mm = read_pixel_spacing(file_path, file_type, calibration_mm)
     except Exception as e:
         log.error(f"Error processing image: {e}")
-        messagebox.showerror("Error", str(e))
-        return []
+        raise
 
-    vendor_name = str(vendor).strip().lower()
+    effective_invert = resolve_profile_inversion(vendor, invert_profile)
 
-    if vendor_name == 'elekta':
-        effective_invert = True  # Elekta images require profile inversion
-    elif vendor_name == 'varian':
-        effective_invert = False  # Varian images used as-is
-    else:
-        # fallback: do NOT invert unless explicitly forced
-        effective_invert = bool(invert_profile)
-
-    elements = []
+    elements = ReportElements()
     log.info("Generating analysis report")
 
-    # Prepare image preview: use original if available (no changes to image)
-    if original_pixel_array is not None:
-        img_data_with_axes = plot_image_with_inline_crossline(original_pixel_array, file_type)
-    else:
-        img_data_with_axes = plot_image_with_inline_crossline(pixel_array, file_type)
-
-    pdf_image = Image(img_data_with_axes, 4 * inch, 4 * inch)
+    # Now extract profiles with the effective inversion flag
+    profiles, centre = extract_profiles(pixel_array, invert_profile=effective_invert, band_width=band_width,
+                                        auto_centre=auto_centre, angles=angles, pixel_spacing_mm=pixel_spacing_mm)
+
+    # Prepare image preview: use original if available (no changes to image).
+    # Only the small preview is kept; the figure is drawn when the PDF is generated.
+    preview_source = original_pixel_array if original_pixel_array is not None else pixel_array
+    pdf_image = DeferredFigure(draw_inline_crossline_preview, downsample_preview(preview_source),
+                               preview_source.shape[:2], file_type, centre, width=4 * inch, height=4 * inch)
     elements.append(Paragraph(f'PROFILE ANALYSIS - AERB METHOD (Vendor: {vendor}, inverted={effective_invert})', styles['Title']))
     elements.append(pdf_image)
+    elements.append(Paragraph(f"Pixel spacing at isocentre (mm) = {pixel_spacing_mm[0]:.4f} x {pixel_spacing_mm[1]:.4f}",
+                              styles['Normal']))
     elements.append(Spacer(1, 12))
 
-    # Now extract profiles with the effective inversion flag
-    inline_points = extract_profile_points(pixel_array, axis=0, invert_profile=effective_invert)
-    crossline_points = extract_profile_points(pixel_array, axis=1, invert_profile=effective_invert)
+    # Profiles are independent, so analyse them side by side; plotting stays serial
+    notify(progress, "Analyzing profiles", 0.3)
+    all_results = Process.calculate_many([points for _, points in profiles])
 
-    if inline_points:
-        results_inline = Process.calculate(inline_points)
-        img_data_inline = plot_to_image(inline_points, results_inline, 'Inline')
-        add_FAresults_to_pdf(elements, results_inline, 'Inline', img_data_inline, energy, depth)
+    for i, ((profile_type, points), results) in enumerate(zip(profiles, all_results)):
+        notify(progress, f"Building report for {profile_type}", 0.5 + 0.5 * i / len(profiles))
+        # The plot is drawn when the PDF is generated
+        img_data = DeferredFigure(draw_profile_figure, points, results, profile_type, width=7 * inch, height=5 * inch)
+        add_FAresults_to_pdf(elements, results, profile_type, img_data, energy, depth)
 
-    if crossline_points:
-        results_crossline = Process.calculate(crossline_points)
-        img_data_crossline = plot_to_image(crossline_points, results_crossline, 'Crossline')
-        add_FAresults_to_pdf(elements, results_crossline, 'Crossline', img_data_crossline, energy, depth)
+    rows = [{'profile': profile_type, **results} for (profile_type, _), results in zip(profiles, all_results)]
+    elements.results = QAResults('fff-2d', file_path, {'profiles': rows}, rows=rows, energy=energy, depth=depth,
+                                 vendor=vendor, inverted=effective_invert, pixel_spacing_mm=pixel_spacing_mm,
+                                 centre=centre)
 
     log.info("Analysis report generation completed successfully")
     return elements
 
+
+IMAGE_FILE_TYPES = {'.dcm': 'DICOM', '.tif': 'TIFF', '.tiff': 'TIFF'}
+
+
+def find_batch_images(folder_or_glob):
+    """Return sorted image paths from a folder (DICOM/TIFF files) or a glob pattern."""
+    if os.path.isdir(folder_or_glob):
+        paths = [os.path.join(folder_or_glob, name) for name in os.listdir(folder_or_glob)]
+    else:
+        paths = glob.glob(folder_or_glob)
+    return sorted(p for p in paths if os.path.isfile(p) and os.path.splitext(p)[1].lower() in IMAGE_FILE_TYPES)
+
+
+def analyze_fffFA_file(file_path, effective_invert, band_width=1, auto_centre=False, angles=(), calibration_mm=None):
+    """
+    Batch worker: read one image and analyse its profiles without plotting.
+    Runs in a child process, so it only returns picklable data.
+    """
+    file_type = IMAGE_FILE_TYPES[os.path.splitext(file_path)[1].lower()]
+    _, _, _, pixel_array = process_dicom_or_tiff(file_path, file_type)
+    pixel_spacing_mm = read_pixel_spacing(file_path, file_type, calibration_mm)
+    profiles, _ = extract_profiles(pixel_array, invert_profile=effective_invert, band_width=band_width,
+                                   auto_centre=auto_centre, angles=angles, pixel_spacing_mm=pixel_spacing_mm)
+    all_results = Process.calculate_many([points for _, points in profiles])
+    return {
+        "filename": os.path.basename(file_path),
+        "profiles": [(name, points, results) for (name, points), results in zip(profiles, all_results)],
+    }
+
+
+def add_FAbatch_summary_to_pdf(elements, image_results):
+    summary_keys = ['Field size(mm)', 'Penumbra_Left(mm)', 'Penumbra_Right(mm)', 'X90%', 'X75%', 'X60%']
+    data = [['Image', 'Profile'] + summary_keys]
+    for r in image_results:
+        if r.get("error"):
+            data.append([r["filename"], 'Failed'] + [''] * len(summary_keys))
+            continue
+        for profile_type, _, results in r["profiles"]:
+            data.append([r["filename"], profile_type] + [f"{results[key]:.2f}" for key in summary_keys])
+
+    table = Table(data, repeatRows=1)
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('FONTSIZE', (0, 0), (-1, -1), 7),
+    ]))
+    elements.append(Paragraph("Summary of FFF Profile Results", styles['Heading2']))
+    elements.append(table)
+    elements.append(Spacer(1, 12))
+
+
+def process_fffFA_batch(folder_or_glob, energy, depth, vendor='Elekta', invert_profile=False, max_workers=None,
+                        band_width=1, auto_centre=False, angles=(), calibration_mm=None, progress=None):
+    """
+    Batch FFF 2D analysis of every DICOM/TIFF image in a folder (or matching a glob pattern).
+    Images are read and analysed across a process pool of max_workers (default: CPU count);
+    plotting and report elements are built here in the parent, in filename order.
+    band_width, auto_centre, angles and calibration_mm apply to every image as in process_fffFA_analysis.
+    Returns: elements (list) - summary table followed by one section per image; .results holds the numbers.
+    """
+    log.info(f"FFF FA batch analysis started for {folder_or_glob}")
+    file_paths = find_batch_images(folder_or_glob)
+    if not file_paths:
+        raise ValueError(f"No DICOM or TIFF images found in {folder_or_glob}")
+
+    effective_invert = resolve_profile_inversion(vendor, invert_profile)
+    image_results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(analyze_fffFA_file, path, effective_invert, band_width, auto_centre, tuple(angles),
+                                   calibration_mm)
+                   for path in file_paths]
+        for path, future in zip(file_paths, futures):
+            notify(progress, f"Analyzing {os.path.basename(path)}", 0.6 * len(image_results) / len(file_paths))
+            try:
+                image_results.append(future.result())
+            except Exception as e:
+                log.error(f"Error processing image {path}: {e}")
+                image_results.append({"filename": os.path.basename(path), "error": str(e)})
+
+    elements = [Paragraph(f'PROFILE ANALYSIS - AERB METHOD (Vendor: {vendor}, inverted={effective_invert})',
+                          styles['Title'])]
+    add_FAbatch_summary_to_pdf(elements, image_results)
+
+    for r in image_results:
+        elements.append(Paragraph(f"Image: {r['filename']}", styles['Heading2']))
+        if r.get("error"):
+            elements.append(Paragraph(f"Analysis failed: {r['error']}", styles['Normal']))
+            elements.append(Spacer(1, 12))
+            continue
+        for profile_type, points, results in r["profiles"]:
+            img_data = DeferredFigure(draw_profile_figure, points, results, profile_type, width=7 * inch, height=5 * inch)
+            add_FAresults_to_pdf(elements, results, profile_type, img_data, energy, depth)
+
+    rows = []
+    for r in image_results:
+        if r.get("error"):
+            rows.append({'filename': r['filename'], 'error': r['error']})
+            continue
+        rows.extend({'filename': r['filename'], 'profile': profile_type, **results}
+                    for profile_type, _, results in r["profiles"])
+    results = QAResults('fff-2d-batch', folder_or_glob, {'images': rows}, rows=rows, energy=energy, depth=depth,
+                        vendor=vendor, inverted=effective_invert)
+
+    log.info(f"FFF FA batch analysis completed for {len(file_paths)} images")
+    return ReportElements(elements, results)
@@ -4,15 +4,14 @@ from pylinac.metrics.profile import (
     SymmetryAreaMetric, SymmetryPointDifferenceQuotientMetric,
     FlatnessDifferenceMetric, FlatnessRatioMetric
 )
-import matplotlib.pyplot as plt
-from PIL import Image as PILImage
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import Paragraph, Spacer, Image
-from reportlab.lib.utils import ImageReader
-from io import BytesIO
+from reportlab.platypus import Paragraph, Spacer
 from logs.logger import setup_logger
+from Analysis.progress import notify
+from Analysis.results import QAResults, ReportElements, pylinac_results
+from Analysis.figures import DeferredFigure
 
 log = setup_logger("FieldAnalysis.py")
 
@@ -45,29 +44,16 @@ def add_fa_results_to_pdf(elements, field_analyzer, energy, depth):
     # Call plot_analyzed_images once to get all figures
     figures = field_analyzer.plot_analyzed_images(show=False)
     for fig in figures:
-        buf = BytesIO()
-
-        # Save figure to buffer
-        fig.savefig(buf, format='png')
-        buf.seek(0)
-
-        # Load buffer as PIL Image, then wrap in ImageReader for ReportLab
-        pil_image = PILImage.open(buf)
-        reportlab_image = ImageReader(pil_image)  # ImageReader keeps PIL image in memory
-
-        # Add the ReportLab-compatible image to the elements
-        analyzed_img = Image(reportlab_image, width=6 * inch, height=4 * inch)
-        elements.append(analyzed_img)
+        # Saved when the PDF is generated, at the report's quality
+        elements.append(DeferredFigure.from_figure(fig, width=6 * inch, height=4 * inch))
         elements.append(Spacer(1, 12))
 
-        # Close the buffer and figure to free resources
-        buf.close()
-        plt.close(fig)
-
 
-def process_FA(file_path, energy, depth):
+def process_FA(file_path, energy, depth, progress=None):
     log.info("Field Analysis started")
+    notify(progress, "Loading image", 0.05)
     field_analyzer = FieldProfileAnalysis(file_path)
+    notify(progress, "Analyzing field profiles", 0.2)
     field_analyzer.analyze(
         centering=Centering.BEAM_CENTER,
         x_width=0.02,
@@ -82,7 +68,9 @@ def process_FA(file_path, energy, depth):
         ),
     )
     print(field_analyzer.results())
-    elements = []
+    elements = ReportElements(results=QAResults('field-analysis', file_path, pylinac_results(field_analyzer),
+                                                energy=energy, depth=depth))
+    notify(progress, "Building report", 0.7)
     add_fa_results_to_pdf(elements, field_analyzer, energy, depth)
     log.info("Field Analysis and report generation completed")
     return elements
@@ -1,11 +1,12 @@
-from io import BytesIO
-import matplotlib.pyplot as plt
 from pylinac import LeedsTOR
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import Paragraph, Spacer, Image
+from reportlab.platypus import Paragraph, Spacer
 from logs.logger import setup_logger
+from Analysis.progress import notify
+from Analysis.results import QAResults, ReportElements, pylinac_results
+from Analysis.figures import DeferredFigure
 
 log = setup_logger("Leeds_TOR.py")
 
@@ -21,13 +22,16 @@ footer_style = ParagraphStyle('FooterStyle',
     textColor=colors.black
  )
 
-def process_leedsTOR(file_path):
+def process_leedsTOR(file_path, progress=None):
     log.info(f"LeedsTOR Analysis started..")
     try:
+        notify(progress, "Loading image", 0.05)
         let = LeedsTOR(file_path)
+        notify(progress, "Analyzing Leeds TOR", 0.2)
         let.analyze(low_contrast_threshold=0.01, high_contrast_threshold=0.5)
         print(let.results())
-        elements = []
+        elements = ReportElements(results=QAResults('leeds-tor', file_path, pylinac_results(let)))
+        notify(progress, "Building report", 0.7)
         add_let_results_to_pdf(elements, let)
     except Exception as e:
         log.error(f"Error found {e}")
@@ -43,26 +47,9 @@ def add_let_results_to_pdf(elements, let):
     for line in results_lines:
         elements.append(Paragraph(line, styles['Normal']))
 
-
-    buf = BytesIO()
-    let.plot_analyzed_image(show=False, image=True, low_contrast=False, high_contrast=False)
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    analyzed_img = Image(buf, width=4 * inch, height=4 * inch)
-    elements.append(analyzed_img)
-
-    buf = BytesIO()
-    let.plot_analyzed_image(show=False, image=False, low_contrast=True, high_contrast=False)
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    analyzed_img = Image(buf, width=4 * inch, height=4 * inch)
-    elements.append(analyzed_img)
-
-    buf = BytesIO()
-    let.plot_analyzed_image(show=False, image=False, low_contrast=False, high_contrast=True)
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    analyzed_img = Image(buf, width=4 * inch, height=4 * inch)
-    elements.append(analyzed_img)
+    # Image, low-contrast and high-contrast panels; drawn when the PDF is generated
+    for image, low_contrast, high_contrast in ((True, False, False), (False, True, False), (False, False, True)):
+        elements.append(DeferredFigure(let.plot_analyzed_image, show=False, image=image, low_contrast=low_contrast,
+                                       high_contrast=high_contrast, width=4 * inch, height=4 * inch))
 
 
@@ -1,16 +1,18 @@
 import os
-from io import BytesIO
-import matplotlib.pyplot as plt
-from pydicom import dcmread
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pylinac import PicketFence
 from pylinac.picketfence import MLC
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import Paragraph, Spacer, Image
+from reportlab.platypus import Paragraph, Spacer
 from reportlab.platypus import TableStyle
 
 from logs.logger import setup_logger
+from Analysis.progress import notify
+from Analysis.results import QAResults, ReportElements, pylinac_results
+from Analysis.figures import DeferredFigure, pyplot_figure
+from Analysis.dicom_headers import build_header_index, gantry_label
 
 log = setup_logger("Picketfence_batch.py")
 
@@ -25,10 +27,53 @@ footer_style = ParagraphStyle('FooterStyle',
     parent=styles['Normal'],
     textColor=colors.black
  )
-def analyze_picketfence_multiple(image_folder, tolerance, action_level, mlc_type, separate_leaves=False, nominal_gap=None):
+# Upper bound on worker processes; each holds a full EPID image and its pylinac analysis in memory
+MAX_PF_WORKERS = 4
+
+
+def analyze_picketfence_file(header, tolerance, action_level, mlc_type, separate_leaves=False, nominal_gap=None):
+    """
+    Batch worker: analyse one Picket Fence image and return its summary row with its figures.
+    header is the file's entry from build_header_index, so the gantry angle needs no second read.
+    Runs in a child process, so the row holds only numbers, text and the drawn (not yet saved)
+    matplotlib figures: never the PicketFence itself, which cannot be pickled back.
+    """
+    analyze_kwargs = {
+        'tolerance': tolerance,
+        'action_tolerance': action_level,
+        'separate_leaves': separate_leaves,
+        'nominal_gap_mm': nominal_gap if separate_leaves else None,
+    }
+    pf = PicketFence(header["path"], mlc=MLC[mlc_type])
+    pf.analyze(**analyze_kwargs)
+
+    gantry = header["GantryAngle"]
+    return {
+        "filename": header["filename"],
+        "gantry": gantry,
+        "gantry_str": gantry_label(gantry),
+        "max_error": pf.max_error,
+        "max_leaf": pf.max_error_leaf,
+        "max_picket": pf.max_error_picket,
+        "results": pf.results(),
+        "pylinac_results": pylinac_results(pf),
+        "image_figure": pyplot_figure(pf.plot_analyzed_image, show=False),
+        "histogram_figure": pyplot_figure(pf.plot_histogram, show=False),
+    }
+
+
+def analyze_picketfence_multiple(image_folder, tolerance, action_level, mlc_type, separate_leaves=False, nominal_gap=None,
+                                 progress=None, max_workers=None):
+    """
+    Picket Fence analysis of every .dcm image in a folder.
+    Headers are indexed first (no pixel data) to order the images by gantry angle; the images are then
+    analysed, and their figures drawn, across a process pool of max_workers (default: CPU count, at
+    most MAX_PF_WORKERS; 1 analyses them here one after the other), with rows in gantry order.
+    The figures are saved at the report's quality when the PDF is generated.
+    """
     log.info(f"Picket Fence multiple images analysis started")
     image_results = []
-    elements = []
+    elements = ReportElements()
     try:
         # Convert nominal_gap to float if separate_leaves is True
         if separate_leaves:
@@ -38,32 +83,33 @@ def analyze_picketfence_multiple(image_folder, tolerance, action_level, mlc_type
                 print("Error: Nominal gap must be a valid number.")
                 return []
 
-        for file in sorted(os.listdir(image_folder)):
-            if file.lower().endswith(".dcm"):
-                filepath = os.path.join(image_folder, file)
-                pf = PicketFence(filepath, mlc=MLC[mlc_type])
-                pf.analyze(
-                    tolerance=tolerance,
-                    action_tolerance=action_level,
-                    separate_leaves=separate_leaves,
-                    nominal_gap_mm=nominal_gap if separate_leaves else None
-                )
-
-                # Extract DICOM metadata
-                ds = dcmread(filepath)
-                gantry = getattr(ds, "GantryAngle", "N/A")
-                gantry_str = str(int(round(gantry))) if isinstance(gantry, (int, float)) else str(gantry)
-
-                # Save for summary
-                image_results.append({
-                    "filename": file,
-                    "gantry": gantry,
-                    "gantry_str": gantry_str,
-                    "max_error": pf.max_error,
-                    "max_leaf": pf.max_error_leaf,
-                    "max_picket": pf.max_error_picket,
-                    "pf": pf  # Save reference for plotting later
-                })
+        notify(progress, "Reading DICOM headers", 0.0)
+        headers = build_header_index(image_folder)
+        max_workers = max(1, min(max_workers or os.cpu_count() or 1, MAX_PF_WORKERS, len(headers)))
+        args = (tolerance, action_level, mlc_type, separate_leaves, nominal_gap)
+
+        if max_workers == 1:
+            for i, header in enumerate(headers):
+                notify(progress, f"Analyzing {header['filename']}", 0.7 * i / len(headers))
+                image_results.append(analyze_picketfence_file(header, *args))
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                # Submitted in gantry order; results are put back in that order below
+                futures = {executor.submit(analyze_picketfence_file, header, *args): i
+                           for i, header in enumerate(headers)}
+                results_by_index = {}
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        results_by_index[i] = future.result()
+                    except Exception as e:
+                        # Retry here so a worker-only failure does not lose the image; a genuine analysis
+                        # error is raised again by the retry
+                        log.warning(f"Worker failed for {headers[i]['path']} ({e}); analysing it in the main process")
+                        results_by_index[i] = analyze_picketfence_file(headers[i], *args)
+                    notify(progress, f"Analyzed {headers[i]['filename']}",
+                           0.7 * len(results_by_index) / len(headers))
+            image_results = [results_by_index[i] for i in range(len(headers))]
     except Exception as e:
         log.error(f"Error found {e}")
         raise
@@ -85,29 +131,26 @@ def analyze_picketfence_multiple(image_folder, tolerance, action_level, mlc_type
     elements.append(Spacer(1, 12))
 
     # Add detailed result for each
-    for r in image_results:
+    for i, r in enumerate(image_results):
+        notify(progress, f"Building report for {r['filename']}", 0.7 + 0.3 * i / len(image_results))
         elements.append(Paragraph(f"Image: {r['filename']} (Gantry: {r['gantry_str']}°)", styles['Heading3']))
-        results_lines = r['pf'].results().split('\n')
+        results_lines = r['results'].split('\n')
         for line in results_lines:
             elements.append(Paragraph(line, styles['Normal']))
         elements.append(Spacer(1, 3))
 
-        # Plot image
-        buf_img = BytesIO()
-        r['pf'].plot_analyzed_image(show=False)
-        plt.savefig(buf_img, format='png')
-        buf_img.seek(0)
-        elements.append(Image(buf_img, width=5*inch, height=3*inch))
-        plt.close()
-
-        # Plot histogram
-        buf_hist = BytesIO()
-        r['pf'].plot_histogram(show=False)
-        plt.savefig(buf_hist, format='png')
-        buf_hist.seek(0)
-        elements.append(Image(buf_hist, width=5*inch, height=3*inch))
-        plt.close()
+        # Image and histogram; saved when the PDF is generated
+        elements.append(DeferredFigure.from_figure(r['image_figure'], width=5*inch, height=3*inch))
+        elements.append(DeferredFigure.from_figure(r['histogram_figure'], width=5*inch, height=3*inch))
 
         elements.append(Spacer(1, 12))
+    summary_keys = ("filename", "gantry", "max_error", "max_leaf", "max_picket")
+    elements.results = QAResults(
+        'picket-fence-multiple', image_folder,
+        {"images": [{**{key: r[key] for key in summary_keys}, "results": r['pylinac_results']}
+                    for r in image_results]},
+        rows=[{key: r[key] for key in summary_keys} for r in image_results],
+        tolerance=tolerance, action_level=action_level, mlc_type=mlc_type,
+        separate_leaves=separate_leaves, nominal_gap=nominal_gap)
     log.info("Picket Fence multiple images Analysis Completed")
     return elements
@@ -1,11 +1,12 @@
-from io import BytesIO
-import matplotlib.pyplot as plt
 from pylinac import Starshot
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import Paragraph, Spacer, Image
+from reportlab.platypus import Paragraph, Spacer
 from logs.logger import setup_logger
+from Analysis.progress import notify
+from Analysis.results import QAResults, ReportElements, pylinac_results
+from Analysis.figures import DeferredFigure
 
 log = setup_logger("StarShot.py")
 
@@ -21,13 +22,16 @@ footer_style = ParagraphStyle('FooterStyle',
     textColor=colors.black
  )
 
-def process_starshot(file_path):
+def process_starshot(file_path, progress=None):
     log.info(f"StarShot Analysis started..")
     try:
+        notify(progress, "Loading image", 0.05)
         ss = Starshot(file_path)
+        notify(progress, "Analyzing starshot", 0.2)
         ss.analyze()
         print(ss.results())
-        elements = []
+        elements = ReportElements(results=QAResults('starshot', file_path, pylinac_results(ss)))
+        notify(progress, "Building report", 0.7)
         add_ss_results_to_pdf(elements, ss)
     except Exception as e:
         log.error(f"Error found {e}")
@@ -42,16 +46,6 @@ def add_ss_results_to_pdf(elements, ss):
     results_lines = ss.results().split('\n')
     for line in results_lines:
         elements.append(Paragraph(line, styles['Normal']))
-    buf = BytesIO()
-    ss.plot_analyzed_image(show=False, )
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    analyzed_img = Image(buf, width=6 * inch, height=4 * inch)
-    elements.append(analyzed_img)
-
-    buf_hist = BytesIO()
-    ss.plot_analyzed_subimage(show=False)
-    plt.savefig(buf_hist, format='png')
-    buf_hist.seek(0)
-    hist_img = Image(buf_hist, width=6 * inch, height=4 * inch)
-    elements.append(hist_img)
+    # Figures are drawn when the PDF is generated
+    elements.append(DeferredFigure(ss.plot_analyzed_image, show=False, width=6 * inch, height=4 * inch))
+    elements.append(DeferredFigure(ss.plot_analyzed_subimage, show=False, width=6 * inch, height=4 * inch))
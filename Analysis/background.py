@@ -0,0 +1,327 @@
+import importlib
+import multiprocessing
+import multiprocessing.util
+import os
+import pickle
+import queue
+import threading
+import time
+import weakref
+from logs.logger import setup_logger
+from Analysis.progress import AnalysisCancelled
+
+log = setup_logger("background.py")
+
+# Seconds a cancelled job gets to stop at its next stage boundary before it is terminated
+CANCEL_GRACE_S = 2.0
+
+# Jobs whose process is alive (running, or holding an analysis for its reports) are stopped when the GUI exits
+_running_jobs = weakref.WeakSet()
+
+# Imported by a standby process while it waits for a job: the slow part of starting any analysis
+PREWARM_MODULES = ('numpy', 'scipy.ndimage', 'matplotlib.pyplot', 'reportlab.platypus', 'pydicom', 'pylinac',
+                   'Analysis.runner', 'Analysis.figures', 'Analysis.results')
+
+# The warm process the next job will use (see prewarm), and whether to start another after each job
+_standby = None
+_keep_warm = False
+
+
+def _stop_when_cancelled(cancel_event, busy):
+    """
+    Child-side watchdog: if the analysis or report has not stopped within the grace period after a
+    cancel, terminate its own worker processes (e.g. a Picket Fence batch pool) and exit. The child
+    clears cancel_event once the step has stopped; a cancel that arrives while it is idle is dropped.
+    """
+    while True:
+        cancel_event.wait()
+        time.sleep(CANCEL_GRACE_S)
+        if not busy.is_set():
+            cancel_event.clear()
+        elif cancel_event.is_set():
+            for child in multiprocessing.active_children():
+                child.terminate()
+            os._exit(1)
+
+
+def _prewarm_imports(modules):
+    os.environ['MPLBACKEND'] = 'Agg'
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            log.warning(f"Pre-warm could not import {name}: {e}")
+
+
+def _run_standby(jobs, events, cancel_event, modules):
+    """Standby process target: import the analysis stack now, then run the one job it is given."""
+    _prewarm_imports(modules)
+    job = jobs.get()
+    if job is not None:
+        # The job's report commands come through the same queue
+        _run_in_child(*job[:3], events, cancel_event, jobs, *job[3:])
+
+
+class _Standby:
+    """A spawned process that has already imported PREWARM_MODULES and waits for one job."""
+
+    def __init__(self, modules=PREWARM_MODULES):
+        context = multiprocessing.get_context('spawn')
+        # The job, then that job's report commands
+        self.jobs = context.Queue()
+        self.events = context.Queue()
+        self.cancel_event = context.Event()
+        self.process = context.Process(target=_run_standby,
+                                       args=(self.jobs, self.events, self.cancel_event, tuple(modules)),
+                                       daemon=False)
+        self.process.start()
+
+    def stop(self):
+        # Idle, so nothing is lost; it may still be importing, which a clean shutdown would wait for
+        self.process.terminate()
+        self.process.join(timeout=1)
+
+
+def prewarm(enabled=True):
+    """
+    Keep one analysis process warm: it imports pylinac, matplotlib, reportlab, ... in the
+    background (e.g. while the user fills in the form), so the next BackgroundJob starts at once.
+    A new standby is started after each job until prewarm(False).
+    """
+    global _standby, _keep_warm
+    _keep_warm = enabled
+    if enabled and _standby is None:
+        _standby = _Standby()
+        log.info(f"Standby analysis process started (pid {_standby.process.pid})")
+    elif not enabled and _standby is not None:
+        _standby.stop()
+        _standby = None
+
+
+def _take_standby():
+    global _standby
+    standby, _standby = _standby, None
+    if standby is not None and not standby.process.is_alive():
+        return None
+    return standby
+
+
+def _run_in_child(analysis, input_path, params, events, cancel_event, commands, use_cache=True):
+    """
+    Child process target: run the analysis, then write its reports as commands ask, reporting
+    progress and results through the events queue. The report elements (which may hold pylinac
+    analysers) stay in this process, so their figures are only drawn when a report is written.
+    """
+    # Figures are rendered off-screen; the child never touches Tk
+    os.environ['MPLBACKEND'] = 'Agg'
+    from Analysis.runner import run_analysis
+    busy = threading.Event()
+    busy.set()
+    threading.Thread(target=_stop_when_cancelled, args=(cancel_event, busy), daemon=True).start()
+
+    def progress(stage, fraction):
+        if cancel_event.is_set():
+            raise AnalysisCancelled(stage)
+        events.put(('progress', stage, fraction))
+
+    cache = None
+    try:
+        if use_cache:
+            from Analysis.cache import AnalysisCache, renders_at
+            cache = AnalysisCache()
+        elements = run_analysis(analysis, input_path, progress=progress, cache=cache, **params)
+        # Pickle here rather than in the queue's feeder thread, where a failure would be lost
+        events.put(('done', pickle.dumps(getattr(elements, 'results', None))))
+    except AnalysisCancelled:
+        events.put(('cancelled',))
+        return
+    except Exception as e:
+        log.error(f"Background analysis failed: {analysis} on {input_path}: {e}", exc_info=True)
+        events.put(('error', str(e)))
+        return
+    finally:
+        busy.clear()
+        cancel_event.clear()
+
+    from Analysis.generatepdf import generate_pdf
+    while True:
+        command = commands.get()
+        if command is None:
+            return
+        report_fields, pdf_path, quality = command
+        busy.set()
+        try:
+            if cache is not None and not renders_at(elements, quality):
+                # Loaded from the cache at another quality: load (or redo) the analysis at this one
+                elements = run_analysis(analysis, input_path, progress=progress, cache=cache, quality=quality,
+                                        **params)
+            generate_pdf(elements, *report_fields, pdf_path, quality=quality, cache=cache, progress=progress)
+            events.put(('report', pdf_path))
+        except AnalysisCancelled:
+            events.put(('cancelled',))
+        except Exception as e:
+            log.error(f"Background report failed: {analysis} on {input_path}: {e}", exc_info=True)
+            events.put(('error', str(e)))
+        finally:
+            busy.clear()
+            cancel_event.clear()
+
+
+class BackgroundJob:
+    """
+    One analysis (see Analysis.runner.ANALYSES) running in a separate process so the GUI stays responsive.
+    Once the analysis is done its process keeps the report elements and writes PDF reports from them
+    on request (report()), until close(); figures are drawn there, when a report is written.
+    The GUI calls poll() from root.after(); cancel() stops the analysis or report being run, even inside
+    a long pylinac call. use_cache: load unchanged inputs from (and store built reports in) the analysis cache.
+    """
+
+    def __init__(self, analysis, input_path, params=None, use_cache=True):
+        self.analysis = analysis
+        self.input_path = input_path
+        self.params = params or {}
+        self.use_cache = use_cache
+        self._events = None
+        self._commands = None
+        self._cancel_event = None
+        self._process = None
+        self._cancel_deadline = None
+        # The analysis or a report is being run
+        self.running = False
+        # The analysis is done and its process holds the elements for reports
+        self.analysed = False
+        # The process has exited
+        self.finished = False
+
+    def start(self):
+        standby = _take_standby()
+        if standby is not None:
+            # Hand the job to the pre-warmed process (see prewarm)
+            self._events, self._cancel_event, self._process = standby.events, standby.cancel_event, standby.process
+            self._commands = standby.jobs
+            standby.jobs.put((self.analysis, self.input_path, self.params, self.use_cache))
+        else:
+            # 'spawn' keeps the child free of the parent's Tk state on every platform
+            context = multiprocessing.get_context('spawn')
+            self._events = context.Queue()
+            self._commands = context.Queue()
+            self._cancel_event = context.Event()
+            self._process = context.Process(
+                target=_run_in_child,
+                args=(self.analysis, self.input_path, self.params, self._events, self._cancel_event, self._commands,
+                      self.use_cache),
+                # Not daemonic: batch analyses start their own worker pools
+                daemon=False)
+            self._process.start()
+        self.running = True
+        _running_jobs.add(self)
+        log.info(f"Background job started: {self.analysis} on {self.input_path} (pid {self._process.pid})")
+        return self
+
+    def report(self, institution, department, linac_ID, measured_by, pdf_path, quality=None):
+        """
+        Write a PDF report of the analysis (see generatepdf.generate_pdf) in its process; poll() gives
+        progress and then ('report', pdf_path), ('error', message) or ('cancelled',).
+        """
+        if not self.can_report:
+            raise RuntimeError("No finished analysis to write a report from; run the analysis again")
+        self._commands.put(((institution, department, linac_ID, measured_by), pdf_path, quality))
+        self.running = True
+        self._cancel_deadline = None
+        log.info(f"Background report started: {self.analysis} -> {pdf_path}")
+
+    @property
+    def can_report(self):
+        return self.analysed and not self.running and not self.finished
+
+    def poll(self):
+        """
+        Return the events received since the last call, without blocking:
+        ('progress', stage, fraction), ('done', QAResults or None) when the analysis is done,
+        ('report', pdf_path) when a report is written, ('error', message) or ('cancelled',).
+        """
+        events = []
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == 'done':
+                event = ('done', pickle.loads(event[1]))
+            events.append(event)
+            if event[0] != 'progress':
+                self._step_finished(event[0])
+
+        if self.running and self._cancel_deadline is not None:
+            # Neither the step nor the child's watchdog has stopped it: terminate the process
+            if self._process.is_alive() and time.monotonic() >= self._cancel_deadline + CANCEL_GRACE_S:
+                self._process.terminate()
+            if not self._process.is_alive():
+                events.append(('cancelled',))
+                self._exited()
+        elif not self.finished and not self._process.is_alive():
+            # A child that exits normally has flushed its last event; give the pipe a moment
+            try:
+                event = self._events.get(timeout=0.5)
+                events.append(('done', pickle.loads(event[1])) if event[0] == 'done' else event)
+            except queue.Empty:
+                if self.running:
+                    events.append(('error', f"Analysis process exited unexpectedly (exit code {self._process.exitcode})"))
+            self._exited()
+        return events
+
+    def cancel(self):
+        """Ask the analysis or report to stop at its next stage; poll() terminates it if it has not stopped by the grace period."""
+        if not self.running:
+            return
+        log.info(f"Background job cancel requested: {self.analysis} on {self.input_path}")
+        self._cancel_event.set()
+        self._cancel_deadline = time.monotonic() + CANCEL_GRACE_S
+
+    @property
+    def is_running(self):
+        return self.running
+
+    def close(self):
+        """End the job's process, cancelling what it is running; its analysis can then write no more reports."""
+        if self._process is None or self.finished:
+            return
+        if self.running:
+            self.cancel()
+        else:
+            self._commands.put(None)
+        self._process.join(timeout=2 * CANCEL_GRACE_S)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._exited()
+
+    def _step_finished(self, kind):
+        analysing = not self.analysed
+        self.running = False
+        self._cancel_deadline = None
+        if kind == 'done':
+            self.analysed = True
+        elif analysing:
+            # A failed or cancelled analysis ends its process
+            self._exited()
+        if analysing and _keep_warm:
+            prewarm()
+
+    def _exited(self):
+        self.running = False
+        self.finished = True
+        self._process.join(timeout=1)
+        _running_jobs.discard(self)
+        if _keep_warm:
+            prewarm()
+
+
+def _stop_running_jobs():
+    prewarm(False)
+    for job in list(_running_jobs):
+        job.close()
+
+
+# Run from multiprocessing's exit handler before it waits for non-daemonic children (the jobs
+# and the standby would otherwise keep the GUI from exiting); a plain atexit hook may run too late
+multiprocessing.util.Finalize(None, _stop_running_jobs, exitpriority=10)
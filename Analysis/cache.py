@@ -0,0 +1,184 @@
+import glob
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from importlib import metadata
+from logs.logger import setup_logger
+from Analysis.figures import DeferredFigure, resolve_quality
+from Analysis.results import ReportElements, to_jsonable
+
+log = setup_logger("cache.py")
+
+# Bump when the analyses change what they return, so older entries are never reused
+CACHE_VERSION = 2
+
+DEFAULT_CACHE_DIR = os.path.join(os.getenv("LOCALAPPDATA") or os.path.expanduser("~"), "pyRTQA", "cache")
+DEFAULT_CACHE_MB = 1024
+
+# Parameters that change how an analysis runs but not what it returns
+UNKEYED_PARAMS = ('progress', 'max_workers')
+
+# Libraries whose version is part of every key: a new pylinac may measure differently
+KEYED_LIBRARIES = ('pylinac', 'pydicom', 'numpy', 'scipy')
+
+_HASH_CHUNK = 1 << 20
+
+
+def _library_versions():
+    versions = {}
+    for name in KEYED_LIBRARIES:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def input_files(input_path):
+    """The files an analysis reads: the file itself, every file under a folder, or the matches of a glob pattern."""
+    if os.path.isfile(input_path):
+        return [input_path]
+    if os.path.isdir(input_path):
+        return sorted(os.path.join(root, name) for root, _, names in os.walk(input_path) for name in names)
+    return sorted(path for path in glob.glob(input_path) if os.path.isfile(path))
+
+
+def hash_inputs(input_path, digest):
+    """Feed the names (relative to the input) and bytes of every input file into digest."""
+    base = input_path if os.path.isdir(input_path) else os.path.dirname(input_path)
+    for path in input_files(input_path):
+        digest.update(os.path.relpath(path, base).encode('utf-8') + b'\0')
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+                digest.update(chunk)
+        digest.update(b'\0')
+
+
+def stored_elements(elements):
+    """
+    The picklable form of a built report: its QAResults and flowables, with each figure reduced to
+    its rendered data (DeferredFigure.stored), dropping the plotting calls that hold analysers.
+    None if a figure has not been rendered yet.
+    """
+    stored = ReportElements(results=getattr(elements, 'results', None))
+    stored.cache_key = getattr(elements, 'cache_key', None)
+    for element in elements:
+        if isinstance(element, DeferredFigure):
+            element = element.stored()
+            if element is None:
+                return None
+        stored.append(element)
+    return stored
+
+
+def renders_at(elements, quality=None):
+    """
+    Whether every figure of elements can be drawn at a report quality: live figures always can, those
+    of a cached report only at the quality it was built at.
+    """
+    fmt, dpi = resolve_quality(quality)
+    return all(element.can_render(fmt, dpi) for element in elements if isinstance(element, DeferredFigure))
+
+
+class AnalysisCache:
+    """
+    Disk cache of built reports: the structured results, flowables and rendered figure data of an
+    analysis (see stored_elements), keyed by a hash of the input file bytes, the analysis and its
+    parameters, and by the report quality the figures were rendered at: a report at another quality
+    is a miss. Entries are evicted least recently used first once the cache is over max_mb.
+    """
+
+    def __init__(self, directory=None, max_mb=DEFAULT_CACHE_MB):
+        self.directory = directory or DEFAULT_CACHE_DIR
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, analysis, input_path, params):
+        """Content hash of the inputs plus everything that affects the result."""
+        digest = hashlib.sha256()
+        keyed_params = {name: value for name, value in params.items() if name not in UNKEYED_PARAMS}
+        digest.update(json.dumps({'version': CACHE_VERSION, 'analysis': analysis, 'params': to_jsonable(keyed_params),
+                                  'libraries': _library_versions()}, sort_keys=True).encode('utf-8'))
+        hash_inputs(input_path, digest)
+        return digest.hexdigest()
+
+    def _path(self, key, quality=None):
+        fmt, dpi = resolve_quality(quality)
+        return os.path.join(self.directory, f"{key}.{fmt}{dpi or ''}.pkl")
+
+    def get(self, key, quality=None):
+        """The elements cached for key with figures at quality (see figures.REPORT_QUALITIES), or None."""
+        path = self._path(key, quality)
+        try:
+            with open(path, 'rb') as f:
+                elements = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.warning(f"Discarding unreadable cache entry {path}: {e}")
+            self._remove(path)
+            return None
+        # Reading counts as use for LRU eviction
+        os.utime(path)
+        log.info(f"Analysis cache hit: {key}")
+        return elements
+
+    def put(self, key, elements, quality=None):
+        """
+        Store a report built at quality under key (replacing any earlier entry); returns False if a
+        figure has not been rendered (see generatepdf.generate_pdf's cache) or the report cannot be pickled.
+        """
+        stored = stored_elements(elements)
+        if stored is None:
+            log.info("Analysis output not cached, its figures are not rendered")
+            return False
+        try:
+            payload = pickle.dumps(stored, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            log.info(f"Analysis output not cached, it cannot be pickled: {e}")
+            return False
+        # Write then rename, so a reader (or a parallel job) never sees half an entry
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, self._path(key, quality))
+        except OSError as e:
+            log.warning(f"Could not write analysis cache entry {key}: {e}")
+            return False
+        self.evict()
+        return True
+
+    def update(self, elements, quality=None):
+        """Store a report built at quality under the key run_analysis gave it (elements.cache_key), if any."""
+        key = getattr(elements, 'cache_key', None)
+        return key is not None and self.put(key, elements, quality)
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pkl'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+            log.info(f"Evicted analysis cache entry {os.path.basename(path)}")
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(('.pkl', '.tmp')):
+                self._remove(entry.path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,20 +1,19 @@
-import logging
 from logs.logger import setup_logger
+from Analysis.progress import notify
+from Analysis.results import QAResults, ReportElements, pylinac_results
 
 log = setup_logger("catphantom.py")
 
 from pylinac import CatPhan503, CatPhan504, CatPhan600, CatPhan604
-from io import BytesIO
-import matplotlib.pyplot as plt
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib.units import inch
-from reportlab.platypus import Paragraph, Spacer, Image
+from reportlab.platypus import Paragraph, Spacer
+from Analysis.figures import DeferredFigure
 
 styles = getSampleStyleSheet()
 
 
-def process_catphantom(file_path, phantom_type):
+def process_catphantom(file_path, phantom_type, progress=None):
     log.info(f"Processing CatPhantom: {phantom_type} from {file_path}")
 
     # Map the string from combobox to the correct pylinac class
@@ -30,8 +29,10 @@ def process_catphantom(file_path, phantom_type):
         raise ValueError(f"Invalid phantom type: {phantom_type}")
 
     phantom_class = phantom_classes[phantom_type]
+    notify(progress, "Loading CBCT images", 0.05)
     my_cbct = phantom_class(file_path)
     # my_cbct.hu_origin_slice_variance = 670
+    notify(progress, "Analyzing CatPhan modules", 0.3)
     my_cbct.analyze()
 
     log.info("CatPhantom analysis completed.")
@@ -39,7 +40,9 @@ def process_catphantom(file_path, phantom_type):
     cp_results = my_cbct.results()
     # log.info(f"Analysis Results: {cp_results}")
 
-    elements = []
+    elements = ReportElements(results=QAResults('catphantom', file_path, pylinac_results(my_cbct),
+                                                phantom_type=phantom_type))
+    notify(progress, "Building report", 0.7)
     add_cp_results_to_pdf(elements, my_cbct, cp_results)
 
     return elements
@@ -59,13 +62,10 @@ def add_cp_results_to_pdf(elements, my_cbct, cp_results):
 
     subimages = ['hu', 'un', 'sp', 'lc', 'mtf', 'lin', 'prof', 'side']
 
+    # Subimages are drawn when the PDF is generated
     for sub in subimages:
-        buf = BytesIO()
-        my_cbct.plot_analyzed_subimage(subimage=sub, show=False)
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        analyzed_img = Image(buf, width=6 * inch, height=3 * inch)
-        elements.append(analyzed_img)
+        elements.append(DeferredFigure(my_cbct.plot_analyzed_subimage, subimage=sub, show=False,
+                                       width=6 * inch, height=3 * inch))
         elements.append(Spacer(1, 12))
 
     log.info("PDF report generation completed.")
@@ -0,0 +1,139 @@
+import os
+from datetime import datetime
+import numpy as np
+import pydicom
+from pydicom.errors import InvalidDicomError
+from pydicom.uid import ExplicitVRBigEndian, ExplicitVRLittleEndian, ImplicitVRLittleEndian
+from logs.logger import setup_logger
+
+log = setup_logger("dicom_headers.py")
+
+# Header attributes kept in the index; nothing after them (PixelData) is read
+HEADER_TAGS = (
+    'Modality', 'SOPClassUID', 'SOPInstanceUID', 'SeriesInstanceUID', 'StudyInstanceUID',
+    'GantryAngle', 'BeamLimitingDeviceAngle', 'PatientSupportAngle',
+    'RTImageLabel', 'RTImageDescription', 'SeriesDescription', 'InstanceNumber',
+    'Rows', 'Columns', 'KVP',
+    'AcquisitionDate', 'AcquisitionTime', 'ContentDate', 'ContentTime',
+    'StationName', 'RadiationMachineName',
+)
+
+
+def read_header(file_path):
+    """
+    Read the index attributes of one DICOM file without touching its pixel data.
+    Returns a dict with 'path', 'filename' and one key per HEADER_TAGS entry (None when absent).
+    """
+    ds = pydicom.dcmread(file_path, stop_before_pixels=True, specific_tags=list(HEADER_TAGS))
+    return header_from_dataset(ds, file_path)
+
+
+def header_from_dataset(ds, file_path):
+    """Index entry for a dataset already in memory (e.g. received over the network), to be stored at file_path."""
+    header = {'path': file_path, 'filename': os.path.basename(file_path)}
+    for tag in HEADER_TAGS:
+        value = getattr(ds, tag, None)
+        # DS/IS values become plain numbers so the index is easy to sort and serialise
+        if isinstance(value, (int, float)):
+            value = float(value) if isinstance(value, float) else int(value)
+        header[tag] = value
+    return header
+
+
+# Transfer syntaxes whose PixelData is stored as plain pixel values in the file
+RAW_PIXEL_TRANSFER_SYNTAXES = (ImplicitVRLittleEndian, ExplicitVRLittleEndian, ExplicitVRBigEndian)
+
+
+def memmap_dicom_pixels(file_path):
+    """
+    Memory-map the pixel data of an uncompressed, single-frame, greyscale DICOM.
+    Returns a read-only np.memmap of shape (Rows, Columns), or None when the file
+    has to be decoded by pydicom instead (compressed, deflated, multi-frame, colour, ...).
+    """
+    with open(file_path, 'rb') as f:
+        # Reading stops at the PixelData element, leaving the file positioned at its header
+        dataset = pydicom.dcmread(f, stop_before_pixels=True)
+        element_start = f.tell()
+        element_header = f.read(12)
+    transfer_syntax = getattr(getattr(dataset, 'file_meta', None), 'TransferSyntaxUID', None)
+    # Deflated and encapsulated pixel data are not stored as raw pixels at their file offset
+    if transfer_syntax not in RAW_PIXEL_TRANSFER_SYNTAXES or len(element_header) < 12:
+        return None
+    if int(getattr(dataset, 'NumberOfFrames', 1) or 1) != 1 or int(dataset.get('SamplesPerPixel', 1)) != 1:
+        return None
+
+    bits_allocated = int(dataset.get('BitsAllocated', 0))
+    signed = int(dataset.get('PixelRepresentation', 0)) == 1
+    bits_stored = int(dataset.get('BitsStored', bits_allocated))
+    # Signed data with unused high bits needs pydicom's sign correction
+    if bits_allocated not in (8, 16, 32) or (signed and bits_stored < bits_allocated):
+        return None
+
+    byte_order = '<' if transfer_syntax != ExplicitVRBigEndian else '>'
+    group, element = np.frombuffer(element_header[:4], dtype=f'{byte_order}u2')
+    if (group, element) != (0x7FE0, 0x0010):
+        return None
+    if transfer_syntax == ImplicitVRLittleEndian:
+        length, offset = np.frombuffer(element_header[4:8], dtype='<u4')[0], element_start + 8
+    else:
+        # Explicit VR OB/OW: tag, VR, two reserved bytes, 4-byte length
+        length, offset = np.frombuffer(element_header[8:12], dtype=f'{byte_order}u4')[0], element_start + 12
+    rows, columns = int(dataset.Rows), int(dataset.Columns)
+    # Undefined length is encapsulated data; anything shorter than a frame is not raw pixels either
+    if length == 0xFFFFFFFF or length < rows * columns * bits_allocated // 8:
+        return None
+
+    dtype = np.dtype(f"{'i' if signed else 'u'}{bits_allocated // 8}").newbyteorder(byte_order)
+    return np.memmap(file_path, dtype=dtype, mode='r', offset=offset, shape=(rows, columns))
+
+
+def acquisition_datetime(header):
+    """When the image was acquired (Acquisition, else Content date/time), or None."""
+    for date_tag, time_tag in (('AcquisitionDate', 'AcquisitionTime'), ('ContentDate', 'ContentTime')):
+        day = header.get(date_tag)
+        if day:
+            clock = (str(header.get(time_tag) or '') + '000000')[:6]
+            try:
+                return datetime.strptime(f"{day}{clock}", '%Y%m%d%H%M%S')
+            except ValueError:
+                continue
+    return None
+
+
+def machine_name(header):
+    """The treatment machine (RadiationMachineName, else the imaging StationName), or None."""
+    return header.get('RadiationMachineName') or header.get('StationName') or None
+
+
+def gantry_label(gantry):
+    """Gantry angle as shown in reports: nearest whole degree, or 'N/A'."""
+    return str(int(round(gantry))) if isinstance(gantry, (int, float)) else "N/A"
+
+
+def gantry_sort_key(header):
+    """Order by gantry angle; files without one go last, by filename."""
+    gantry = header.get('GantryAngle')
+    if isinstance(gantry, (int, float)):
+        return 0, float(gantry), header['filename']
+    return 1, 0.0, header['filename']
+
+
+def build_header_index(folder, extensions=('.dcm',)):
+    """
+    Header index of every DICOM file in a folder, sorted by gantry angle.
+    Files whose header cannot be read stay in the index (GantryAngle None) so the
+    analysis still reports them; the error is logged.
+    """
+    index = []
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith(extensions):
+            continue
+        path = os.path.join(folder, name)
+        try:
+            index.append(read_header(path))
+        except (InvalidDicomError, OSError) as e:
+            log.warning(f"Could not read DICOM header of {path}: {e}")
+            index.append({'path': path, 'filename': name, **{tag: None for tag in HEADER_TAGS}})
+    index.sort(key=gantry_sort_key)
+    return index
+
@@ -1,14 +1,16 @@
-import io
-from decimal import Decimal, getcontext
-from tkinter import messagebox
-import matplotlib.pyplot as plt
-import pandas as pd
+from decimal import getcontext
+from matplotlib.figure import Figure
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.platypus import Paragraph, Spacer, Image, Table, TableStyle
-import logging
 from logs.logger import setup_logger
+from Analysis.progress import notify
+from Analysis.results import QAResults, ReportElements
+from Analysis.figures import DeferredFigure, render_figure
+from Analysis import profile_engine
+from Analysis.profile_engine import points_to_arrays
+from Analysis.rfa_readers import read_profile_arrays, parse_profile_label
 
 log = setup_logger("fffanalysis.py")
 
@@ -27,11 +29,6 @@ footer_style = ParagraphStyle('FooterStyle',
 getcontext().prec = 2
 
 class PointXY:
-    maxSlope = float('-inf')
-    minSlope = float('inf')
-    Y1 = 0
-    Y2 = 0
-
     def __init__(self, index, x, y):
         self.index = index
         self.x = x
@@ -42,145 +39,55 @@ class PointXY:
         dy = p.y - self.y
         dx = p.x - self.x
         self.slope = dy / dx if dx != 0 else float('inf')
-        if self.slope > PointXY.maxSlope:
-            PointXY.maxSlope = self.slope
-            PointXY.Y1 = self.y
-        if self.slope < PointXY.minSlope:
-            PointXY.minSlope = self.slope
-            PointXY.Y2 = self.y
 
 class Process:
     @staticmethod
-    def calculate(points):
-        for i in range(len(points) - 1):
-            points[i].calcSlope(points[i + 1])
-
-        max_slope = Decimal(PointXY.maxSlope)
-        min_slope = Decimal(PointXY.minSlope)
-
-        RDV = (PointXY.Y1 + PointXY.Y2) / 2
-        upperY = RDV * 1.6
-        lowerY = RDV * 0.4
-
-        negUpperX = Process.predictX(upperY, points, -1)
-        posUpperX = Process.predictX(upperY, points, 1)
-
-        negLowerX = Process.predictX(lowerY, points, -1)
-        posLowerX = Process.predictX(lowerY, points, 1)
-
-        deltaNegativeX = abs(negLowerX - negUpperX)
-        deltaPositiveX = abs(posLowerX - posUpperX)
-
-        negAvgX = Process.predictX(RDV, points, -1)
-        posAvgX = Process.predictX(RDV, points, 1)
-        diffAvgX = posAvgX - negAvgX
-
-        negX90Y = Process.predictX(90, points, -1)
-        posX90Y = Process.predictX(90, points, 1)
-        diffX90Y = posX90Y - negX90Y
-
-        negX75Y = Process.predictX(75, points, -1)
-        posX75Y = Process.predictX(75, points, 1)
-        diffX75Y = posX75Y - negX75Y
-
-        negX60Y = Process.predictX(60, points, -1)
-        posX60Y = Process.predictX(60, points, 1)
-        diffX60Y = posX60Y - negX60Y
-
-        results = {
-            'max_slope': max_slope,
-            'min_slope': min_slope,
-            'RDV': RDV,
-            'PLu': negUpperX,
-            'PLd': negLowerX,
-            'Penumbra_Left(mm)': deltaNegativeX * 10,
-            'PRu': posUpperX,
-            'PRd': posLowerX,
-            'Penumbra_Right(mm)': deltaPositiveX * 10,
-            'IPL': negAvgX,
-            'IPR': posAvgX,
-            'Field size(mm)': diffAvgX * 10,
-            '90-': negX90Y,
-            '90+': posX90Y,
-            'X90%': diffX90Y,
-            '75-': negX75Y,
-            '75+': posX75Y,
-            'X75%': diffX75Y,
-            '60-': negX60Y,
-            '60+': posX60Y,
-            'X60%': diffX60Y
-        }
-
-        for key, value in results.items():
-            print(f"{key} = {value:.2f}")
+    def calculate(points, interpolate=True):
+        x, dose = points_to_arrays(points)
+        results = profile_engine.calculate(x, dose, interpolate=interpolate)
 
+        log.debug(", ".join(f"{key} = {value:.2f}" for key, value in results.items()))
         return results
 
     @staticmethod
-    def predictX(y, points, isNeg):
-        minDiffWithY = float('inf')
-        predictedX = float('inf')
-
-        for p in points:
-            diffWithY = abs(p.y - y)
-            if diffWithY < minDiffWithY and (p.x * isNeg) > 0:
-                minDiffWithY = diffWithY
-                predictedX = p.x
+    def calculate_many(point_lists, interpolate=True):
+        """Analyse several profiles (e.g. Inline and Crossline) in parallel; results keep input order."""
+        all_results = profile_engine.calculate_many([points_to_arrays(points) for points in point_lists],
+                                                    interpolate=interpolate)
+        for results in all_results:
+            log.debug(", ".join(f"{key} = {value:.2f}" for key, value in results.items()))
+        return all_results
 
-        return predictedX
+    @staticmethod
+    def predictX(y, points, isNeg):
+        x, dose = points_to_arrays(points)
+        return float(profile_engine.predict_x(y, x, dose, isNeg)[0])
 
 def read_excel_to_points(file_path):
-    xl = pd.ExcelFile(file_path)
-
-    required_sheets = ['Inline', 'Crossline']
-    required_columns = {
-        'Inline': ['Inline(cm)', 'Inline(mm)'],
-        'Crossline': ['Crossline(cm)', 'Crossline(mm)']
-    }
-
+    profiles = read_profile_arrays(file_path)
     points1, points2 = None, None
 
-    # Check for required sheets
-    for sheet in required_sheets:
-        if sheet not in xl.sheet_names:
-            raise ValueError(f"Required sheet '{sheet}' not found in the Excel file.")
-
-    # Process Inline sheet
-    points_sheet1 = xl.parse('Inline')
-    if 'Inline(cm)' in points_sheet1.columns:
-        points1 = [PointXY(index, row['Inline(cm)'], row['Dose(%)']) for index, row in points_sheet1.iterrows()]
-    elif 'Inline(mm)' in points_sheet1.columns:
-        points1 = [PointXY(index, row['Inline(mm)'] / 10.0, row['Dose(%)']) for index, row in points_sheet1.iterrows()]
-    else:
-        raise ValueError("Required columns 'Inline(cm)' or 'Inline(mm)' not found in the 'Inline' sheet.")
-
-    # Process Crossline sheet
-    points_sheet2 = xl.parse('Crossline')
-    if 'Crossline(cm)' in points_sheet2.columns:
-        points2 = [PointXY(index, row['Crossline(cm)'], row['Dose(%)']) for index, row in points_sheet2.iterrows()]
-    elif 'Crossline(mm)' in points_sheet2.columns:
-        points2 = [PointXY(index, row['Crossline(mm)'] / 10.0, row['Dose(%)']) for index, row in
-                   points_sheet2.iterrows()]
-    else:
-        raise ValueError("Required columns 'Crossline(cm)' or 'Crossline(mm)' not found in the 'Crossline' sheet.")
+    if 'Inline' in profiles:
+        points1 = [PointXY(i, x, y) for i, (x, y) in enumerate(zip(*(a.tolist() for a in profiles['Inline'])))]
+    if 'Crossline' in profiles:
+        points2 = [PointXY(i, x, y) for i, (x, y) in enumerate(zip(*(a.tolist() for a in profiles['Crossline'])))]
 
     return points1, points2
 
-def plot_to_image(points, results, profile_type):
-    x = [point.x for point in points]
-    y = [point.y for point in points]
+def draw_profile_figure(x, y, results, profile_type):
+    """Draw the profile with its AERB levels and penumbra points; returns the Figure."""
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
+    ax.plot(x, y, marker='o', linestyle='-', color='b', markersize=2)  # Thin points
 
-    plt.figure(figsize=(10, 6))
-    plt.plot(x, y, marker='o', linestyle='-', color='b', markersize=2)  # Thin points
+    ax.plot([results['90-'], results['90+']], [90, 90], 'm-', lw=1.5)
+    ax.plot([results['75-'], results['75+']], [75, 75], 'y-', lw=1.5)
+    ax.plot([results['60-'], results['60+']], [60, 60], 'k-', lw=1.5)
 
-    plt.plot([results['90-'], results['90+']], [90, 90], 'm-', lw=1.5)
-    plt.plot([results['75-'], results['75+']], [75, 75], 'y-', lw=1.5)
-    plt.plot([results['60-'], results['60+']], [60, 60], 'k-', lw=1.5)
+    ax.plot([results['PLu'], results['PRu']], [results['RDV'] * 1.6, results['RDV'] * 1.6], 'g-', lw=1.5)
+    ax.plot([results['PLd'], results['PRd']], [results['RDV'] * 0.4, results['RDV'] * 0.4], 'c-', lw=1.5)
 
-    plt.plot([results['PLu'], results['PRu']], [results['RDV'] * 1.6, results['RDV'] * 1.6], 'g-', lw=1.5)
-    plt.plot([results['PLd'], results['PRd']], [results['RDV'] * 0.4, results['RDV'] * 0.4], 'c-', lw=1.5)
-
-    plt.plot([results['IPL'], results['IPR']], [results['RDV'], results['RDV']], 'r-', lw=1.5)
+    ax.plot([results['IPL'], results['IPR']], [results['RDV'], results['RDV']], 'r-', lw=1.5)
 
     line_labels = {
         'RDV': ('r', results['RDV']),
@@ -192,7 +99,7 @@ def plot_to_image(points, results, profile_type):
     }
 
     for label, (color, y_value) in line_labels.items():
-        plt.text(0, y_value, label, color=color, ha='center', va='bottom', fontsize=10, weight='bold')
+        ax.text(0, y_value, label, color=color, ha='center', va='bottom', fontsize=10, weight='bold')
 
     point_labels = [
         ('PLu', results['PLu'], results['RDV'] * 1.6),
@@ -206,7 +113,7 @@ def plot_to_image(points, results, profile_type):
     offset = 1.2  # Offset for label positions
 
     for label, x_value, y_value in point_labels:
-        plt.scatter(x_value, y_value, color='red', s=20)  # Different color and size for scatter points
+        ax.scatter(x_value, y_value, color='red', s=20)  # Different color and size for scatter points
         if x_value < (max(x) + min(x)) / 2:
             ha = 'left'
             x_offset = -offset
@@ -214,27 +121,26 @@ def plot_to_image(points, results, profile_type):
             ha = 'right'
             x_offset = offset
         bbox_props = dict(boxstyle="round,pad=0.3", edgecolor="black", facecolor="white")
-        plt.text(x_value + x_offset, y_value, label, color='black', ha=ha, bbox=bbox_props)
+        ax.text(x_value + x_offset, y_value, label, color='black', ha=ha, bbox=bbox_props)
 
-    plt.xlabel('Field width (cm)', fontsize=12)
-    plt.ylabel('Dose (%)', fontsize=12)
+    ax.set_xlabel('Field width (cm)', fontsize=12)
+    ax.set_ylabel('Dose (%)', fontsize=12)
 
-    if profile_type == 'Inline':
-        plt.title('Beam Profile Inline', fontsize=14, fontweight='bold')
-    elif profile_type == 'Crossline':
-        plt.title('Beam Profile Crossline', fontsize=14, fontweight='bold')
+    if profile_type:
+        ax.set_title(f'Beam Profile {profile_type}', fontsize=14, fontweight='bold')
     else:
-        plt.title('Beam Profile', fontsize=14, fontweight='bold')
+        ax.set_title('Beam Profile', fontsize=14, fontweight='bold')
+
+    ax.grid(True, linestyle='--', alpha=0.7)
+    ax.set_facecolor('lightgrey')  # Background color for the graph
+
+    fig.tight_layout()
+    return fig
 
-    plt.grid(True, linestyle='--', alpha=0.7)
-    plt.gca().set_facecolor('lightgrey')  # Background color for the graph
 
-    plt.tight_layout()
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight')
-    buf.seek(0)
-    plt.close()
-    return buf
+def plot_to_image(x, y, results, profile_type):
+    """The profile plot as a PNG BytesIO."""
+    return render_figure(draw_profile_figure, x, y, results, profile_type)
 
 def add_fffresults_to_pdf(elements, results, profile_type, img_data, energy, depth):
     title = f'FFF Analysis Report - {profile_type}'
@@ -267,30 +173,69 @@ def add_fffresults_to_pdf(elements, results, profile_type, img_data, energy, dep
     elements.append(table)
     elements.append(Spacer(1, 12))
 
-    image = Image(img_data)
+    image = img_data if isinstance(img_data, DeferredFigure) else Image(img_data)
     image.drawHeight = 5 * inch
     image.drawWidth = 7 * inch
     elements.append(image)
     elements.append(Spacer(1, 12))
-def process_fff_analysis(file_path, energy, depth):
+def add_fffsummary_to_pdf(elements, summary_rows):
+    summary_keys = ['Field size(mm)', 'Penumbra_Left(mm)', 'Penumbra_Right(mm)', 'X90%', 'X75%', 'X60%']
+    data = [['Profile', 'Energy(MV)', 'Depth(cm)'] + summary_keys]
+    for profile_type, energy, depth, results in summary_rows:
+        data.append([profile_type, str(energy), str(depth)] + [f"{results[key]:.2f}" for key in summary_keys])
+
+    table = Table(data, repeatRows=1)
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('FONTSIZE', (0, 0), (-1, -1), 7),
+    ]))
+    elements.append(Paragraph("Summary of FFF Profile Results", styles['Heading2']))
+    elements.append(table)
+    elements.append(Spacer(1, 12))
+
+
+def process_fff_analysis(file_path, energy, depth, progress=None):
+    """
+    FFF profile analysis of an RFA export. Workbooks may hold many profile sheets
+    (several energies/depths); they are read in one pass, analysed in parallel and
+    reported together. Energy/depth found in a sheet or scan label override the
+    values entered by the user.
+    """
     log.info("FFF profile analysis started")
     try:
-        points1, points2 = read_excel_to_points(file_path)
+        notify(progress, "Reading profiles", 0.05)
+        profiles = read_profile_arrays(file_path)
     except ValueError as e:
         log.error(f"Profile analysis error:{e}")
-        messagebox.showerror("Error", str(e))
-        return []
-
-    elements = []
-    log.info("FFF profile analysis completed")
-    if points1:
-        results = Process.calculate(points1)
-        img_data = plot_to_image(points1, results, 'Inline')
-        add_fffresults_to_pdf(elements, results, 'Inline', img_data, energy, depth)
-
-    if points2:
-        results = Process.calculate(points2)
-        img_data = plot_to_image(points2, results, 'Crossline')
-        add_fffresults_to_pdf(elements, results, 'Crossline', img_data, energy, depth)
+        raise
+
+    elements = ReportElements()
+    log.info(f"FFF profile analysis completed for {len(profiles)} profiles")
+    # Profiles are independent, so analyse them side by side; plotting stays serial
+    notify(progress, "Analyzing profiles", 0.3)
+    all_results = profile_engine.calculate_many(profiles.values())
+
+    summary_rows = []
+    for profile_type, results in zip(profiles, all_results):
+        label = parse_profile_label(profile_type)
+        summary_rows.append((profile_type,
+                             label['energy'] if label['energy'] is not None else energy,
+                             label['depth'] if label['depth'] is not None else depth,
+                             results))
+
+    # A consolidated summary only adds value once there is more than the classic Inline/Crossline pair
+    if len(summary_rows) > 2:
+        add_fffsummary_to_pdf(elements, summary_rows)
+
+    for i, ((profile_type, profile_energy, profile_depth, results), (x, dose)) in enumerate(
+            zip(summary_rows, profiles.values())):
+        notify(progress, f"Building report for {profile_type}", 0.5 + 0.5 * i / len(summary_rows))
+        # The plot is drawn when the PDF is generated
+        img_data = DeferredFigure(draw_profile_figure, x, dose, results, profile_type, width=7 * inch, height=5 * inch)
+        add_fffresults_to_pdf(elements, results, profile_type, img_data, profile_energy, profile_depth)
+    rows = [{'profile': profile_type, 'energy': profile_energy, 'depth': profile_depth, **results}
+            for profile_type, profile_energy, profile_depth, results in summary_rows]
+    elements.results = QAResults('fff-rfa', file_path, {'profiles': rows}, rows=rows, energy=energy, depth=depth)
     log.info("Analysis report generation completed successfully")
-    return elements
\ No newline at end of file
+    return elements
@@ -0,0 +1,312 @@
+import copy
+import multiprocessing
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from reportlab.platypus import Flowable, Image
+from logs.logger import setup_logger
+
+log = setup_logger("figures.py")
+
+# Below this many figures a worker pool is never worth starting: the cheapest pooled figure (an FFF
+# profile plot) takes 0.16-0.29 s to draw and save, so even unlimited workers only win back POOL_START_S
+# from about 15-19 figures on
+MIN_PARALLEL_FIGURES = 16
+# Seconds a spawned render worker takes to start (it imports matplotlib and the analysis modules)
+POOL_START_S = 3.0
+
+# Report quality -> (figure format, raster DPI). None keeps matplotlib's default DPI.
+# 'vector' embeds SVG drawings (needs svglib) that stay sharp at any zoom.
+REPORT_QUALITIES = {
+    'draft': ('png', 60),
+    'standard': ('png', None),
+    'high': ('png', 200),
+    'vector': ('svg', None),
+}
+DEFAULT_QUALITY = 'standard'
+
+
+def resolve_quality(quality=None):
+    """(format, dpi) for a report quality; 'vector' falls back to 'high' when svglib is not installed."""
+    quality = quality or DEFAULT_QUALITY
+    if quality not in REPORT_QUALITIES:
+        raise ValueError(f"Unknown report quality '{quality}'. Choose from: {', '.join(REPORT_QUALITIES)}")
+    fmt, dpi = REPORT_QUALITIES[quality]
+    if fmt == 'svg':
+        try:
+            import svglib
+        except ImportError:
+            log.warning("svglib is not installed (pip install svglib); embedding high-resolution PNGs instead")
+            return REPORT_QUALITIES['high']
+    return fmt, dpi
+
+
+def render_figure(plot, *args, fmt='png', dpi=None, **kwargs):
+    """
+    Call a plotting function and return its figure as a BytesIO in fmt ('png' or 'svg').
+    plot may return a matplotlib Figure (object-oriented API, drawn with Agg) or nothing
+    (pylinac style), in which case the current pyplot figure is saved and closed.
+    """
+    result = plot(*args, **kwargs)
+    buf = BytesIO()
+    if isinstance(result, Figure):
+        result.savefig(buf, format=fmt, dpi=dpi or 'figure', bbox_inches='tight')
+        # pylinac helpers may return figures still open in pyplot; a no-op for the repo's own Figures
+        plt.close(result)
+    else:
+        fig = plt.gcf()
+        fig.savefig(buf, format=fmt, dpi=dpi or 'figure')
+        plt.close(fig)
+    buf.seek(0)
+    return buf
+
+
+def pyplot_figure(plot, *args, **kwargs):
+    """
+    Call a pyplot-style plotting function (e.g. a pylinac plot method, with show=False) and return the
+    figure it drew, closed in pyplot: it no longer counts as open and pickles (e.g. back from a worker).
+    """
+    plot(*args, **kwargs)
+    fig = plt.gcf()
+    plt.close(fig)
+    return fig
+
+
+def figure_flowable(data, width, height, fmt='png'):
+    """
+    Shared figure-to-flowable step: an Image for PNG data, a scaled vector Drawing for SVG.
+    The flowable fills width x height, like reportlab's Image.
+    """
+    if fmt == 'svg':
+        from svglib.svglib import svg2rlg
+        drawing = svg2rlg(data)
+        drawing.scale(width / drawing.width, height / drawing.height)
+        drawing.width, drawing.height = width, height
+        return drawing
+    return Image(data, width=width, height=height)
+
+
+def _existing_figure(fig):
+    return fig
+
+
+class DeferredFigure(Flowable):
+    """
+    Report placeholder for a figure that is only drawn when the PDF is built.
+    Holds the plotting call (function and arguments, e.g. an analyser's plot method) instead of
+    a rendered PNG, so an analysis returns as soon as its numbers are ready and a report that
+    is never exported costs no rendering. Sized like reportlab's Image (drawWidth/drawHeight).
+    rendered holds data per (format, dpi) only when asked to keep it (FigureRenderer(keep=True),
+    for the analysis cache) or for a stored copy (see stored), whose plotting call is dropped: a stored
+    copy can only be drawn at a (format, dpi) it holds.
+    """
+
+    def __init__(self, plot, *args, width, height, **kwargs):
+        Flowable.__init__(self)
+        self.plot = plot
+        self.args = args
+        self.kwargs = kwargs
+        self.drawWidth = width
+        self.drawHeight = height
+        self.rendered = {}
+
+    @classmethod
+    def from_figure(cls, fig, width, height):
+        """Wrap an already drawn Figure so it is still saved at the report's quality."""
+        # Drop it from pyplot's registry now; the Figure object itself can still be saved
+        plt.close(fig)
+        return cls(_existing_figure, fig, width=width, height=height)
+
+    def stored(self):
+        """A copy holding only the rendered data, e.g. for the analysis cache; None if nothing is rendered."""
+        if not self.rendered:
+            return None
+        figure = copy.copy(self)
+        figure.plot, figure.args, figure.kwargs = None, (), {}
+        figure.rendered = dict(self.rendered)
+        return figure
+
+    def can_render(self, fmt='png', dpi=None):
+        return self.plot is not None or (fmt, dpi) in self.rendered
+
+    def render(self, fmt='png', dpi=None):
+        """Return the figure data in fmt at dpi, rendering it now unless it is kept in rendered."""
+        if (fmt, dpi) in self.rendered:
+            return BytesIO(self.rendered[(fmt, dpi)])
+        if self.plot is None:
+            raise ValueError(f"This stored figure holds no {fmt} rendering at dpi {dpi or 'default'}")
+        return render_figure(self.plot, *self.args, fmt=fmt, dpi=dpi, **self.kwargs)
+
+    def to_flowable(self, data=None, fmt='png', dpi=None):
+        """The rendered flowable (data: an already rendered buffer in fmt at dpi)."""
+        if data is None:
+            data = self.render(fmt, dpi)
+        return figure_flowable(data, self.drawWidth, self.drawHeight, fmt)
+
+    def to_image(self, png=None):
+        """The rendered reportlab Image (png: an already rendered buffer)."""
+        return self.to_flowable(png)
+
+    def wrap(self, availWidth, availHeight):
+        return self.drawWidth, self.drawHeight
+
+    def draw(self):
+        # Only reached when a story was built without render_figures(); render in place
+        self.to_image().drawOn(self.canv, 0, 0)
+
+
+def _init_render_worker():
+    # Workers never show a window; pylinac's pyplot calls get a private Agg state per process
+    matplotlib.use('Agg')
+
+
+def _render_chunk(figures, fmt='png', dpi=None):
+    """Pool worker: render a run of DeferredFigures and return their bytes in order."""
+    return [figure.render(fmt, dpi).getvalue() for figure in figures]
+
+
+def _portable(figure):
+    """
+    Whether a figure is sent to a render worker: a deferred call of a plain function (e.g. an FFF profile
+    plot) whose arguments pickle. A bound method carries its analyser (a pylinac analyser does not pickle,
+    and may hold a whole CBCT volume); an already drawn figure (from_figure) is saved here, as pickling it
+    costs about as much as saving it (a Picket Fence image: 1.2 s against 0.75 s).
+    """
+    if figure.plot is _existing_figure or hasattr(figure.plot, '__self__'):
+        return False
+    try:
+        pickle.dumps(figure)
+    except Exception:
+        return False
+    return True
+
+
+def _chunks(items, count):
+    """Split items into count contiguous runs of near-equal length."""
+    size, extra = divmod(len(items), count)
+    start = 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        if end > start:
+            yield items[start:end]
+        start = end
+
+
+class FigureRenderer:
+    """
+    Renders DeferredFigures for one report at one quality. A process pool is started on first
+    need and reused for every later batch (e.g. each section of a streamed report).
+    Only deferred plain-function calls go to the pool (see _portable), in contiguous runs; the rest,
+    e.g. pylinac's CatPhan, Leeds TOR and Picket Fence figures, are drawn here. max_workers=1 renders
+    here serially. The pool is only used when it pays: one portable figure is timed here first, and the
+    rest go to the pool only if their estimated serial time exceeds the pool's start-up plus their
+    share per worker.
+    Rendered data is dropped once handed out, unless keep is set: it is then also left in each
+    figure's rendered, for the analysis cache (see release_renderings).
+    """
+
+    def __init__(self, max_workers=None, quality=None, keep=False):
+        self.fmt, self.dpi = resolve_quality(quality)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.keep = keep
+        self._executor = None
+
+    def render(self, figures):
+        """Rendered buffers for figures, in order. Data kept in a figure's rendered is reused."""
+        figures = list(figures)
+        # id(figure) -> data drawn ahead of handing it out (timed here, or by the pool)
+        drawn = {}
+        key = (self.fmt, self.dpi)
+        pending = [figure for figure in figures if key not in figure.rendered]
+        if self.max_workers > 1 and len(pending) >= MIN_PARALLEL_FIGURES:
+            portable = [figure for figure in pending if _portable(figure)]
+            if len(portable) >= MIN_PARALLEL_FIGURES:
+                start = time.perf_counter()
+                drawn[id(portable[0])] = portable[0].render(self.fmt, self.dpi).getvalue()
+                drawn.update(self._render_parallel_if_faster(portable[1:], time.perf_counter() - start))
+        buffers = []
+        for figure in figures:
+            data = drawn.get(id(figure))
+            buffer = BytesIO(data) if data is not None else figure.render(self.fmt, self.dpi)
+            if self.keep:
+                figure.rendered[key] = buffer.getvalue()
+            buffers.append(buffer)
+        return buffers
+
+    def _render_parallel_if_faster(self, figures, seconds_per_figure):
+        workers = min(self.max_workers, len(figures))
+        if workers < 2:
+            return {}
+        serial_s = seconds_per_figure * len(figures)
+        parallel_s = (POOL_START_S if self._executor is None else 0.0) + serial_s / workers
+        if parallel_s >= serial_s:
+            return {}
+        return self._render_parallel(figures, workers)
+
+    def _render_parallel(self, figures, workers):
+        """{id(figure): data} for figures rendered across the pool; empty if the pool failed."""
+        try:
+            if self._executor is None:
+                # 'spawn' so a pool started from the GUI never inherits Tk state
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_render_worker,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            chunks = list(_chunks(figures, workers))
+            results = self._executor.map(_render_chunk, chunks, [self.fmt] * len(chunks), [self.dpi] * len(chunks))
+            rendered = [data for chunk in results for data in chunk]
+        except Exception as e:
+            # The figures left unrendered are drawn serially by render()
+            log.error(f"Parallel figure rendering failed ({e}); rendering serially")
+            self.close()
+            self.max_workers = 1
+            return {}
+        return {id(figure): data for figure, data in zip(figures, rendered)}
+
+    def render_elements(self, elements):
+        """The elements with every DeferredFigure replaced by its rendered flowable."""
+        deferred = [element for element in elements if isinstance(element, DeferredFigure)]
+        if not deferred:
+            return list(elements)
+        log.info(f"Rendering {len(deferred)} report figures ({self.fmt}, dpi={self.dpi or 'default'})")
+        rendered = iter(self.render(deferred))
+        return [element.to_flowable(next(rendered), self.fmt, self.dpi) if isinstance(element, DeferredFigure)
+                else element for element in elements]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def render_many(figures, max_workers=None, fmt='png', dpi=None):
+    """Render DeferredFigures to buffers in fmt, in order, across a process pool (see FigureRenderer)."""
+    with FigureRenderer(max_workers) as renderer:
+        renderer.fmt, renderer.dpi = fmt, dpi
+        return renderer.render(figures)
+
+
+def release_renderings(elements):
+    """Drop the data kept in the figures of elements (see FigureRenderer keep); stored copies keep theirs."""
+    for element in elements:
+        if isinstance(element, DeferredFigure) and element.plot is not None:
+            element.rendered.clear()
+
+
+def render_figures(elements, max_workers=None, quality=None):
+    """
+    Return the report elements with every DeferredFigure rendered to a flowable, in order.
+    max_workers: processes used for rendering (default: CPU count; 1 renders serially).
+    quality: a REPORT_QUALITIES key ('draft', 'standard', 'high', 'vector').
+    """
+    with FigureRenderer(max_workers, quality) as renderer:
+        return renderer.render_elements(elements)
@@ -1,3 +1,4 @@
+import copy
 import os
 import sys
 from datetime import datetime
@@ -8,11 +9,113 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
 from logs.logger import setup_logger
+from Analysis.figures import DeferredFigure, FigureRenderer, release_renderings
+from Analysis.progress import notify
 
 log = setup_logger("generatepdf.py")
 
 
-def generate_pdf(elements, institution, department, linac_ID, measured_by, pdf_path):
+# Deferred figures rendered (and held in memory) at a time while a report is written
+FIGURES_PER_SECTION = 8
+
+
+def resource_path(relative_path):
+    """ Get the absolute path to the resource, works for development, PyInstaller and headless runs """
+    try:
+        base_path = sys._MEIPASS
+    except Exception:
+        # Repository root, so the logo is found whatever the working directory is
+        base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    path = os.path.join(base_path, relative_path)
+    if not os.path.exists(path):
+        # The logo is checked in as pyRTQA.PNG; case matters outside Windows
+        root, ext = os.path.splitext(path)
+        if os.path.exists(root + ext.upper()):
+            path = root + ext.upper()
+    return path
+
+
+def split_sections(elements, figures_per_section=FIGURES_PER_SECTION):
+    """Cut a flat element list into runs holding at most figures_per_section deferred figures."""
+    section, figures = [], 0
+    for element in elements:
+        if isinstance(element, DeferredFigure):
+            if figures == figures_per_section:
+                yield section
+                section, figures = [], 0
+            figures += 1
+        section.append(element)
+    if section:
+        yield section
+
+
+def layout_copies(section):
+    """
+    Shallow copies of a section's flowables for one build. ReportLab keeps layout state on the
+    flowables it draws (e.g. _postponed), so laying out the caller's own elements would make a
+    second report from them (regenerated, or loaded from the analysis cache) fail to fit.
+    """
+    return [copy.copy(element) for element in section]
+
+
+class StreamingStory(list):
+    """
+    Story for doc.build that pulls the next section only when everything before it has been
+    laid out. ReportLab removes each flowable from the front of the story once it is drawn, so
+    only one section's rendered figures are held at a time, whatever the size of the report.
+    prepare turns a section into flowables (e.g. renders its figures) just before it is needed.
+    """
+
+    def __init__(self, head, sections, tail, prepare):
+        list.__init__(self, head)
+        self._sections = iter(sections)
+        self._tail = list(tail)
+        self._prepare = prepare
+
+    def __len__(self):
+        while list.__len__(self) == 0 and self._sections is not None:
+            try:
+                section = next(self._sections)
+            except StopIteration:
+                self._sections = None
+                self.extend(self._tail)
+                break
+            self.extend(self._prepare(section))
+        return list.__len__(self)
+
+
+def generate_pdf(elements, institution, department, linac_ID, measured_by, pdf_path, render_workers=None,
+                 quality=None, cache=None, progress=None):
+    """
+    Write the report to pdf_path. Deferred figures in elements are rendered a section at a time,
+    across render_workers processes (default: CPU count; 1 renders in this process), at quality:
+    'draft' (low-DPI, fastest), 'standard', 'high' or 'vector' (SVG drawings; see figures.REPORT_QUALITIES).
+    cache: an AnalysisCache to store the built report in, under elements.cache_key and quality (see
+    runner.run_analysis); the rendered figures are kept until it is stored, then dropped from elements.
+    progress: optional progress(stage, fraction) callback, called before each section (see Analysis.progress).
+    """
+    keep = cache is not None and getattr(elements, 'cache_key', None) is not None
+    try:
+        generate_pdf_sections(list(split_sections(elements)), institution, department, linac_ID, measured_by,
+                              pdf_path, render_workers=render_workers, quality=quality, keep_figures=keep,
+                              progress=progress)
+        if keep:
+            cache.update(elements, quality)
+    finally:
+        if keep:
+            release_renderings(elements)
+
+
+def generate_pdf_sections(sections, institution, department, linac_ID, measured_by, pdf_path, render_workers=None,
+                          quality=None, keep_figures=False, progress=None):
+    """
+    Write a report from an iterable of element lists (sections), e.g. a generator yielding each
+    image's results as its analysis finishes. Each section is rendered only when the writer reaches
+    it and released once laid out, so peak memory stays bounded regardless of batch size.
+    keep_figures: leave the rendered data in each figure's rendered (see FigureRenderer keep).
+    progress: optional progress(stage, fraction) callback, called before each section is rendered;
+    fractions are only known when sections has a length.
+    """
     log.info(f"PDF generation started..")
     try:
         styles = getSampleStyleSheet()
@@ -31,14 +134,6 @@ def generate_pdf(elements, institution, department, linac_ID, measured_by, pdf_p
         # Header text
         header_text = Paragraph(f"{institution}<br/>{department}", header_style)
 
-        def resource_path(relative_path):
-            """ Get the absolute path to the resource, works for development and PyInstaller """
-            try:
-                base_path = sys._MEIPASS
-            except Exception:
-                base_path = os.path.abspath(".")
-            return os.path.join(base_path, relative_path)
-
         # Path to the image
         image_path = resource_path('pyRTQA.png')
         img = Image(image_path)
@@ -66,17 +161,20 @@ def generate_pdf(elements, institution, department, linac_ID, measured_by, pdf_p
         content.append(Spacer(1, 12))
         content.append(header)
         content.append(Spacer(1, 12))
-        content.extend(elements)
-        content.append(Spacer(1, 5))
-        content.append(footer)
 
-        doc.build(content)
-        # After doc.build(content)
-        for b in getattr(content, "_buffers", []):
-            try:
-                b.close()
-            except:
-                pass
+        total = len(sections) if hasattr(sections, '__len__') else None
+        prepared = 0
+
+        def prepare(section):
+            nonlocal prepared
+            notify(progress, "Drawing report figures", prepared / total if total else 0.0)
+            prepared += 1
+            return renderer.render_elements(layout_copies(section))
+
+        # Figures deferred by the analyses are drawn only now, one section at a time
+        with FigureRenderer(render_workers, quality, keep=keep_figures) as renderer:
+            doc.build(StreamingStory(content, sections, [Spacer(1, 5), footer], prepare))
+        notify(progress, "Report written", 1.0)
 
     except Exception as e:
         log.error(f"Error found in pdf generation : {e}")
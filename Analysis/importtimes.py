@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+from logs.logger import setup_logger
+
+log = setup_logger("importtimes.py")
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What the GUI needs before its window shows, then what an analysis pulls in when it runs
+STARTUP_MODULES = ('tkinter', 'pyRTQA_UI', 'UI_new', 'Analysis.background')
+LIBRARY_MODULES = ('numpy', 'scipy', 'pandas', 'matplotlib.pyplot', 'reportlab.platypus', 'pydicom', 'pylinac')
+
+
+def report_modules():
+    """Default modules to time: GUI startup, heavy libraries, then every analysis module."""
+    from Analysis.runner import ANALYSES
+    analysis_modules = dict.fromkeys(module for module, _ in ANALYSES.values())
+    return STARTUP_MODULES + LIBRARY_MODULES + ('Analysis.generatepdf',) + tuple(analysis_modules)
+
+
+def measure_import(module):
+    """
+    Cumulative import time (s) of module in a fresh interpreter, from python -X importtime,
+    so earlier imports in this process do not hide its cost. Returns (seconds, error).
+    """
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT_DIR,
+                               capture_output=True, text=True, env={**os.environ, 'MPLBACKEND': 'Agg'})
+    if completed.returncode != 0:
+        lines = completed.stderr.strip().splitlines()
+        return None, lines[-1] if lines else f"exit code {completed.returncode}"
+    for line in completed.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if line.startswith('import time:') and line.rsplit('|', 1)[-1].strip() == module:
+            return int(line.split('|')[1]) / 1e6, None
+    return 0.0, None
+
+
+def import_report(modules=None):
+    """Import time of each module as [{'module', 'seconds', 'error'}], slowest first."""
+    rows = []
+    for module in modules or report_modules():
+        seconds, error = measure_import(module)
+        rows.append({'module': module, 'seconds': seconds, 'error': error})
+        log.info(f"Import time {module}: {seconds if error is None else error}")
+    return sorted(rows, key=lambda row: -(row['seconds'] or 0))
+
+
+def over_budget(rows, budget_s):
+    """Startup modules (imported before the GUI window shows) that take longer than budget_s."""
+    return [row['module'] for row in rows
+            if row['module'] in STARTUP_MODULES and (row['error'] or row['seconds'] > budget_s)]
+
+
+def format_report(rows, budget_s=None):
+    slow = over_budget(rows, budget_s) if budget_s is not None else []
+    lines = [f"{'module':<28} {'import (ms)':>12}"]
+    for row in rows:
+        value = f"failed: {row['error']}" if row['error'] else f"{row['seconds'] * 1000:12.1f}"
+        if row['module'] in slow:
+            value += "  over startup budget"
+        lines.append(f"{row['module']:<28} {value}")
+    return "\n".join(lines)
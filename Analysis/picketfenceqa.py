@@ -1,12 +1,13 @@
-from io import BytesIO
-import matplotlib.pyplot as plt
 from pylinac import PicketFence
 from pylinac.picketfence import MLC
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import Paragraph, Spacer, Image
+from reportlab.platypus import Paragraph, Spacer
 from logs.logger import setup_logger
+from Analysis.progress import notify
+from Analysis.results import QAResults, ReportElements, pylinac_results
+from Analysis.figures import DeferredFigure
 
 log = setup_logger("picketfenceqa.py")
 
@@ -22,7 +23,8 @@ footer_style = ParagraphStyle('FooterStyle',
     textColor=colors.black
  )
 
-def process_picketfence(file_path, tolerance, action_level, mlc_type, separate_leaves=False, nominal_gap=None):
+def process_picketfence(file_path, tolerance, action_level, mlc_type, separate_leaves=False, nominal_gap=None,
+                        progress=None):
 
     log.info(f"Picket Fence analysis started")
 
@@ -35,7 +37,9 @@ def process_picketfence(file_path, tolerance, action_level, mlc_type, separate_l
             return []
 
     # Initialize PicketFence with the specified MLC type
+    notify(progress, "Loading image", 0.05)
     pf = PicketFence(file_path, mlc=MLC[mlc_type])
+    notify(progress, "Analyzing picket fence", 0.2)
 
     try:
         if separate_leaves:
@@ -56,7 +60,10 @@ def process_picketfence(file_path, tolerance, action_level, mlc_type, separate_l
 
     pf_results = pf.results()
     print(pf_results)
-    elements = []
+    elements = ReportElements(results=QAResults('picket-fence', file_path, pylinac_results(pf),
+                                                tolerance=tolerance, action_level=action_level, mlc_type=mlc_type,
+                                                separate_leaves=separate_leaves, nominal_gap=nominal_gap))
+    notify(progress, "Building report", 0.7)
     add_picketfence_results_to_pdf(elements, pf, pf_results)
     log.info("Picket Fence Analysis Completed")
     return elements
@@ -67,16 +74,6 @@ def add_picketfence_results_to_pdf(elements, pf, pf_results):
     results_lines = pf.results().split('\n')
     for line in results_lines:
         elements.append(Paragraph(line, styles['Normal']))
-    buf = BytesIO()
-    pf.plot_analyzed_image(show=False, )
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    analyzed_img = Image(buf, width=6 * inch, height=4 * inch)
-    elements.append(analyzed_img)
-
-    buf_hist = BytesIO()
-    pf.plot_histogram(show=False)
-    plt.savefig(buf_hist, format='png')
-    buf_hist.seek(0)
-    hist_img = Image(buf_hist, width=6 * inch, height=4 * inch)
-    elements.append(hist_img)
+    # Figures are drawn when the PDF is generated
+    elements.append(DeferredFigure(pf.plot_analyzed_image, show=False, width=6 * inch, height=4 * inch))
+    elements.append(DeferredFigure(pf.plot_histogram, show=False, width=6 * inch, height=4 * inch))
@@ -0,0 +1,173 @@
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+import numpy as np
+
+# Fixed dose levels (%) reported on both sides of the central axis
+DOSE_LEVELS = (90, 75, 60)
+
+
+def points_to_arrays(points):
+    """Convert a list of PointXY objects to (x, dose) float arrays."""
+    count = len(points)
+    x = np.fromiter((p.x for p in points), dtype=np.float64, count=count)
+    dose = np.fromiter((p.y for p in points), dtype=np.float64, count=count)
+    return x, dose
+
+
+def calc_slopes(x, dose):
+    """Slope between each pair of neighbouring samples (inf where dx == 0)."""
+    dx = np.diff(x)
+    dy = np.diff(dose)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(dx != 0, dy / dx, np.inf)
+
+
+def predict_x(levels, x, dose, side):
+    """
+    For every dose level return the x of the sample closest in dose on one side of the CAX.
+    side: -1 for the negative half, 1 for the positive half. Returns inf where no sample qualifies.
+    """
+    levels = np.atleast_1d(np.asarray(levels, dtype=np.float64))
+    diff = np.abs(dose[np.newaxis, :] - levels[:, np.newaxis])
+    valid = ((x * side) > 0)[np.newaxis, :] & ~np.isnan(diff)
+    diff = np.where(valid, diff, np.inf)
+
+    idx = np.argmin(diff, axis=1)
+    found = np.isfinite(diff[np.arange(levels.size), idx])
+    return np.where(found, x[idx], np.inf)
+
+
+class ShoulderIndex:
+    """
+    Sorted-search index over one side of the profile, walking outward from the CAX.
+    The running minimum of the dose is monotonic, so the first sample that falls below a
+    level is found with a binary search and the crossing is interpolated between it and its
+    inner neighbour. Built once per side and shared by every level.
+    """
+
+    def __init__(self, x, dose, side):
+        keep = ((x * side) > 0) & np.isfinite(x) & np.isfinite(dose)
+        order = np.argsort(np.abs(x[keep]), kind='stable')
+        self.x = x[keep][order]
+        self.dose = dose[keep][order]
+        self.envelope = np.minimum.accumulate(self.dose) if self.dose.size else self.dose
+
+    def crossings(self, levels):
+        """x where the profile first drops below each level (NaN where it never does)."""
+        levels = np.atleast_1d(np.asarray(levels, dtype=np.float64))
+        # envelope is non-increasing, so search on its negation
+        k = np.searchsorted(-self.envelope, -levels, side='right')
+        result = np.full(levels.shape, np.nan)
+
+        inside = (k > 0) & (k < self.x.size)
+        k_out = k[inside]
+        x_in, x_out = self.x[k_out - 1], self.x[k_out]
+        d_in, d_out = self.dose[k_out - 1], self.dose[k_out]
+        frac = (d_in - levels[inside]) / (d_in - d_out)
+        result[inside] = x_in + frac * (x_out - x_in)
+
+        # Already below the level at the first sample next to the CAX: no inner bracket
+        first = (k == 0) & (self.x.size > 0)
+        result[first] = self.x[0] if self.x.size else np.nan
+        return result
+
+
+def interpolate_x(levels, x, dose, side):
+    """
+    Sub-sample threshold crossings on one side of the CAX.
+    Falls back to the nearest sample where the profile never drops below a level.
+    """
+    crossing = ShoulderIndex(x, dose, side).crossings(levels)
+    missing = np.isnan(crossing)
+    if missing.any():
+        crossing[missing] = predict_x(np.atleast_1d(levels)[missing], x, dose, side)
+    return crossing
+
+
+class ProfileResult:
+    """
+    Outcome of a single profile analysis.
+    All intermediate state (slopes, extrema, RDV) lives on the instance, so separate
+    profiles can be analysed concurrently without sharing anything.
+    """
+
+    def __init__(self, x, dose, interpolate=True):
+        self.interpolate = interpolate
+        self.x = np.asarray(x, dtype=np.float64)
+        self.dose = np.asarray(dose, dtype=np.float64)
+        if self.x.shape != self.dose.shape or self.x.ndim != 1:
+            raise ValueError("Profile x and dose must be 1D arrays of the same length.")
+        if self.x.size < 2:
+            raise ValueError("Profile must contain at least two points.")
+
+        self.slopes = calc_slopes(self.x, self.dose)
+        # NaN slopes never win the comparison, same as the original point-by-point scan
+        i_max = int(np.argmax(np.where(np.isnan(self.slopes), -np.inf, self.slopes)))
+        i_min = int(np.argmin(np.where(np.isnan(self.slopes), np.inf, self.slopes)))
+
+        self.max_slope = float(self.slopes[i_max])
+        self.min_slope = float(self.slopes[i_min])
+        self.Y1 = float(self.dose[i_max])
+        self.Y2 = float(self.dose[i_min])
+        self.RDV = (self.Y1 + self.Y2) / 2
+        self.metrics = self._calc_metrics()
+
+    def _calc_metrics(self):
+        RDV = self.RDV
+
+        # All threshold crossings for both sides in one pass
+        levels = (RDV, RDV * 1.6, RDV * 0.4) + DOSE_LEVELS
+        find_x = interpolate_x if self.interpolate else predict_x
+        neg = find_x(levels, self.x, self.dose, -1).tolist()
+        pos = find_x(levels, self.x, self.dose, 1).tolist()
+        negAvgX, negUpperX, negLowerX, negX90Y, negX75Y, negX60Y = neg
+        posAvgX, posUpperX, posLowerX, posX90Y, posX75Y, posX60Y = pos
+
+        return {
+            'max_slope': Decimal(self.max_slope),
+            'min_slope': Decimal(self.min_slope),
+            'RDV': RDV,
+            'PLu': negUpperX,
+            'PLd': negLowerX,
+            'Penumbra_Left(mm)': abs(negLowerX - negUpperX) * 10,
+            'PRu': posUpperX,
+            'PRd': posLowerX,
+            'Penumbra_Right(mm)': abs(posLowerX - posUpperX) * 10,
+            'IPL': negAvgX,
+            'IPR': posAvgX,
+            'Field size(mm)': (posAvgX - negAvgX) * 10,
+            '90-': negX90Y,
+            '90+': posX90Y,
+            'X90%': posX90Y - negX90Y,
+            '75-': negX75Y,
+            '75+': posX75Y,
+            'X75%': posX75Y - negX75Y,
+            '60-': negX60Y,
+            '60+': posX60Y,
+            'X60%': posX60Y - negX60Y
+        }
+
+    def as_dict(self):
+        """Result dictionary in the layout used by the report tables (a fresh copy)."""
+        return dict(self.metrics)
+
+
+def calculate(x, dose, interpolate=True):
+    """
+    Compute the AERB profile metrics from x (cm) and dose (%) arrays.
+    interpolate: locate crossings between samples (False keeps the nearest-sample lookup).
+    Returns the same result dictionary as Process.calculate.
+    """
+    return ProfileResult(x, dose, interpolate=interpolate).as_dict()
+
+
+def calculate_many(profiles, max_workers=None, interpolate=True):
+    """
+    Analyse several (x, dose) profiles concurrently, e.g. Inline and Crossline.
+    Returns the result dictionaries in input order.
+    """
+    profiles = list(profiles)
+    if len(profiles) < 2:
+        return [calculate(x, dose, interpolate) for x, dose in profiles]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda profile: calculate(*profile, interpolate), profiles))
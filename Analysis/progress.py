@@ -0,0 +1,8 @@
+class AnalysisCancelled(Exception):
+    """Raised from a progress callback to stop an analysis at the next stage boundary."""
+
+
+def notify(progress, stage, fraction):
+    """Call the optional progress(stage, fraction) callback of an analysis; fraction runs 0..1."""
+    if progress is not None:
+        progress(stage, fraction)
@@ -0,0 +1,226 @@
+from collections import Counter
+import numpy as np
+import pydicom
+from logs.logger import setup_logger
+from Analysis.dicom_headers import RAW_PIXEL_TRANSFER_SYNTAXES, header_from_dataset, memmap_dicom_pixels
+
+log = setup_logger("qa_detect.py")
+
+# Longest side of the thumbnail the image classifier looks at
+THUMBNAIL_SIZE = 128
+# Images of a series classified (spread over it); the majority decides
+MAX_CLASSIFIED_IMAGES = 8
+
+# Planar images taken at or below this tube voltage are kV images (Leeds TOR)
+KV_MAX_KVP = 150
+KV_MODALITIES = ('DX', 'CR', 'RF', 'XA')
+
+# Classifier thresholds, in thumbnail units (fractions of the image or of a profile's range)
+MIN_PICKETS = 4
+MAX_PICKET_SPACING_CV = 0.25
+MIN_SPOKE_CROSSINGS = 6
+SMALL_FIELD_FRACTION = 0.08
+MIN_FIELD_FILL = 0.6
+MIN_PROFILE_RANGE = 0.3
+
+
+def read_thumbnail(file_path, size=THUMBNAIL_SIZE):
+    """
+    Header index entry and thumbnail of one DICOM file. Only the header is parsed; raw pixel data is
+    memory-mapped and averaged straight from the file (no decoded copy of the image), other data is decoded.
+    """
+    header = header_from_dataset(pydicom.dcmread(file_path, stop_before_pixels=True), file_path)
+    try:
+        pixels = memmap_dicom_pixels(file_path)
+    except Exception as e:
+        log.warning(f"Could not map the pixel data of {file_path}: {e}")
+        pixels = None
+    if pixels is None:
+        return header, thumbnail(pydicom.dcmread(file_path), size)
+    return header, pixels_thumbnail(pixels, size)
+
+
+def _raw_pixels(ds):
+    """
+    The first frame as an array over the PixelData bytes (no copy, no decode), or None unless they are
+    raw pixels (not compressed or deflated).
+    """
+    transfer_syntax = getattr(getattr(ds, 'file_meta', None), 'TransferSyntaxUID', None)
+    bits = ds.get('BitsAllocated')
+    if transfer_syntax not in RAW_PIXEL_TRANSFER_SYNTAXES or bits not in (8, 16, 32) \
+            or ds.get('SamplesPerPixel', 1) != 1:
+        return None
+    kind = 'i' if ds.get('PixelRepresentation') else 'u'
+    dtype = np.dtype(f"{kind}{bits // 8}").newbyteorder('<' if transfer_syntax.is_little_endian else '>')
+    rows, columns = int(ds.Rows), int(ds.Columns)
+    return np.frombuffer(ds.PixelData, dtype=dtype, count=rows * columns).reshape(rows, columns)
+
+
+def thumbnail(ds, size=THUMBNAIL_SIZE):
+    """
+    Block-averaged copy of the image, at most size pixels a side, scaled to 0..1 with the radiation
+    field bright whatever the panel's polarity. Block means (not every n-th pixel) keep 1 mm pickets.
+    None when the dataset has no usable greyscale image.
+    """
+    if 'PixelData' not in ds:
+        return None
+    try:
+        pixels = _raw_pixels(ds)
+        if pixels is None:
+            pixels = ds.pixel_array
+            if pixels.ndim == 3:
+                if ds.get('SamplesPerPixel', 1) != 1:
+                    return None
+                pixels = pixels[0]
+    except Exception as e:
+        log.warning(f"Could not read the pixel data for a thumbnail: {e}")
+        return None
+    return pixels_thumbnail(pixels, size)
+
+
+def pixels_thumbnail(pixels, size=THUMBNAIL_SIZE):
+    """
+    thumbnail of a 2D pixel array. Every pixel is read for the block means; a memory-mapped array is
+    averaged from the file without first being copied into memory.
+    """
+    step = max(1, -(-max(pixels.shape) // size))
+    rows, columns = (pixels.shape[0] // step) * step, (pixels.shape[1] // step) * step
+    if rows == 0 or columns == 0:
+        return None
+    blocks = pixels[:rows, :columns].reshape(rows // step, step, columns // step, step)
+    small = blocks.mean(axis=(1, 3), dtype=np.float32)
+
+    low, high = np.percentile(small, (0.5, 99.9))
+    if high <= low:
+        return None
+    small = np.clip((small - low) / (high - low), 0.0, 1.0)
+    # The border is mostly outside the field: if it is bright, the panel reports dose as dark
+    border = np.concatenate((small[0], small[-1], small[:, 0], small[:, -1]))
+    if np.median(border) > 0.5:
+        small = 1.0 - small
+    return small
+
+
+def _runs(profile):
+    """Centres and widths of the runs of a profile above half its range, or [] for a flat profile."""
+    low, high = profile.min(), profile.max()
+    if high - low < MIN_PROFILE_RANGE:
+        return []
+    above = np.concatenate(([False], profile > (low + high) / 2, [False]))
+    edges = np.flatnonzero(np.diff(above.astype(np.int8)))
+    starts, ends = edges[::2], edges[1::2]
+    return [((start + end - 1) / 2, end - start) for start, end in zip(starts, ends)]
+
+
+def _picket_count(image, mask):
+    """Number of regularly spaced narrow pickets across the field, along whichever axis has more."""
+    rows, columns = np.nonzero(mask)
+    best = 0
+    for axis, span in ((0, image[rows.min():rows.max() + 1]), (1, image[:, columns.min():columns.max() + 1])):
+        runs = _runs(span.mean(axis=axis))
+        if len(runs) < MIN_PICKETS:
+            continue
+        centres = np.array([centre for centre, _ in runs])
+        spacing = np.diff(centres)
+        widths = np.array([width for _, width in runs])
+        if spacing.std() / spacing.mean() <= MAX_PICKET_SPACING_CV and widths.mean() < 0.6 * spacing.mean():
+            best = max(best, len(runs))
+    return best
+
+
+def _spoke_crossings(image, mask):
+    """Number of bright arcs on circles around the field centre: two per starshot spoke."""
+    rows, columns = np.nonzero(mask)
+    weights = image[rows, columns]
+    cy, cx = np.average(rows, weights=weights), np.average(columns, weights=weights)
+    reach = min(cy, image.shape[0] - 1 - cy, cx, image.shape[1] - 1 - cx)
+    angles = np.linspace(0, 2 * np.pi, 720, endpoint=False)
+    counts = []
+    for fraction in (0.4, 0.7):
+        radius = reach * fraction
+        if radius < 4:
+            return 0
+        ring = image[np.rint(cy + radius * np.sin(angles)).astype(int), np.rint(cx + radius * np.cos(angles)).astype(int)]
+        # Start at the darkest point so no arc is split across the ends
+        counts.append(len(_runs(np.roll(ring, -int(np.argmin(ring))))))
+    return min(counts)
+
+
+def image_features(image):
+    """The measures classify_image decides on, from a thumbnail (see thumbnail)."""
+    mask = image > 0.5
+    if not mask.any():
+        return None
+    rows, columns = np.nonzero(mask)
+    height, width = rows.max() - rows.min() + 1, columns.max() - columns.min() + 1
+    return {
+        'field_fraction': float(mask.mean()),
+        'field_fill': float(mask.sum() / (height * width)),
+        'field_aspect': float(max(height, width) / min(height, width)),
+        'pickets': _picket_count(image, mask),
+        'spoke_crossings': _spoke_crossings(image, mask),
+    }
+
+
+def classify_image(image):
+    """
+    QA type of one MV image from its thumbnail: 'picket-fence', 'starshot', 'winston-lutz' (a small
+    square field), 'field-analysis' (an open field), or None.
+    """
+    if image is None:
+        return None
+    features = image_features(image)
+    if features is None:
+        return None
+    if features['pickets'] >= MIN_PICKETS:
+        return 'picket-fence'
+    if features['spoke_crossings'] >= MIN_SPOKE_CROSSINGS:
+        return 'starshot'
+    if features['field_fill'] >= MIN_FIELD_FILL and features['field_aspect'] <= 2:
+        return 'winston-lutz' if features['field_fraction'] < SMALL_FIELD_FRACTION else 'field-analysis'
+    return None
+
+
+def is_kv_image(header):
+    """A planar kV image (radiography, or an RT image taken with the kV imager)."""
+    if header.get('Modality') in KV_MODALITIES:
+        return True
+    kvp = header.get('KVP')
+    return header.get('Modality') == 'RTIMAGE' and isinstance(kvp, (int, float)) and 0 < kvp <= KV_MAX_KVP
+
+
+def _read_image_thumbnail(header):
+    return read_thumbnail(header['path'])[1]
+
+
+def classify_series(headers, load_thumbnail=None):
+    """
+    QA type of one acquisition from its headers and the thumbnails of up to MAX_CLASSIFIED_IMAGES of
+    its images: CT series are CatPhan scans, planar kV images Leeds TOR, MV images are classified by
+    their thumbnails. None when it cannot be told.
+    load_thumbnail(header) gives an image's thumbnail; by default it is read from header['path'].
+    """
+    if not headers:
+        return None
+    modalities = {header.get('Modality') for header in headers}
+    if modalities == {'CT'}:
+        return 'catphantom'
+    if all(is_kv_image(header) for header in headers):
+        return 'leeds-tor'
+
+    load_thumbnail = load_thumbnail or _read_image_thumbnail
+    picks = np.unique(np.linspace(0, len(headers) - 1, min(len(headers), MAX_CLASSIFIED_IMAGES)).astype(int))
+    votes = Counter()
+    for i in picks:
+        try:
+            votes[classify_image(load_thumbnail(headers[i]))] += 1
+        except Exception as e:
+            log.warning(f"Could not classify {headers[i].get('path')}: {e}")
+    votes.pop(None, None)
+    if not votes:
+        return None
+    qa_type, count = votes.most_common(1)[0]
+    log.info(f"Classified {len(headers)} image(s) as {qa_type} ({count} of {len(picks)} sampled)")
+    if qa_type == 'picket-fence' and len(headers) > 1:
+        return 'picket-fence-multiple'
+    return qa_type
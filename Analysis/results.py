@@ -0,0 +1,140 @@
+import csv
+import dataclasses
+import enum
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+import numpy as np
+from logs.logger import setup_logger
+
+log = setup_logger("results.py")
+
+RESULT_FORMATS = ('.json', '.csv', '.parquet')
+
+
+def to_jsonable(value):
+    """Convert analysis output (NumPy scalars/arrays, Decimal, enums, dataclasses, pydantic models) to JSON types."""
+    if isinstance(value, dict):
+        return {str(key): to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return to_jsonable(value.tolist())
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating, Decimal)):
+        value = float(value)
+        # NaN/inf are not valid JSON; they mean "not measured" here
+        return value if np.isfinite(value) else None
+    if isinstance(value, enum.Enum):
+        return to_jsonable(value.value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return to_jsonable(dataclasses.asdict(value))
+    if hasattr(value, 'model_dump'):
+        return to_jsonable(value.model_dump())
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+
+def pylinac_results(analyzer):
+    """Structured results of a pylinac analyser (results_data), as JSON types."""
+    try:
+        data = analyzer.results_data(as_dict=True)
+    except TypeError:
+        # Older pylinac: results_data() takes no arguments and returns a dataclass
+        data = analyzer.results_data()
+    return to_jsonable(data)
+
+
+def flatten(data, prefix=''):
+    """
+    One flat {column: value} dict for tabular export: nested keys are joined with '.',
+    lists (e.g. per-leaf positions) are kept whole as JSON text.
+    """
+    row = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            row.update(flatten(value, f"{name}."))
+        elif isinstance(value, list):
+            row[name] = json.dumps(value)
+        else:
+            row[name] = value
+    return row
+
+
+class QAResults:
+    """
+    Machine-readable results of one analysis run.
+    data: the full structured results (JSON types), e.g. pylinac's results_data or the FFF metric dicts.
+    rows: one flat dict per measured item (profile, image, ...) for CSV/Parquet; defaults to one row of data.
+    """
+
+    def __init__(self, analysis, input_path, data, rows=None, **context):
+        self.analysis = analysis
+        self.input_path = input_path
+        self.data = to_jsonable(data)
+        self.rows = [flatten(to_jsonable(row)) for row in rows] if rows is not None else [flatten(self.data)]
+        # Run parameters worth keeping with the numbers (energy, depth, tolerance, ...)
+        self.context = to_jsonable(context)
+        self.created = datetime.now().isoformat(timespec='seconds')
+
+    def to_dict(self):
+        return {'analysis': self.analysis, 'input': self.input_path, 'created': self.created,
+                'context': self.context, 'results': self.data}
+
+    def table(self):
+        """Rows prefixed with the run's identifying columns, ready for a bulk load."""
+        base = {'analysis': self.analysis, 'input': self.input_path, 'created': self.created, **flatten(self.context)}
+        return [{**base, **row} for row in self.rows]
+
+    def to_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def to_csv(self, path):
+        rows = self.table()
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def to_parquet(self, path):
+        import pandas as pd
+        try:
+            pd.DataFrame(self.table()).to_parquet(path, index=False)
+        except ImportError:
+            raise ValueError("pyarrow (or fastparquet) is required for Parquet output (pip install pyarrow)")
+
+    def save(self, path):
+        """Write the results in the format given by the extension: .json, .csv or .parquet."""
+        ext = os.path.splitext(path)[1].lower()
+        if ext == '.json':
+            self.to_json(path)
+        elif ext == '.csv':
+            self.to_csv(path)
+        elif ext == '.parquet':
+            self.to_parquet(path)
+        else:
+            raise ValueError(f"Unsupported results format '{ext}'. Choose from: {', '.join(RESULT_FORMATS)}")
+        log.info(f"Results written to {path}")
+        return path
+
+
+class ReportElements(list):
+    """
+    The report flowables of an analysis, as before, carrying its QAResults in .results
+    (and, once stored in the analysis cache, the entry's key in .cache_key).
+    """
+
+    def __init__(self, elements=(), results=None):
+        list.__init__(self, elements)
+        self.results = results
+        self.cache_key = None
@@ -0,0 +1,254 @@
+import glob
+import json
+import os
+import sqlite3
+from datetime import date, datetime
+from logs.logger import setup_logger
+from Analysis.dicom_headers import acquisition_datetime, gantry_label, read_header
+from Analysis.results import QAResults
+
+log = setup_logger("results_db.py")
+
+# Default store, next to the logs (LOCALAPPDATA on Windows, the home directory elsewhere)
+DEFAULT_DB_PATH = os.path.join(os.getenv("LOCALAPPDATA") or os.path.expanduser("~"), "pyRTQA", "results.sqlite")
+
+# Row keys that say which profile/image a row describes rather than being measurements
+LABEL_KEYS = ('filename', 'profile', 'gantry', 'error', 'energy', 'depth')
+# Files of an input folder tried for an acquisition date before giving up
+MAX_DATED_FILES = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    machine_id TEXT NOT NULL,
+    qa_type TEXT NOT NULL,
+    measured_at TEXT NOT NULL,
+    energy REAL,
+    input TEXT,
+    context TEXT,
+    results TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_machine_type_date ON runs (machine_id, qa_type, measured_at);
+
+-- One row per number, with the run's keys repeated so a trend is a single index range scan
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    machine_id TEXT NOT NULL,
+    qa_type TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    measured_at TEXT NOT NULL,
+    energy REAL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS metrics_trend ON metrics (machine_id, qa_type, metric, measured_at, energy, value);
+CREATE INDEX IF NOT EXISTS metrics_run ON metrics (run_id);
+"""
+
+
+def _row_label(row):
+    """Prefix for a row's metrics: 'G90' for a gantry angle, else filename and/or profile (e.g. 'Inline')."""
+    if row.get('gantry') is not None:
+        # Picket Fence batches are trended per gantry angle, whatever the files are called
+        return f"G{gantry_label(row['gantry'])}"
+    return '.'.join(str(row[key]) for key in ('filename', 'profile') if row.get(key) is not None)
+
+
+def result_metrics(results):
+    """
+    The numeric results of a QAResults as {metric name: value}.
+    Names are the result keys, e.g. pylinac's 'max_2d_cax_to_bb_mm' (Winston-Lutz) or 'max_error_mm'
+    (Picket Fence), prefixed with the profile/image for multi-row results ('Inline.Field size(mm)', 'G90.max_error').
+    """
+    return {metric: value for metric, _, value in _metric_rows(results)}
+
+
+def _row_energy(row, results):
+    """A row's own energy (e.g. each profile of a multi-energy RFA export), else the run's."""
+    energy = row.get('energy')
+    if isinstance(energy, (int, float)) and not isinstance(energy, bool):
+        return float(energy)
+    return results.context.get('energy')
+
+
+def _metric_rows(results):
+    """(metric, energy, value) for each number of a QAResults."""
+    metric_rows = []
+    for row in results.rows:
+        label = _row_label(row)
+        energy = _row_energy(row, results)
+        for key, value in row.items():
+            if key in LABEL_KEYS or isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            metric_rows.append((f"{label}.{key}" if label else key, energy, float(value)))
+    return metric_rows
+
+
+def run_energy(results):
+    """The energy of a whole run: the one its rows share, None when they differ (a multi-energy run)."""
+    energies = {_row_energy(row, results) for row in results.rows}
+    return energies.pop() if len(energies) == 1 else None
+
+
+def input_acquired_at(input_path):
+    """
+    When the input was acquired: the acquisition date/time of the input DICOM file, or of the first
+    dated one of an input folder/glob. None for other inputs (e.g. RFA exports).
+    """
+    if not input_path:
+        return None
+    paths = sorted(glob.glob(os.path.join(input_path, '*'))) if os.path.isdir(input_path) \
+        else sorted(glob.glob(input_path))
+    for path in [path for path in paths if os.path.isfile(path)][:MAX_DATED_FILES]:
+        try:
+            acquired = acquisition_datetime(read_header(path))
+        except Exception:
+            continue
+        if acquired is not None:
+            return acquired
+    return None
+
+
+def _timestamp(value, end=False):
+    """ISO text for a date bound; a bare date as the end bound covers that whole day."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    value = value.isoformat() if isinstance(value, date) else str(value)
+    if end and len(value) == 10:
+        value += 'T23:59:59.999999'
+    return value
+
+
+class ResultsStore:
+    """
+    Embedded SQLite store of analysis results for trending, keyed by machine ID, QA type, date and energy.
+    Each run keeps its full structured results (JSON) and one indexed row per numeric metric.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_DB_PATH
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        # WAL lets the GUI read trends while a batch is being written
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def add(self, machine_id, results, measured_at=None):
+        """Store one QAResults for machine_id; returns the run id."""
+        return self.add_many([(machine_id, results, measured_at)])[0]
+
+    def add_many(self, records):
+        """
+        Store (machine_id, QAResults, measured_at) records in one transaction; returns their run ids.
+        measured_at defaults to when the analysis ran.
+        """
+        run_ids = []
+        with self.conn:
+            for machine_id, results, measured_at in records:
+                measured_at = _timestamp(measured_at) or results.created
+                energy = run_energy(results)
+                cursor = self.conn.execute(
+                    "INSERT INTO runs (machine_id, qa_type, measured_at, energy, input, context, results) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (machine_id, results.analysis, measured_at, energy, results.input_path,
+                     json.dumps(results.context), json.dumps(results.data)))
+                run_id = cursor.lastrowid
+                self.conn.executemany(
+                    "INSERT INTO metrics (run_id, machine_id, qa_type, metric, measured_at, energy, value) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(run_id, machine_id, results.analysis, metric, measured_at, metric_energy, value)
+                     for metric, metric_energy, value in _metric_rows(results)])
+                run_ids.append(run_id)
+        log.info(f"Stored {len(run_ids)} result run(s) in {self.path}")
+        return run_ids
+
+    def trend(self, machine_id, qa_type, metric, start=None, end=None, energy=None):
+        """
+        Time series of one metric as [(measured_at, value)], oldest first, e.g.
+        trend('LA1', 'winston-lutz', 'max_2d_cax_to_bb_mm', start='2024-01-01').
+        start/end: dates, datetimes or ISO strings (inclusive); energy: only runs at that energy.
+        """
+        sql = "SELECT measured_at, value FROM metrics WHERE machine_id = ? AND qa_type = ? AND metric = ?"
+        args = [machine_id, qa_type, metric]
+        if start is not None:
+            sql += " AND measured_at >= ?"
+            args.append(_timestamp(start))
+        if end is not None:
+            sql += " AND measured_at <= ?"
+            args.append(_timestamp(end, end=True))
+        if energy is not None:
+            sql += " AND energy = ?"
+            args.append(float(energy))
+        return self.conn.execute(sql + " ORDER BY measured_at", args).fetchall()
+
+    def runs(self, machine_id=None, qa_type=None, start=None, end=None):
+        """Stored runs (without their results JSON) as dicts, oldest first."""
+        sql = "SELECT id, machine_id, qa_type, measured_at, energy, input, context FROM runs WHERE 1 = 1"
+        args = []
+        for column, value in (('machine_id', machine_id), ('qa_type', qa_type)):
+            if value is not None:
+                sql += f" AND {column} = ?"
+                args.append(value)
+        if start is not None:
+            sql += " AND measured_at >= ?"
+            args.append(_timestamp(start))
+        if end is not None:
+            sql += " AND measured_at <= ?"
+            args.append(_timestamp(end, end=True))
+        columns = ('id', 'machine_id', 'qa_type', 'measured_at', 'energy', 'input', 'context')
+        rows = [dict(zip(columns, row)) for row in self.conn.execute(sql + " ORDER BY measured_at", args)]
+        for row in rows:
+            row['context'] = json.loads(row['context'])
+        return rows
+
+    def run_results(self, run_id):
+        """The full structured results stored for a run."""
+        row = self.conn.execute("SELECT results FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"No stored run with id {run_id}")
+        return json.loads(row[0])
+
+    def machines(self):
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT machine_id FROM runs ORDER BY machine_id")]
+
+    def metrics(self, machine_id, qa_type):
+        """Metric names stored for a machine and QA type, for choosing what to trend."""
+        return [row[0] for row in self.conn.execute(
+            "SELECT DISTINCT metric FROM metrics WHERE machine_id = ? AND qa_type = ? ORDER BY metric",
+            (machine_id, qa_type))]
+
+    def delete_run(self, run_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM runs WHERE id = ?", (run_id,))
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def record_results(elements, machine_id, path=None, measured_at=None, ran_at=None):
+    """
+    Store the structured results of an analysis (a QAResults, or report elements carrying one), if any;
+    returns the run id or None.
+    measured_at defaults to the input's acquisition date/time, else ran_at (when the analysis was run),
+    else now: a cached QAResults' own creation time may be long before this run.
+    """
+    results = elements if isinstance(elements, QAResults) else getattr(elements, 'results', None)
+    if results is None:
+        return None
+    if not machine_id:
+        log.warning(f"No machine ID given; {results.analysis} results not stored")
+        return None
+    if measured_at is None:
+        measured_at = input_acquired_at(results.input_path) or ran_at or datetime.now()
+    with ResultsStore(path) as store:
+        return store.add(machine_id, results, measured_at)
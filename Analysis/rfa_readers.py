@@ -0,0 +1,246 @@
+import csv
+import os
+import re
+import numpy as np
+import pandas as pd
+from logs.logger import setup_logger
+
+log = setup_logger("rfa_readers.py")
+
+# Position columns accepted for each profile orientation, with their scale to cm
+POSITION_COLUMNS = {
+    'Inline': {'Inline(cm)': 1.0, 'Inline(mm)': 0.1},
+    'Crossline': {'Crossline(cm)': 1.0, 'Crossline(mm)': 0.1},
+}
+DOSE_COLUMN = 'Dose(%)'
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm', '.xls')
+TEXT_EXTENSIONS = ('.csv', '.txt', '.tsv')
+
+
+def _find_profile_columns(columns, orientation):
+    """
+    Return (position index, dose index, scale to cm) for one orientation, or None.
+    The dose column is the first 'Dose(%)' column after the position column, so a single
+    table may hold Inline and Crossline side by side.
+    """
+    columns = [str(c).strip() for c in columns]
+    for pos_name, scale in POSITION_COLUMNS[orientation].items():
+        if pos_name not in columns:
+            continue
+        pos_idx = columns.index(pos_name)
+        dose_idx = next((i for i in range(pos_idx + 1, len(columns)) if columns[i].startswith(DOSE_COLUMN)), None)
+        if dose_idx is None and DOSE_COLUMN in columns:
+            dose_idx = columns.index(DOSE_COLUMN)
+        if dose_idx is not None:
+            return pos_idx, dose_idx, scale
+    return None
+
+
+def _to_arrays(positions, doses, scale):
+    """Vectorised numeric conversion (mm -> cm via scale), dropping blank or non-numeric rows."""
+    x = pd.to_numeric(positions, errors='coerce').to_numpy(dtype=np.float64) * scale
+    dose = pd.to_numeric(doses, errors='coerce').to_numpy(dtype=np.float64)
+    keep = np.isfinite(x) & np.isfinite(dose)
+    return x[keep], dose[keep]
+
+
+def parse_profile_label(label):
+    """
+    Pull energy (MV) and depth (cm) out of a sheet name or scan label such as
+    '6X FFF d10 Inline' or '10MV 5cm Crossline'. Missing values come back as None.
+    Field sizes such as '20x20' or '10 x 10 cm' are ignored, so they are not read as an energy or depth.
+    """
+    label = re.sub(r'\b\d+(?:\.\d+)?(?:x|\s+x\s+)\d+(?:\.\d+)?(?:\s*cm\b)?', ' ', label, flags=re.IGNORECASE)
+    energy = re.search(r'\b(\d+(?:\.\d+)?)\s*(?:MV|X|FFF)', label, re.IGNORECASE)
+    depth = re.search(r'(?:\bd|depth)\s*=?\s*(\d+(?:\.\d+)?)|(\d+(?:\.\d+)?)\s*cm\b', label, re.IGNORECASE)
+    return {
+        'energy': float(energy.group(1)) if energy else None,
+        'depth': float(depth.group(1) or depth.group(2)) if depth else None,
+    }
+
+
+def _profile_label(sheet, orientation, orientations_in_sheet):
+    """Sheet name alone when it already names the only orientation (e.g. the classic 'Inline' sheet)."""
+    if len(orientations_in_sheet) == 1 and orientation.lower() in sheet.lower():
+        return sheet
+    return f"{sheet} {orientation}"
+
+
+def read_excel_profiles(file_path):
+    """
+    Read every profile sheet of a workbook in one open, parsing only the position and dose columns.
+    Sheets may be named by energy/depth/orientation and hold Inline and/or Crossline columns;
+    sheets without profile columns are skipped.
+    """
+    xl = pd.ExcelFile(file_path)
+
+    profiles = {}
+    for sheet in xl.sheet_names:
+        header = xl.parse(sheet, nrows=0).columns
+        columns = {}
+        for orientation in POSITION_COLUMNS:
+            found = _find_profile_columns(header, orientation)
+            if found is not None:
+                columns[orientation] = found
+        if not columns:
+            log.info(f"Skipping sheet '{sheet}': no Inline/Crossline profile columns")
+            continue
+
+        usecols = sorted({i for pos_idx, dose_idx, _ in columns.values() for i in (pos_idx, dose_idx)})
+        frame = xl.parse(sheet, header=None, skiprows=1, usecols=usecols)
+        for orientation, (pos_idx, dose_idx, scale) in columns.items():
+            label = _profile_label(str(sheet), orientation, columns)
+            _add_profile(profiles, label, *_to_arrays(frame[pos_idx], frame[dose_idx], scale))
+
+    if not profiles:
+        raise ValueError("No profile sheets with 'Inline(cm|mm)' or 'Crossline(cm|mm)' and 'Dose(%)' columns "
+                         "found in the Excel file.")
+    return profiles
+
+
+def read_delimited_profiles(file_path):
+    """
+    Fast path for CSV/TSV/TXT tables with the same column names as the workbook.
+    Only the header is inspected in Python; the needed columns are parsed by pandas' C reader.
+    """
+    with open(file_path, newline='', encoding='utf-8-sig') as f:
+        sample = f.read(4096)
+    try:
+        delimiter = csv.Sniffer().sniff(sample, delimiters=',;\t').delimiter
+    except csv.Error:
+        delimiter = ','
+    header = next(csv.reader(sample.splitlines()[:1], delimiter=delimiter), [])
+
+    columns = {}
+    for orientation in POSITION_COLUMNS:
+        found = _find_profile_columns(header, orientation)
+        if found is not None:
+            columns[orientation] = found
+    if not columns:
+        raise ValueError(f"Required columns 'Inline(cm|mm)' or 'Crossline(cm|mm)' with 'Dose(%)' "
+                         f"not found in {os.path.basename(file_path)}.")
+
+    usecols = sorted({i for pos_idx, dose_idx, _ in columns.values() for i in (pos_idx, dose_idx)})
+    frame = pd.read_csv(file_path, sep=delimiter, header=None, skiprows=1, usecols=usecols,
+                        encoding='utf-8-sig', engine='c')
+
+    return {orientation: _to_arrays(frame[pos_idx], frame[dose_idx], scale)
+            for orientation, (pos_idx, dose_idx, scale) in columns.items()}
+
+
+def _add_profile(profiles, label, x, dose):
+    """Store a profile under a unique label (repeat scans get ' (2)', ' (3)', ...)."""
+    name = label
+    count = 2
+    while name in profiles:
+        name = f"{label} ({count})"
+        count += 1
+    profiles[name] = (x, dose)
+
+
+def _scan_label(energy, depth_mm, beam_filter, orientation):
+    """Label for a scan from a native export, e.g. '6MV FFF 10cm Inline'."""
+    parts = []
+    try:
+        parts.append(f"{float(energy):g}MV")
+    except (TypeError, ValueError):
+        pass
+    if beam_filter and 'FFF' in beam_filter.upper():
+        parts.append('FFF')
+    try:
+        parts.append(f"{float(depth_mm) / 10.0:g}cm")
+    except (TypeError, ValueError):
+        pass
+    parts.append(orientation)
+    return ' '.join(parts)
+
+
+def read_mcc_profiles(file_path):
+    """Read profile scans from a PTW MEPHYSTO .mcc export (positions in mm)."""
+    orientations = {'INPLANE_PROFILE': 'Inline', 'CROSSPLANE_PROFILE': 'Crossline'}
+    profiles = {}
+    curve_type, rows, in_data, fields = None, [], False, {}
+    with open(file_path, encoding='latin-1') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('BEGIN_SCAN') and not line.startswith('BEGIN_SCAN_DATA'):
+                curve_type, rows, fields = None, [], {}
+            elif line.startswith('SCAN_CURVETYPE='):
+                curve_type = line.split('=', 1)[1].strip()
+            elif not in_data and line.startswith(('ENERGY=', 'SCAN_DEPTH=', 'FILTER=')):
+                key, value = line.split('=', 1)
+                fields[key] = value.strip()
+            elif line == 'BEGIN_DATA':
+                in_data = True
+            elif line == 'END_DATA':
+                in_data = False
+            elif in_data and line:
+                rows.append(line.split()[:2])
+            elif line.startswith('END_SCAN') and not line.startswith('END_SCAN_DATA'):
+                if curve_type in orientations and rows:
+                    data = np.asarray(rows, dtype=np.float64)
+                    label = _scan_label(fields.get('ENERGY'), fields.get('SCAN_DEPTH'), fields.get('FILTER'),
+                                        orientations[curve_type])
+                    _add_profile(profiles, label, data[:, 0] / 10.0, data[:, 1])
+    return profiles
+
+
+def read_omnipro_profiles(file_path):
+    """
+    Read profile scans from an IBA OmniPro/RFA300 ASCII (.asc) export.
+    Data rows are '<X Y Z dose>' in mm; the axis that varies decides the orientation.
+    """
+    profiles = {}
+    scan_type, rows, energy = None, [], None
+    data_row = re.compile(r'^<\s*(.*?)\s*>$')
+    with open(file_path, encoding='latin-1') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('%SCN'):
+                scan_type = line.split()[1] if len(line.split()) > 1 else None
+            elif line.startswith('%BMT'):
+                # e.g. '%BMT PHO 6.0'
+                parts = line.split()
+                energy = parts[2] if len(parts) > 2 else None
+            elif line.startswith(':EOM'):
+                if scan_type == 'PRO' and rows:
+                    data = np.asarray(rows, dtype=np.float64)
+                    depth = str(np.median(data[:, 2]))
+                    # X is the crossline (gun-target orthogonal) axis, Y the inline axis
+                    if np.ptp(data[:, 0]) >= np.ptp(data[:, 1]):
+                        label = _scan_label(energy, depth, None, 'Crossline')
+                        _add_profile(profiles, label, data[:, 0] / 10.0, data[:, 3])
+                    else:
+                        label = _scan_label(energy, depth, None, 'Inline')
+                        _add_profile(profiles, label, data[:, 1] / 10.0, data[:, 3])
+                scan_type, rows, energy = None, [], None
+            else:
+                match = data_row.match(line)
+                if match:
+                    rows.append(match.group(1).split()[:4])
+    return profiles
+
+
+def read_profile_arrays(file_path):
+    """
+    Read RFA profiles into {label: (x_cm, dose)} NumPy arrays, in file order.
+    Labels name the orientation and, where known, the energy and depth.
+    Supports Excel workbooks, CSV/TSV/TXT tables, PTW .mcc and IBA .asc exports.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in EXCEL_EXTENSIONS:
+        profiles = read_excel_profiles(file_path)
+    elif ext in TEXT_EXTENSIONS:
+        profiles = read_delimited_profiles(file_path)
+    elif ext == '.mcc':
+        profiles = read_mcc_profiles(file_path)
+    elif ext == '.asc':
+        profiles = read_omnipro_profiles(file_path)
+    else:
+        # Anything else is handed to pandas as a workbook, as before
+        profiles = read_excel_profiles(file_path)
+
+    if not profiles:
+        raise ValueError(f"No Inline or Crossline profiles found in {os.path.basename(file_path)}.")
+    return profiles
@@ -0,0 +1,67 @@
+import os
+import re
+from pydicom.errors import InvalidDicomError
+from logs.logger import setup_logger
+from Analysis.dicom_headers import read_header
+from Analysis.qa_detect import classify_series
+
+log = setup_logger("routing.py")
+
+# Header text searched for the QA type: what the acquisition was labelled on the imager
+LABEL_TAGS = ('RTImageLabel', 'RTImageDescription', 'SeriesDescription')
+
+# Keyword patterns (matched case-insensitively, as whole words) -> QA type
+ROUTE_KEYWORDS = (
+    (r'picket|pf', 'picket-fence'),
+    (r'star(?:shot)?', 'starshot'),
+    (r'winston|lutz|wl', 'winston-lutz'),
+    (r'leeds|tor', 'leeds-tor'),
+    (r'catphan|cbct', 'catphantom'),
+)
+
+
+def header_text(headers):
+    return ' '.join(str(header.get(tag) or '') for header in headers for tag in LABEL_TAGS)
+
+
+def route_series(headers, load_thumbnail=None):
+    """
+    The analysis (a key of Analysis.runner.ANALYSES) for one acquisition, given the header index
+    entries of its images, or None when it cannot be told.
+    CT series are CatPhan scans; RT images are routed by their label/description keywords, and
+    failing those by the image classifier (Analysis.qa_detect), which reads small thumbnails only.
+    load_thumbnail: see Analysis.qa_detect.classify_series.
+    """
+    modalities = {header.get('Modality') for header in headers}
+    if modalities == {'CT'}:
+        return 'catphantom'
+
+    text = header_text(headers)
+    for pattern, qa_type in ROUTE_KEYWORDS:
+        if re.search(rf'\b(?:{pattern})\b', text, re.IGNORECASE):
+            if qa_type == 'picket-fence' and len(headers) > 1:
+                return 'picket-fence-multiple'
+            return qa_type
+    qa_type = classify_series(headers, load_thumbnail)
+    if qa_type is None:
+        log.info(f"No QA type found for {len(headers)} image(s), labelled {text!r}")
+    return qa_type
+
+
+def detect_path(path):
+    """
+    The analysis for a DICOM file, or for the images directly in a folder (as the GUI and the
+    runner take them), or None when it cannot be told. Files that are not DICOM are ignored.
+    """
+    if os.path.isdir(path):
+        paths = sorted(os.path.join(path, name) for name in os.listdir(path))
+        paths = [file_path for file_path in paths if os.path.isfile(file_path)]
+    else:
+        paths = [path]
+    headers = []
+    for file_path in paths:
+        try:
+            headers.append(read_header(file_path))
+        except (InvalidDicomError, OSError):
+            continue
+    return route_series(headers) if headers else None
@@ -0,0 +1,196 @@
+import importlib
+import json
+import os
+import time
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from logs.logger import setup_logger
+from Analysis.progress import notify
+
+log = setup_logger("runner.py")
+
+# Analysis name -> (module, entry function). Modules are imported only when their analysis runs.
+ANALYSES = {
+    'fff-rfa': ('Analysis.fffanalysis', 'process_fff_analysis'),
+    'fff-2d': ('Analysis.FFF_FA_2D', 'process_fffFA_analysis'),
+    'fff-2d-batch': ('Analysis.FFF_FA_2D', 'process_fffFA_batch'),
+    'field-analysis': ('Analysis.FieldAnalysis', 'process_FA'),
+    'winston-lutz': ('Analysis.winstonlutz', 'process_winstonlutz'),
+    'picket-fence': ('Analysis.picketfenceqa', 'process_picketfence'),
+    'picket-fence-multiple': ('Analysis.Picketfence_batch', 'analyze_picketfence_multiple'),
+    'starshot': ('Analysis.StarShot', 'process_starshot'),
+    'catphantom': ('Analysis.catphantom', 'process_catphantom'),
+    'leeds-tor': ('Analysis.Leeds_TOR', 'process_leedsTOR'),
+}
+
+# Job 'analysis' value that has the QA type detected from the input images (see Analysis.routing)
+AUTO_ANALYSIS = 'auto'
+
+REPORT_FIELDS = ('institution', 'department', 'linac_ID', 'measured_by')
+REPORT_QUALITIES = ('draft', 'standard', 'high', 'vector')
+
+
+def resolve_analysis(analysis, input_path):
+    """The analysis to run: analysis itself, or for AUTO_ANALYSIS the one detected from the input images."""
+    if analysis != AUTO_ANALYSIS:
+        return analysis
+    from Analysis.routing import detect_path
+    detected = detect_path(input_path)
+    if detected is None:
+        raise ValueError(f"Could not detect the QA type of {input_path}; choose the analysis")
+    log.info(f"Detected QA type of {input_path}: {detected}")
+    return detected
+
+
+def run_analysis(analysis, input_path, cache=None, quality=None, **params):
+    """
+    Run one analysis without any GUI and return its report elements.
+    params are passed to the module's entry function as keyword arguments.
+    analysis may be AUTO_ANALYSIS (see resolve_analysis).
+    cache: an AnalysisCache; unchanged inputs analysed with the same parameters are then loaded from it,
+    if it holds their report built at quality (see figures.REPORT_QUALITIES). New output gets its key in
+    elements.cache_key; it is stored once its report is built (see generatepdf.generate_pdf), since the
+    cache keeps rendered figures rather than the analysers.
+    """
+    analysis = resolve_analysis(analysis, input_path)
+    if analysis not in ANALYSES:
+        raise ValueError(f"Unknown analysis '{analysis}'. Choose from: {', '.join(ANALYSES)}")
+    if analysis == 'fff-2d':
+        params.setdefault('file_type', 'DICOM' if input_path.lower().endswith('.dcm') else 'TIFF')
+
+    key = None
+    if cache is not None:
+        key = cache.key(analysis, input_path, params)
+        elements = cache.get(key, quality)
+        if elements is not None:
+            notify(params.get('progress'), "Loaded unchanged inputs from the analysis cache", 1.0)
+            return elements
+
+    module_name, func_name = ANALYSES[analysis]
+    func = getattr(importlib.import_module(module_name), func_name)
+    elements = func(input_path, **params)
+    if key is not None and getattr(elements, 'results', None) is not None:
+        elements.cache_key = key
+    return elements
+
+
+def open_cache(setting=True):
+    """The AnalysisCache for a job's 'cache' setting: True (default folder), a folder path, or False/None (no cache)."""
+    if not setting:
+        return None
+    from Analysis.cache import AnalysisCache
+    return AnalysisCache(setting if isinstance(setting, str) else None)
+
+
+def default_output(analysis, input_path, output_dir=None):
+    """Report path next to the input (or in output_dir): '<input name>_<analysis>.pdf'."""
+    stem = os.path.splitext(os.path.basename(os.path.normpath(input_path)))[0]
+    directory = output_dir if output_dir else os.path.dirname(os.path.abspath(input_path))
+    return os.path.join(directory, f"{stem}_{analysis}.pdf")
+
+
+def run_job(job):
+    """
+    Run one job and write its PDF report.
+    job keys: 'analysis' (a key of ANALYSES, or AUTO_ANALYSIS), 'input', optional 'params',
+    'output' (PDF path), 'json' (summary path),
+    'results' (structured results path or list of paths: .json, .csv or .parquet),
+    'db' (results database to record the run in, keyed by linac_ID, dated 'measured_at' if given, else
+    by the input's acquisition time or when the job started; see Analysis.results_db),
+    'cache' (True, the default: use the analysis cache; False: always re-analyse; or a cache folder),
+    'quality' (one of REPORT_QUALITIES) and the report header fields in REPORT_FIELDS.
+    Failures are logged and recorded in the returned summary instead of being raised,
+    so one bad input does not stop a scripted run.
+    """
+    start, started_at = time.perf_counter(), datetime.now()
+    analysis, input_path = job['analysis'], job['input']
+    summary = {'analysis': analysis, 'input': input_path, 'pdf': None, 'status': 'ok'}
+    log.info(f"Headless job started: {analysis} on {input_path}")
+
+    try:
+        analysis = summary['analysis'] = resolve_analysis(analysis, input_path)
+        output = summary['pdf'] = job.get('output') or default_output(analysis, input_path, job.get('output_dir'))
+        cache = open_cache(job.get('cache', True))
+        elements = run_analysis(analysis, input_path, cache=cache, quality=job.get('quality'),
+                                **(job.get('params') or {}))
+        if not elements:
+            raise RuntimeError("Analysis produced no report elements")
+
+        results_paths = job.get('results') or []
+        if isinstance(results_paths, str):
+            results_paths = [results_paths]
+        if results_paths:
+            if getattr(elements, 'results', None) is None:
+                raise RuntimeError(f"Analysis '{analysis}' produced no structured results")
+            summary['results'] = [elements.results.save(path) for path in results_paths]
+        if job.get('db'):
+            from Analysis.results_db import record_results
+            summary['db_run_id'] = record_results(elements, job.get('linac_ID'), job['db'], job.get('measured_at'),
+                                                  ran_at=started_at)
+
+        from Analysis.generatepdf import generate_pdf
+        generate_pdf(elements, *(job.get(field, '') for field in REPORT_FIELDS), output, quality=job.get('quality'),
+                     cache=cache)
+    except Exception as e:
+        log.error(f"Headless job failed: {analysis} on {input_path}: {e}", exc_info=True)
+        summary.update(status='error', error=str(e), pdf=None)
+
+    summary['elapsed_s'] = round(time.perf_counter() - start, 3)
+    if job.get('json'):
+        write_json(job['json'], summary)
+    log.info(f"Headless job finished: {analysis} on {input_path} ({summary['status']})")
+    return summary
+
+
+def run_jobs(jobs, max_workers=1):
+    """Run several jobs, across a process pool when max_workers > 1; summaries keep job order."""
+    jobs = list(jobs)
+    if (max_workers is None or max_workers > 1) and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(run_job, jobs))
+    return [run_job(job) for job in jobs]
+
+
+def read_config_file(path):
+    """Parse a JSON or YAML (.yaml/.yml, needs PyYAML) job or configuration file."""
+    with open(path, encoding='utf-8') as f:
+        if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("PyYAML is required for YAML job files (pip install pyyaml)")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def load_job_file(path):
+    """
+    Read a JSON or YAML job file: either a list of jobs or {'defaults': {...}, 'jobs': [...]}.
+    Defaults (report fields, shared params) are merged into every job; relative
+    paths are resolved against the job file's folder.
+    """
+    data = read_config_file(path)
+    if isinstance(data, list):
+        data = {'jobs': data}
+    defaults = data.get('defaults') or {}
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    jobs = []
+    for entry in data.get('jobs') or []:
+        job = {**defaults, **entry}
+        job['params'] = {**(defaults.get('params') or {}), **(entry.get('params') or {})}
+        for key in ('input', 'output', 'output_dir', 'json', 'db', 'cache'):
+            if isinstance(job.get(key), str) and job[key]:
+                job[key] = os.path.join(base_dir, os.path.expanduser(job[key]))
+        if job.get('results'):
+            paths = [job['results']] if isinstance(job['results'], str) else job['results']
+            job['results'] = [os.path.join(base_dir, os.path.expanduser(p)) for p in paths]
+        if 'analysis' not in job or 'input' not in job:
+            raise ValueError(f"Job entry needs 'analysis' and 'input': {entry}")
+        jobs.append(job)
+    return jobs
+
+
+def write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, default=str)
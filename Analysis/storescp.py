@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+import pydicom
+from logs.logger import setup_logger
+from Analysis.dicom_headers import header_from_dataset
+from Analysis.qa_detect import thumbnail
+from Analysis.routing import route_series
+from Analysis.runner import ANALYSES
+from Analysis.watcher import AnalysisQueue, acquisition_jobs
+
+log = setup_logger("storescp.py")
+
+DEFAULT_AE_TITLE = 'PYRTQA'
+DEFAULT_PORT = 11112
+# A series is complete once no association is sending it and nothing has arrived for this long
+DEFAULT_SERIES_SETTLE_S = 5.0
+
+# DICOM status codes returned to the sender
+STATUS_SUCCESS = 0x0000
+STATUS_OUT_OF_RESOURCES = 0xA700
+
+# Write spooled instances as DICOM files (preamble and file meta): pydicom 3 renamed the pydicom 2 option
+FILE_FORMAT_OPTION = ({'enforce_file_format': True} if int(pydicom.__version__.split('.')[0]) >= 3
+                      else {'write_like_original': False})
+
+
+class _Series:
+    __slots__ = ('datasets', 'last_received', 'senders')
+
+    def __init__(self):
+        self.datasets = []
+        self.last_received = time.monotonic()
+        # Associations currently sending instances of this series
+        self.senders = set()
+
+
+class StoreSCP:
+    """
+    DICOM storage SCP (C-STORE receiver) that feeds the analysis queue, so the linac/EPID workstation
+    can push images straight to pyRTQA. Instances are held in memory, grouped by SeriesInstanceUID;
+    once a series is complete (its associations released and settle_s without new instances) it is
+    written to spool_dir/<series UID> in one pass, routed by its headers and queued like a watch-folder
+    acquisition (see Analysis.watcher). C-ECHO is answered, so the SCU can verify the connection.
+    Needs pynetdicom (pip install pynetdicom).
+    """
+
+    def __init__(self, output_dir, ae_title=DEFAULT_AE_TITLE, port=DEFAULT_PORT, address='0.0.0.0',
+                 spool_dir=None, config=None, workers=2, settle_s=DEFAULT_SERIES_SETTLE_S):
+        self.output_dir = os.path.abspath(output_dir)
+        self.spool_dir = os.path.abspath(spool_dir or os.path.join(self.output_dir, 'spool'))
+        self.ae_title = ae_title
+        self.address = (address, port)
+        self.config = config or {}
+        self.workers = workers
+        self.settle_s = settle_s
+        self._series = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._server = None
+        self._queue = None
+        self._monitor = None
+
+    def start(self):
+        """Start listening (returns at once); stop() shuts down."""
+        try:
+            from pynetdicom import AE, evt, AllStoragePresentationContexts
+            from pynetdicom.sop_class import Verification
+        except ImportError:
+            raise ValueError("pynetdicom is required for the DICOM receiver (pip install pynetdicom)")
+
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._queue = AnalysisQueue(self.workers, os.path.join(self.output_dir, 'receive_log.jsonl'))
+        ae = AE(ae_title=self.ae_title)
+        ae.supported_contexts = AllStoragePresentationContexts
+        ae.add_supported_context(Verification)
+        handlers = [(evt.EVT_C_STORE, self._on_store),
+                    (evt.EVT_RELEASED, self._on_association_end),
+                    (evt.EVT_ABORTED, self._on_association_end)]
+        self._server = ae.start_server(self.address, block=False, evt_handlers=handlers)
+        self._monitor = threading.Thread(target=self._dispatch_completed, daemon=True)
+        self._monitor.start()
+        log.info(f"DICOM receiver {self.ae_title} listening on {self.address[0]}:{self.address[1]}")
+        return self
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while not self._stop.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            log.info("DICOM receiver stopped")
+        self.stop()
+
+    def stop(self):
+        """Stop receiving, dispatch the series already received, and wait for their analyses."""
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+        if self._monitor is not None:
+            self._monitor.join()
+            self._monitor = None
+        for uid in list(self._series):
+            self._dispatch(uid)
+        if self._queue is not None:
+            self._queue.close()
+            self._queue = None
+
+    def _on_store(self, event):
+        try:
+            ds = event.dataset
+            ds.file_meta = event.file_meta
+            uid = getattr(ds, 'SeriesInstanceUID', None) or getattr(ds, 'StudyInstanceUID', None)
+            if not uid:
+                log.warning(f"Instance without a series UID from {event.assoc.requestor.ae_title}; discarded")
+                return STATUS_SUCCESS
+            with self._lock:
+                series = self._series.setdefault(uid, _Series())
+                series.datasets.append(ds)
+                series.last_received = time.monotonic()
+                series.senders.add(event.assoc)
+            return STATUS_SUCCESS
+        except Exception as e:
+            log.error(f"Could not receive instance: {e}", exc_info=True)
+            return STATUS_OUT_OF_RESOURCES
+
+    def _on_association_end(self, event):
+        with self._lock:
+            for series in self._series.values():
+                if event.assoc in series.senders:
+                    series.senders.discard(event.assoc)
+                    series.last_received = time.monotonic()
+
+    def _dispatch_completed(self):
+        while not self._stop.wait(0.5):
+            now = time.monotonic()
+            with self._lock:
+                complete = [uid for uid, series in self._series.items()
+                            if not series.senders and now - series.last_received >= self.settle_s]
+            for uid in complete:
+                self._dispatch(uid)
+
+    def _dispatch(self, uid):
+        """Spool a complete series and queue its analysis."""
+        with self._lock:
+            series = self._series.pop(uid, None)
+        if series is None:
+            return
+        try:
+            stage_dir = os.path.join(self.spool_dir, uid)
+            os.makedirs(stage_dir, exist_ok=True)
+            headers, datasets = [], {}
+            for ds in series.datasets:
+                path = os.path.join(stage_dir, f"{ds.SOPInstanceUID}.dcm")
+                pydicom.dcmwrite(path, ds, **FILE_FORMAT_OPTION)
+                headers.append(header_from_dataset(ds, path))
+                datasets[path] = ds
+            # The images are still in memory: classify them without reading the spooled files back
+            analysis = route_series(headers, lambda header: thumbnail(datasets[header['path']]))
+            if analysis is None or analysis not in ANALYSES:
+                log.warning(f"Series {uid}: QA type not recognised from the headers; kept in {stage_dir}")
+                return
+            log.info(f"Series {uid} complete ({len(headers)} instance(s)): queued for {analysis}")
+            for job in acquisition_jobs(analysis, uid, headers, stage_dir, self.output_dir, self.config):
+                self._queue.submit(job)
+        except Exception as e:
+            log.error(f"Series {uid}: could not be dispatched: {e}", exc_info=True)
@@ -0,0 +1,243 @@
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from logs.logger import setup_logger
+from Analysis.dicom_headers import read_header, acquisition_datetime, machine_name, gantry_sort_key
+from Analysis.routing import route_series
+from Analysis.runner import run_job, ANALYSES
+
+log = setup_logger("watcher.py")
+
+# Analyses that take one image file; the others take the folder holding the whole acquisition
+SINGLE_FILE_ANALYSES = ('picket-fence', 'starshot', 'leeds-tor', 'fff-2d', 'field-analysis')
+# Parameters that cannot be read from the images and must come from the config
+REQUIRED_PARAMS = {'field-analysis': ('energy', 'depth'), 'fff-2d': ('energy', 'depth')}
+
+DEFAULT_SETTLE_S = 10.0
+DEFAULT_POLL_S = 2.0
+DEFAULT_WORKERS = 2
+
+
+class _FileState:
+    __slots__ = ('signature', 'changed', 'header')
+
+    def __init__(self, signature, changed):
+        self.signature = signature
+        self.changed = changed
+        self.header = None
+
+
+class WatchFolder:
+    """
+    Long-running watcher that analyses DICOM acquisitions as they are exported into a folder.
+
+    An acquisition is the set of files sharing a SeriesInstanceUID. It is taken once every file in its
+    folder has kept the same size and modification time for settle_s seconds (exports write files one
+    by one), then routed to an analysis by its headers and thumbnails (see Analysis.routing), copied
+    (or moved) into work_dir/<series UID> and run through Analysis.runner.run_job on a pool of
+    `workers` processes.
+    Each job writes its PDF and JSON results under output_dir/<machine>/ and records the results in the
+    results database. Series already handled are listed in work_dir/processed.txt, so a restart does
+    not analyse them again.
+
+    config: optional settings, e.g. loaded from a JSON/YAML file:
+        params:  {analysis: {parameter: value}}, e.g. {'picket-fence': {'mlc_type': 'AGILITY'}}
+        report:  report header fields (institution, department, measured_by; linac_ID overrides the
+                 machine name read from the DICOM headers)
+        quality: report quality; db: results database path (default: the GUI's); move: move, not copy
+    """
+
+    def __init__(self, folder, output_dir, work_dir=None, config=None, workers=DEFAULT_WORKERS,
+                 settle_s=DEFAULT_SETTLE_S, poll_s=DEFAULT_POLL_S):
+        self.folder = os.path.abspath(folder)
+        self.output_dir = os.path.abspath(output_dir)
+        self.work_dir = os.path.abspath(work_dir or os.path.join(self.output_dir, 'work'))
+        self.config = config or {}
+        self.workers = workers
+        self.settle_s = settle_s
+        self.poll_s = poll_s
+        self._files = {}
+        self._processed = set()
+        self._state_path = os.path.join(self.work_dir, 'processed.txt')
+        os.makedirs(self.work_dir, exist_ok=True)
+        if os.path.exists(self._state_path):
+            with open(self._state_path, encoding='utf-8') as f:
+                self._processed = {line.strip() for line in f if line.strip()}
+
+    def scan(self):
+        """Update the file states from the folder; returns the acquisitions ready to analyse as {uid: [headers]}."""
+        now = time.monotonic()
+        present = set()
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                present.add(path)
+                signature = (stat.st_size, stat.st_mtime_ns)
+                state = self._files.get(path)
+                if state is None or state.signature != signature:
+                    self._files[path] = _FileState(signature, now)
+        for path in set(self._files) - present:
+            del self._files[path]
+
+        # A folder still being written to holds back every acquisition in it
+        busy_dirs = {os.path.dirname(path) for path, state in self._files.items()
+                     if now - state.changed < self.settle_s}
+        series = defaultdict(list)
+        for path, state in self._files.items():
+            if os.path.dirname(path) in busy_dirs:
+                continue
+            if state.header is None:
+                try:
+                    state.header = read_header(path)
+                except Exception:
+                    # Not DICOM (or not readable): ignore it until it changes
+                    state.header = {}
+            uid = state.header.get('SeriesInstanceUID') or state.header.get('StudyInstanceUID')
+            if uid and uid not in self._processed:
+                series[uid].append(state.header)
+        return series
+
+    def jobs_for(self, uid, headers):
+        """Stage an acquisition into work_dir/<uid> and build its runner jobs; [] when it cannot be routed."""
+        analysis = route_series(headers)
+        if analysis is None or analysis not in ANALYSES:
+            log.warning(f"Series {uid}: QA type not recognised from the headers; skipped")
+            return []
+        stage_dir = os.path.join(self.work_dir, uid)
+        os.makedirs(stage_dir, exist_ok=True)
+        transfer = shutil.move if self.config.get('move') else shutil.copy2
+        staged = []
+        for header in headers:
+            target = os.path.join(stage_dir, header['filename'])
+            transfer(header['path'], target)
+            staged.append({**header, 'path': target})
+        return acquisition_jobs(analysis, uid, staged, stage_dir, self.output_dir, self.config)
+
+    def _mark_processed(self, uid):
+        self._processed.add(uid)
+        with open(self._state_path, 'a', encoding='utf-8') as f:
+            f.write(uid + '\n')
+
+    def run(self, stop_event=None, max_cycles=None):
+        """
+        Watch until stop_event is set (or Ctrl-C). At most `workers` analyses run at once; later
+        acquisitions wait in the queue. max_cycles bounds the number of scans (for tests).
+        """
+        log.info(f"Watching {self.folder} (reports in {self.output_dir}, {self.workers} worker(s))")
+        queue = AnalysisQueue(self.workers, os.path.join(self.output_dir, 'watch_log.jsonl'))
+        cycles = 0
+        try:
+            while not (stop_event is not None and stop_event.is_set()):
+                for uid, headers in self.scan().items():
+                    try:
+                        for job in self.jobs_for(uid, headers):
+                            queue.submit(job)
+                    except Exception as e:
+                        log.error(f"Series {uid}: could not be staged: {e}", exc_info=True)
+                    finally:
+                        # Never picked up twice, whatever happens to its analysis
+                        self._mark_processed(uid)
+                cycles += 1
+                if max_cycles is not None and cycles >= max_cycles:
+                    break
+                time.sleep(self.poll_s)
+        except KeyboardInterrupt:
+            log.info("Watcher stopped")
+            queue.close(cancel=True)
+        else:
+            queue.close()
+
+
+def acquisition_jobs(analysis, uid, headers, stage_dir, output_dir, config):
+    """
+    Runner jobs for one staged acquisition (headers: its header index entries, 'path' in stage_dir).
+    Reports and JSON results go to output_dir/<machine>/<acquired>_<analysis>_<uid>.*; single-image
+    analyses get one job per image. config as for WatchFolder; ValueError when it lacks a parameter
+    the analysis needs (REQUIRED_PARAMS).
+    """
+    params = dict((config.get('params') or {}).get(analysis) or {})
+    missing = [name for name in REQUIRED_PARAMS.get(analysis, ()) if name not in params]
+    if missing:
+        raise ValueError(f"{analysis} needs {', '.join(missing)} under params.{analysis} in the config")
+    headers = sorted(headers, key=gantry_sort_key)
+    report = config.get('report') or {}
+    machine = report.get('linac_ID') or machine_name(headers[0]) or 'unknown'
+    acquired = acquisition_datetime(headers[0])
+    stamp = (acquired or datetime.now()).strftime('%Y%m%d_%H%M%S')
+    out_dir = os.path.join(output_dir, _safe_name(machine))
+    os.makedirs(out_dir, exist_ok=True)
+
+    inputs = [header['path'] for header in headers] if analysis in SINGLE_FILE_ANALYSES else [stage_dir]
+    jobs = []
+    for i, input_path in enumerate(inputs):
+        stem = f"{stamp}_{analysis}_{uid[-8:]}" + (f"_{i + 1}" if len(inputs) > 1 else '')
+        jobs.append({
+            **report,
+            'analysis': analysis,
+            'input': input_path,
+            'params': dict(params),
+            'output': os.path.join(out_dir, f"{stem}.pdf"),
+            'results': [os.path.join(out_dir, f"{stem}.json")],
+            'db': config.get('db') or _default_db(),
+            'linac_ID': machine,
+            'measured_at': acquired.isoformat() if acquired else None,
+            'quality': config.get('quality'),
+            'series_uid': uid,
+        })
+    return jobs
+
+
+class AnalysisQueue:
+    """
+    Runs runner jobs on a pool of `workers` processes (so at most that many at once; the rest wait
+    in order) and appends each job's summary to log_path as one JSON line. submit is thread-safe.
+    Workers are spawned, not forked: the DICOM receiver submits from its pynetdicom threads.
+    """
+
+    def __init__(self, workers, log_path):
+        self.log_path = log_path
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        future = self._executor.submit(run_job, job)
+        future.add_done_callback(lambda done: self._finished(job, done))
+        return future
+
+    def _finished(self, job, future):
+        try:
+            summary = future.result()
+        except Exception as e:
+            summary = {'analysis': job['analysis'], 'input': job['input'], 'pdf': None,
+                       'status': 'error', 'error': str(e)}
+        summary['series_uid'] = job.get('series_uid')
+        with self._lock:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(summary, default=str) + '\n')
+        if summary['status'] == 'ok':
+            log.info(f"Job done: {summary['analysis']} -> {summary['pdf']}")
+        else:
+            log.error(f"Job failed: {summary['analysis']} on {summary['input']}: {summary.get('error')}")
+
+    def close(self, cancel=False):
+        """Wait for the queued jobs (or, with cancel, only for those already running)."""
+        self._executor.shutdown(wait=True, cancel_futures=cancel)
+
+
+def _safe_name(name):
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in str(name)).strip('._') or 'unknown'
+
+
+def _default_db():
+    from Analysis.results_db import DEFAULT_DB_PATH
+    return DEFAULT_DB_PATH
@@ -1,12 +1,13 @@
-from io import BytesIO
 import matplotlib.pyplot as plt
 from pylinac import WinstonLutz
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import Paragraph, Spacer, Image
-from PIL import Image as PILImage
+from reportlab.platypus import Paragraph, Spacer
 from logs.logger import setup_logger
+from Analysis.progress import notify
+from Analysis.results import QAResults, ReportElements, pylinac_results
+from Analysis.figures import DeferredFigure
 
 log = setup_logger("winstonlutz.py")
 
@@ -22,15 +23,18 @@ footer_style = ParagraphStyle(
     textColor=colors.black
 )
 
-def process_winstonlutz(folder_path, bb_size):
+def process_winstonlutz(folder_path, bb_size, progress=None):
     log.info(f"Winston Lutz Analysis started..")
     try:
+        notify(progress, "Loading images", 0.05)
         wl = WinstonLutz(folder_path)
+        notify(progress, "Finding BB and field in each image", 0.2)
         wl.analyze(bb_size_mm=bb_size)
 
         wl_results = wl.results()
         print(wl_results)
-        elements = []
+        elements = ReportElements(results=QAResults('winston-lutz', folder_path, pylinac_results(wl), bb_size=bb_size))
+        notify(progress, "Building report", 0.7)
         add_wl_results_to_pdf(elements, wl, wl_results)
     except Exception as e:
         print(f"Error Found: {e}")
@@ -39,6 +43,11 @@ def process_winstonlutz(folder_path, bb_size):
     log.info("Winston Lutz Analysis Completed and report generated")
     return elements
 
+def plot_with_fixed_legend(plot_func):
+    plot_func(show=False)
+    plt.legend(loc="upper right")  # Avoid slow 'best' setting
+
+
 def add_wl_results_to_pdf(elements, wl, wl_results):
     title = 'Winston-Lutz Analysis Report'
     elements.append(Paragraph(title, styles['Title']))
@@ -49,14 +58,6 @@ def add_wl_results_to_pdf(elements, wl, wl_results):
         elements.append(Paragraph(line, styles['Normal']))
     elements.append(Spacer(1, 12))
 
-    def save_plot_with_fixed_legend(plot_func):
-        buf = BytesIO()
-        plot_func(show=False)
-        plt.legend(loc="upper right")  # Avoid slow 'best' setting
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        return Image(buf, width=6 * inch, height=4 * inch)
-
-    elements.append(save_plot_with_fixed_legend(wl.plot_location))
-    elements.append(save_plot_with_fixed_legend(wl.plot_summary))
-    elements.append(save_plot_with_fixed_legend(wl.plot_images))
+    # Figures are drawn when the PDF is generated
+    for plot_func in (wl.plot_location, wl.plot_summary, wl.plot_images):
+        elements.append(DeferredFigure(plot_with_fixed_legend, plot_func, width=6 * inch, height=4 * inch))
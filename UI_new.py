@@ -2,6 +2,9 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import logging
 import os
+import queue
+import threading
+from datetime import datetime
 
 # Assuming logs.logger exists and setup_logger is defined there
 # If not, you might need a simple logger setup for standalone execution:
@@ -16,6 +19,29 @@ except ImportError:
     log.warning("Could not import custom logger. Using basic logging configuration.")
 
 
+# How often (ms) the GUI checks a running analysis for progress and results
+JOB_POLL_MS = 100
+
+# Delay (ms) after the window shows before the analysis modules are pre-imported in the background
+PREWARM_DELAY_MS = 500
+
+# QA type (and Picket Fence mode) selected for each analysis the image classifier can detect
+DETECTED_QA_TYPES = {
+    'picket-fence': ('PicketFence', 'Single'),
+    'picket-fence-multiple': ('PicketFence', 'Multiple'),
+    'starshot': ('StarShot', None),
+    'winston-lutz': ('WinstonLutz QA', None),
+    'catphantom': ('CatPhantom', None),
+    'leeds-tor': ('LeedsTOR', None),
+    'field-analysis': ('Field Analysis', None),
+}
+# QA types analysed from a folder of images
+FOLDER_QA_TYPES = ('WinstonLutz QA', 'CatPhantom')
+
+# Figure quality of the PDF report (see Analysis.figures.REPORT_QUALITIES)
+REPORT_QUALITIES = ('draft', 'standard', 'high', 'vector')
+
+
 class pyRTQAApp:
     def __init__(self, root):
         self.root = root
@@ -57,7 +83,13 @@ class pyRTQAApp:
         # self.style.configure('TText', background='white', foreground='#333333', font=('Consolas', 10))
 
         # Initialize results storage
-        self.generated_elements = []
+        self.generated_results = None  # QAResults of the current analysis
+        self.job = None  # BackgroundJob running the current analysis, then writing its reports
+        self.job_step = None  # What the job is running: 'analysis' or 'report'
+        self.report_linac_ID = None
+        self.detecting_path = None  # The selected file or folder whose QA type is being detected
+        self.analysis_started = None  # When the current analysis was started
+        self.results_recorded = False  # Its results go in the results database once, however many reports
 
         # Create a main frame
         main_frame = ttk.Frame(root, padding="10 10 10 10")  # Reduced main frame padding
@@ -117,12 +149,21 @@ class pyRTQAApp:
         button_frame = ttk.Frame(main_frame)
         button_frame.grid(row=row_idx, column=0, padx=8, pady=4, sticky='ew')  # Reduced padding
         button_frame.columnconfigure(0, weight=1)  # Center buttons
-        button_frame.columnconfigure(1, weight=1)  # Center buttons
+        button_frame.columnconfigure(2, weight=1)  # Center buttons
 
         self.process_button = ttk.Button(button_frame, text='⚙️ Process QA', command=self.process_qa)
         self.process_button.grid(row=0, column=0, padx=8, pady=4, sticky='e')  # Reduced padding
+        self.cancel_button = ttk.Button(button_frame, text='✖ Cancel', command=self.cancel_job, state='disabled')
+        self.cancel_button.grid(row=0, column=1, padx=8, pady=4)
         self.download_button = ttk.Button(button_frame, text='⬇️ Download PDF Report', command=self.download_pdf)
-        self.download_button.grid(row=0, column=1, padx=8, pady=4, sticky='w')  # Reduced padding
+        self.download_button.grid(row=0, column=2, padx=8, pady=4, sticky='w')  # Reduced padding
+        self.quality_var = tk.StringVar(value='standard')
+        ttk.Label(button_frame, text='Report quality:').grid(row=0, column=3, padx=(8, 2), pady=4, sticky='e')
+        self.quality_combobox = ttk.Combobox(button_frame, textvariable=self.quality_var, values=REPORT_QUALITIES,
+                                             state='readonly', width=9)
+        self.quality_combobox.grid(row=0, column=4, padx=(0, 8), pady=4, sticky='w')
+        self.progress_bar = ttk.Progressbar(button_frame, orient='horizontal', mode='determinate', maximum=100)
+        self.progress_bar.grid(row=1, column=0, columnspan=5, padx=8, pady=(0, 4), sticky='ew')
         main_frame.rowconfigure(row_idx, weight=0)  # This row should not expand vertically
         row_idx += 1
 
@@ -382,22 +423,69 @@ class pyRTQAApp:
 
         if file_path:  # Only update if a path was selected
             self.file_path_label.config(text=file_path)
+            self.check_qa_type(file_path)
         else:
             self.file_path_label.config(text="No file or folder selected.")
 
+    def check_qa_type(self, file_path):
+        """
+        Detect the QA type of the selected images from their headers and thumbnails, in a worker thread
+        so the window stays responsive while they are read; apply_detected_qa_type then acts on it.
+        """
+        self.detecting_path = file_path
+        detected = queue.SimpleQueue()
+        threading.Thread(target=self._detect_qa_type, args=(file_path, detected), daemon=True).start()
+        self.root.after(JOB_POLL_MS, self.poll_detection, file_path, detected)
+
+    @staticmethod
+    def _detect_qa_type(file_path, detected):
+        try:
+            from Analysis.routing import detect_path
+            detected.put(detect_path(file_path))
+        except Exception as e:
+            log.warning(f"Could not detect the QA type of {file_path}: {e}", exc_info=True)
+            detected.put(None)
+
+    def poll_detection(self, file_path, detected):
+        if detected.empty():
+            self.root.after(JOB_POLL_MS, self.poll_detection, file_path, detected)
+            return
+        analysis = detected.get()
+        # Another file or folder was chosen meanwhile, or an analysis started: this one no longer applies
+        if file_path != self.detecting_path or (self.job is not None and self.job.is_running):
+            return
+        self.detecting_path = None
+        self.apply_detected_qa_type(file_path, analysis)
+
+    def apply_detected_qa_type(self, file_path, analysis):
+        """
+        Select the detected QA type when none is selected, or offer to switch when another one is;
+        the path to analyse becomes the file's folder when the detected analysis takes a folder.
+        """
+        if analysis not in DETECTED_QA_TYPES:
+            return
+        qa_type, pf_mode = DETECTED_QA_TYPES[analysis]
+        selected = self.qa_type_var.get()
+        log.info(f"Detected QA type of {file_path}: {qa_type}")
+        # Both field analyses take an open field
+        if selected == qa_type or (analysis == 'field-analysis' and selected == 'FFF Field Analysis-AERB'):
+            return
+        if selected and not messagebox.askyesno(
+                "QA Type", f"The selected images look like {qa_type}, not {selected}.\nSwitch to {qa_type}?"):
+            return
+        self.qa_type_var.set(qa_type)
+        self.update_ui_for_qa_type(None)
+        if pf_mode:
+            self.pf_type_var.set(pf_mode)
+        if (qa_type in FOLDER_QA_TYPES or pf_mode == 'Multiple') and os.path.isfile(file_path):
+            self.file_path_label.config(text=os.path.dirname(file_path))
+
     def process_qa(self):
         log.info("Starting QA processing...")
         try:
-            from Analysis.fffanalysis import process_fff_analysis
-            from Analysis.FFF_FA_2D import process_fffFA_analysis
-            from Analysis.FieldAnalysis import process_FA
-            from Analysis.winstonlutz import process_winstonlutz
-            from Analysis.catphantom import process_catphantom
-            from Analysis.picketfenceqa import process_picketfence
-            from Analysis.Picketfence_batch import analyze_picketfence_multiple
-            from Analysis.StarShot import process_starshot
-            from Analysis.Leeds_TOR import process_leedsTOR
-            from Analysis.generatepdf import generate_pdf  # Import here to ensure it's available
+            if self.job is not None and self.job.is_running:
+                messagebox.showinfo("Busy", "An analysis is already running. Cancel it or wait for it to finish.")
+                return
 
             qa_type = self.qa_type_var.get()
             file_path = self.file_path_label.cget("text")  # Get current path from label
@@ -409,15 +497,10 @@ class pyRTQAApp:
                 messagebox.showwarning("Input Error", "Please select a QA Type from the dropdown menu.")
                 return
 
-            self.results_text.delete(1.0, tk.END)
-            self.results_text.insert(tk.END, "Processing... Please wait.\n")
-            self.root.update_idletasks()  # Update UI to show message
-
-            elements = []
+            # Inputs are validated here; the analysis itself runs in a background process
             if qa_type == 'FFF Field Analysis-AERB':
                 energy = self.energy_entry.get()
                 depth = self.depth_entry.get()
-                file_type = 'DICOM' if file_path.lower().endswith('.dcm') else 'TIFF'  # Assuming TIFF for non-DICOM
                 if not energy or not depth:
                     messagebox.showwarning("Warning", "Please enter Energy and Depth for FFF Analysis.")
                     return
@@ -429,9 +512,10 @@ class pyRTQAApp:
                     return
 
                 if self.data_type_var.get() == 'RFA':
-                    elements = process_fff_analysis(file_path, energy, depth)
+                    analysis = 'fff-rfa'
                 else:  # For '2D Image Data'
-                    elements = process_fffFA_analysis(file_path, file_type, energy, depth)
+                    analysis = 'fff-2d'
+                params = {'energy': energy, 'depth': depth}
             elif qa_type == 'Field Analysis':
                 energy = self.energy_entry.get()
                 depth = self.depth_entry.get()
@@ -444,7 +528,7 @@ class pyRTQAApp:
                 except ValueError:
                     messagebox.showerror("Error", "Energy and Depth must be numeric values.")
                     return
-                elements = process_FA(file_path, energy, depth)
+                analysis, params = 'field-analysis', {'energy': energy, 'depth': depth}
             elif qa_type == 'WinstonLutz QA':
                 bb_size_str = self.bb_size_entry.get()
                 try:
@@ -452,13 +536,13 @@ class pyRTQAApp:
                 except ValueError:
                     messagebox.showerror("Error", "Please enter a valid numeric BB size (e.g., 8.0).")
                     return
-                elements = process_winstonlutz(file_path, bb_size)
+                analysis, params = 'winston-lutz', {'bb_size': bb_size}
             elif qa_type == 'CatPhantom':
                 phantom_type = self.phantom_type_combobox.get()
                 if not phantom_type or phantom_type == "--- Select Phantom Type ---":  # Check for placeholder
                     messagebox.showwarning("Input Error", "Please select a Phantom Type for CatPhantom QA.")
                     return
-                elements = process_catphantom(file_path, phantom_type)
+                analysis, params = 'catphantom', {'phantom_type': phantom_type}
             elif qa_type == 'PicketFence':
                 try:
                     tolerance_str = self.tolerance_entry.get()
@@ -482,36 +566,121 @@ class pyRTQAApp:
                                          "Please enter valid numeric values for tolerance, action level, and nominal gap.")
                     return
 
-                if self.pf_type_var.get() == 'Multiple':
-                    elements = analyze_picketfence_multiple(file_path, tolerance, action_level, mlc_type,
-                                                            separate_leaves=separate_leaves, nominal_gap=nominal_gap)
-                else:
-                    elements = process_picketfence(file_path, tolerance, action_level, mlc_type,
-                                                   separate_leaves=separate_leaves, nominal_gap=nominal_gap)
+                analysis = 'picket-fence-multiple' if self.pf_type_var.get() == 'Multiple' else 'picket-fence'
+                params = {'tolerance': tolerance, 'action_level': action_level, 'mlc_type': mlc_type,
+                          'separate_leaves': separate_leaves, 'nominal_gap': nominal_gap}
             elif qa_type == 'StarShot':
-                elements = process_starshot(file_path)
+                analysis, params = 'starshot', {}
 
             elif qa_type == 'LeedsTOR':
-                elements = process_leedsTOR(file_path)
+                analysis, params = 'leeds-tor', {}
             else:
                 messagebox.showwarning("Invalid QA Type", "Please select a valid QA type to proceed.")
                 return
 
-            # Display results
-            self.results_text.delete(1.0, tk.END)
-            self.results_text.insert(tk.END,
-                                     "Processing complete. Click 'Download PDF' to review the results and save the report.")
-            self.generated_elements = elements
-            log.info("QA Process completed successfully.")
+            self.start_job(analysis, file_path, params)
         except Exception as e:
             log.error(f"Error during QA Processing: {e}", exc_info=True)
             messagebox.showerror("Processing Error",
                                  f"An unexpected error occurred during processing: {e}\nCheck logs for more details.")
 
+    def start_job(self, analysis, file_path, params):
+        from Analysis.background import BackgroundJob
+
+        if self.job is not None:
+            # Its process holds the previous analysis for reports; the new one replaces it
+            self.job.close()
+        self.generated_results = None
+        self.analysis_started = datetime.now()
+        self.results_recorded = False
+        self.results_text.delete(1.0, tk.END)
+        self.results_text.insert(tk.END, "Processing... Please wait.\n")
+        self.progress_bar['value'] = 0
+        self.set_job_buttons(running=True)
+
+        self.job_step = 'analysis'
+        self.job = BackgroundJob(analysis, file_path, params).start()
+        self.root.after(JOB_POLL_MS, self.poll_job)
+
+    def set_job_buttons(self, running):
+        state = ['disabled'] if running else ['!disabled']
+        self.process_button.state(state)
+        self.download_button.state(state)
+        self.cancel_button.state(['!disabled'] if running else ['disabled'])
+
+    def poll_job(self):
+        """Apply the background job's progress and results (of the analysis, or of a report) on the Tk thread."""
+        job = self.job
+        for event in job.poll():
+            kind = event[0]
+            if kind == 'progress':
+                _, stage, fraction = event
+                self.progress_bar['value'] = fraction * 100
+                self.results_text.delete(1.0, tk.END)
+                action = "Writing report" if self.job_step == 'report' else "Processing"
+                self.results_text.insert(tk.END, f"{action}... {stage}\n")
+            elif kind == 'done':
+                self.generated_results = event[1]
+                self.progress_bar['value'] = 100
+                self.results_text.delete(1.0, tk.END)
+                self.results_text.insert(tk.END,
+                                         "Processing complete. Click 'Download PDF' to review the results and save the report.")
+                log.info("QA Process completed successfully.")
+            elif kind == 'report':
+                self.progress_bar['value'] = 100
+                self.results_text.delete(1.0, tk.END)
+                self.results_text.insert(tk.END, f"Report saved to {event[1]}\n")
+                self.record_results(self.report_linac_ID)
+                log.info(f"PDF generation completed. Report saved to: {event[1]}")
+                messagebox.showinfo("Success", "PDF report generated successfully!")
+            elif kind == 'cancelled':
+                self.progress_bar['value'] = 0
+                self.results_text.delete(1.0, tk.END)
+                if self.job_step == 'report':
+                    self.results_text.insert(tk.END, "Report cancelled.\n")
+                    log.info("PDF generation cancelled by user.")
+                else:
+                    self.results_text.insert(tk.END, "Processing cancelled.\n")
+                    log.info("QA Process cancelled by user.")
+            elif kind == 'error':
+                self.results_text.delete(1.0, tk.END)
+                if self.job_step == 'report':
+                    log.error(f"Error during PDF report generation: {event[1]}")
+                    messagebox.showerror("Report Generation Error",
+                                         f"An unexpected error occurred while generating the PDF: {event[1]}\nCheck logs for more details.")
+                else:
+                    log.error(f"Error during QA Processing: {event[1]}")
+                    messagebox.showerror("Processing Error",
+                                         f"An unexpected error occurred during processing: {event[1]}\nCheck logs for more details.")
+
+        if job.is_running:
+            self.root.after(JOB_POLL_MS, self.poll_job)
+        else:
+            self.set_job_buttons(running=False)
+
+    def prewarm(self):
+        """
+        Once the window is up, start a standby analysis process that imports the heavy analysis stack
+        for the next job. PYRTQA_PREWARM=0 turns it off.
+        """
+        if os.getenv('PYRTQA_PREWARM', '1') == '0':
+            return
+        try:
+            from Analysis.background import prewarm
+            prewarm()
+        except Exception as e:
+            log.warning(f"Could not start the standby analysis process: {e}", exc_info=True)
+
+    def cancel_job(self):
+        if self.job is not None and self.job.is_running:
+            self.results_text.delete(1.0, tk.END)
+            self.results_text.insert(tk.END, "Cancelling...\n")
+            self.job.cancel()
+
     def download_pdf(self):
+        """Write the PDF report in the analysis' background process (see BackgroundJob.report)."""
         log.info("PDF generation started.")
         try:
-            from Analysis.generatepdf import generate_pdf
             institution = self.institution_entry.get()
             department = self.department_entry.get()
             linac_ID = self.linac_ID_entry.get()
@@ -521,26 +690,40 @@ class pyRTQAApp:
                 messagebox.showwarning("Input Error",
                                        "Please fill in Institution Name, Department Name, and Measured by fields before generating PDF.")
                 return
-            if not self.generated_elements:
+            if self.job is not None and self.job.is_running:
+                messagebox.showinfo("Busy", "Wait for the analysis or report to finish, or cancel it.")
+                return
+            if self.job is None or not self.job.can_report:
                 messagebox.showwarning("No Results", "No QA results to generate PDF. Please process QA first.")
                 return
 
             pdf_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")],
                                                     title="Save QA Report As")
             if pdf_path:
-                generate_pdf(self.generated_elements, institution, department, linac_ID, measured_by, pdf_path)
-                messagebox.showinfo("Success", "PDF report generated successfully!")
-                log.info(f"PDF generation completed. Report saved to: {pdf_path}")
+                self.job.report(institution, department, linac_ID, measured_by, pdf_path, self.quality_var.get())
+                self.job_step, self.report_linac_ID = 'report', linac_ID
+                self.progress_bar['value'] = 0
+                self.results_text.delete(1.0, tk.END)
+                self.results_text.insert(tk.END, "Writing report... Please wait.\n")
+                self.set_job_buttons(running=True)
+                self.root.after(JOB_POLL_MS, self.poll_job)
             else:
                 log.info("PDF generation cancelled by user.")
-        except ImportError:
-            log.error("Could not import Analysis.generatepdf. Make sure the module exists.", exc_info=True)
-            messagebox.showerror("Error", "PDF generation module not found. Cannot generate report.")
         except Exception as e:
             log.error(f"Error during PDF report generation: {e}", exc_info=True)
             messagebox.showerror("Report Generation Error",
                                  f"An unexpected error occurred while generating the PDF: {e}\nCheck logs for more details.")
 
+    def record_results(self, linac_ID):
+        """Keep the analysis' numbers in the local results database for trending, once; never blocks the report."""
+        try:
+            from Analysis.results_db import record_results
+            if not self.results_recorded:
+                run_id = record_results(self.generated_results, linac_ID, ran_at=self.analysis_started)
+                self.results_recorded = run_id is not None
+        except Exception as e:
+            log.warning(f"Could not store results in the results database: {e}", exc_info=True)
+
     def show_about(self):
         messagebox.showinfo("About pyRTQA", "pyRTQA v3.2.0\n"
                                             "Developed by Sambasivaselli R, Medical Physicist, India\n"
@@ -598,6 +781,11 @@ class pyRTQAApp:
 
 
 if __name__ == "__main__":
+    # Analyses run in spawned processes; required for frozen (PyInstaller) builds
+    import multiprocessing
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = pyRTQAApp(root)
+    # Heavy imports start only after the window has been drawn
+    root.after(PREWARM_DELAY_MS, app.prewarm)
     root.mainloop()
@@ -1,7 +1,7 @@
 from PyInstaller.utils.hooks import collect_submodules, collect_data_files
 
-# Collect all submodules of scipy
-hiddenimports = collect_submodules('scipy')
+# Collect the submodules of scipy, without its test suites (a large share of the bundle to unpack at startup)
+hiddenimports = collect_submodules('scipy', filter=lambda name: '.tests' not in name and not name.endswith('.conftest'))
 
 # Collect data files of scipy.special
 datas = collect_data_files('scipy.special')
\ No newline at end of file
@@ -6,8 +6,8 @@ import os
 def setup_logger(name):
     """Creates and returns a logger with rotating file handler."""
 
-    # Get path to LOCALAPPDATA
-    local_appdata = os.getenv("LOCALAPPDATA")
+    # Get path to LOCALAPPDATA (falls back to the home directory on Linux/macOS servers)
+    local_appdata = os.getenv("LOCALAPPDATA") or os.path.expanduser("~")
     log_dir = os.path.join(local_appdata, "pyRTQA", "logs")
 
     # Ensure log directory exists
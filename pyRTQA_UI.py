@@ -1,9 +1,37 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import logging
+import os
+import queue
+import threading
+from datetime import datetime
 from logs.logger import setup_logger
 
 log = setup_logger("pyRTQA_UI.py")
+
+# How often (ms) the GUI checks a running analysis for progress and results
+JOB_POLL_MS = 100
+
+# Delay (ms) after the window shows before the analysis modules are pre-imported in the background
+PREWARM_DELAY_MS = 500
+
+# QA type (and Picket Fence mode) selected for each analysis the image classifier can detect
+DETECTED_QA_TYPES = {
+    'picket-fence': ('PicketFence', 'Single'),
+    'picket-fence-multiple': ('PicketFence', 'Multiple'),
+    'starshot': ('StarShot', None),
+    'winston-lutz': ('WinstonLutz QA', None),
+    'catphantom': ('CatPhantom', None),
+    'leeds-tor': ('LeedsTOR', None),
+    'field-analysis': ('Field Analysis', None),
+}
+# QA types analysed from a folder of images
+FOLDER_QA_TYPES = ('WinstonLutz QA', 'CatPhantom')
+
+# Figure quality of the PDF report (see Analysis.figures.REPORT_QUALITIES)
+REPORT_QUALITIES = ('draft', 'standard', 'high', 'vector')
+
+
 class pyRTQAApp:
     def __init__(self, root):
         self.root = root
@@ -15,7 +43,13 @@ class pyRTQAApp:
 
         # Initialize results storage
         # self.results = None
-        self.generated_elements = []
+        self.generated_results = None  # QAResults of the current analysis
+        self.job = None  # BackgroundJob running the current analysis, then writing its reports
+        self.job_step = None  # What the job is running: 'analysis' or 'report'
+        self.report_linac_ID = None
+        self.detecting_path = None  # The selected file or folder whose QA type is being detected
+        self.analysis_started = None  # When the current analysis was started
+        self.results_recorded = False  # Its results go in the results database once, however many reports
 
         # Create a main frame
         main_frame = tk.Frame(root, bg='#f0f0f0')
@@ -62,9 +96,22 @@ class pyRTQAApp:
         self.process_button = tk.Button(button_frame, text='Process', command=self.process_qa, bg='#004080', fg='white')
         self.process_button.pack(side=tk.LEFT, padx=20, pady=5)
 
+        self.cancel_button = tk.Button(button_frame, text='Cancel', command=self.cancel_job, bg='#004080', fg='white',
+                                       state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=20, pady=5)
+
         self.download_button = tk.Button(button_frame, text='Download PDF', command=self.download_pdf, bg='#004080', fg='white')
         self.download_button.pack(side=tk.LEFT, padx=20, pady=5)
 
+        tk.Label(button_frame, text='Report quality:', bg='#f0f0f0').pack(side=tk.LEFT, padx=(20, 5), pady=5)
+        self.quality_var = tk.StringVar(value='standard')
+        self.quality_combobox = ttk.Combobox(button_frame, textvariable=self.quality_var, values=REPORT_QUALITIES,
+                                             state='readonly', width=9)
+        self.quality_combobox.pack(side=tk.LEFT, pady=5)
+
+        self.progress_bar = ttk.Progressbar(main_frame, orient='horizontal', mode='determinate', maximum=100)
+        self.progress_bar.pack(anchor=tk.W, padx=20, pady=5, fill=tk.X)
+
         # Footer label
         self.developed_by_label = tk.Label(main_frame, text='Developed by Sambasivaselli_R@pyRTQA', font=('Arial', 8), bg='#f0f0f0')
         self.developed_by_label.pack(side=tk.RIGHT, anchor=tk.SE, padx=10, pady=10)
@@ -281,11 +328,68 @@ class pyRTQAApp:
             self.file_path_label.config(text="")
         else:
             self.file_path_label.config(text=file_path)
+            self.check_qa_type(file_path)
 
 
+    def check_qa_type(self, file_path):
+        """
+        Detect the QA type of the selected images from their headers and thumbnails, in a worker thread
+        so the window stays responsive while they are read; apply_detected_qa_type then acts on it.
+        """
+        self.detecting_path = file_path
+        detected = queue.SimpleQueue()
+        threading.Thread(target=self._detect_qa_type, args=(file_path, detected), daemon=True).start()
+        self.root.after(JOB_POLL_MS, self.poll_detection, file_path, detected)
+
+    @staticmethod
+    def _detect_qa_type(file_path, detected):
+        try:
+            from Analysis.routing import detect_path
+            detected.put(detect_path(file_path))
+        except Exception as e:
+            log.warning(f"Could not detect the QA type of {file_path}: {e}", exc_info=True)
+            detected.put(None)
+
+    def poll_detection(self, file_path, detected):
+        if detected.empty():
+            self.root.after(JOB_POLL_MS, self.poll_detection, file_path, detected)
+            return
+        analysis = detected.get()
+        # Another file or folder was chosen meanwhile, or an analysis started: this one no longer applies
+        if file_path != self.detecting_path or (self.job is not None and self.job.is_running):
+            return
+        self.detecting_path = None
+        self.apply_detected_qa_type(file_path, analysis)
+
+    def apply_detected_qa_type(self, file_path, analysis):
+        """
+        Select the detected QA type when none is selected, or offer to switch when another one is;
+        the path to analyse becomes the file's folder when the detected analysis takes a folder.
+        """
+        if analysis not in DETECTED_QA_TYPES:
+            return
+        qa_type, pf_mode = DETECTED_QA_TYPES[analysis]
+        selected = self.qa_type_var.get()
+        log.info(f"Detected QA type of {file_path}: {qa_type}")
+        # Both field analyses take an open field
+        if selected == qa_type or (analysis == 'field-analysis' and selected == 'FFF Field Analysis-AERB'):
+            return
+        if selected and not messagebox.askyesno(
+                "QA Type", f"The selected images look like {qa_type}, not {selected}.\nSwitch to {qa_type}?"):
+            return
+        self.qa_type_var.set(qa_type)
+        self.update_ui_for_qa_type(None)
+        if pf_mode:
+            self.pf_type_var.set(pf_mode)
+        if (qa_type in FOLDER_QA_TYPES or pf_mode == 'Multiple') and os.path.isfile(file_path):
+            self.file_path_label.config(text=os.path.dirname(file_path))
+
     def process_qa(self):
         log.info("Starting QA processing...")
         try:
+            if self.job is not None and self.job.is_running:
+                messagebox.showinfo("Busy", "An analysis is already running. Cancel it or wait for it to finish.")
+                return
             qa_type = self.qa_type_var.get()
             # qa_type = self.qa_type_combobox.get()
             file_path = self.file_path_label.cget("text").replace("File Path: ", "")
@@ -296,24 +400,22 @@ class pyRTQAApp:
 
             self.results_text.delete(1.0, tk.END)
 
-            elements = []
+            # Inputs are read here; the analysis itself runs in a background process
             if qa_type == 'FFF Field Analysis-AERB':
-                from Analysis.fffanalysis import process_fff_analysis
-                from Analysis.FFF_FA_2D import process_fffFA_analysis
                 self.energy = self.energy_entry.get()
                 self.depth = self.depth_entry.get()
-                file_type = 'DICOM' if file_path.lower().endswith('.dcm') else 'TIFF'
                 if not self.energy or not self.depth:
                     messagebox.showwarning("Warning", "Please enter energy and depth for FFF Analysis.")
                     return
                 if self.data_type_var.get() == 'RFA':
-                    elements = process_fff_analysis(file_path, self.energy, self.depth)
+                    analysis, params = 'fff-rfa', {'energy': self.energy, 'depth': self.depth}
                 else:  # For '2D Image Data'
                     vendor = self.vendor_var.get() if hasattr(self, 'vendor_var') else 'Elekta'
                     invert_profile = (str(vendor).strip().lower() == 'elekta')
 
-                    elements = process_fffFA_analysis(file_path, file_type, self.energy, self.depth,
-                                                      vendor=vendor, invert_profile=invert_profile)
+                    analysis = 'fff-2d'
+                    params = {'energy': self.energy, 'depth': self.depth,
+                              'vendor': vendor, 'invert_profile': invert_profile}
 
             elif qa_type == 'Field Analysis':
 
@@ -322,29 +424,24 @@ class pyRTQAApp:
                 if not self.energy or not self.depth:
                     messagebox.showwarning("Warning", "Please enter energy and depth for FFF Analysis.")
                     return
-                from Analysis.FieldAnalysis import process_FA
-                elements = process_FA(file_path, self.energy, self.depth)
+                analysis, params = 'field-analysis', {'energy': self.energy, 'depth': self.depth}
             elif qa_type == 'WinstonLutz QA':
-                from Analysis.winstonlutz import process_winstonlutz
                 try:
                     bb_size = float(self.bb_size_entry.get()) if self.bb_size_entry else 8.0
                 except ValueError:
                     messagebox.showerror("Error", "Please enter a valid BB size.")
                     return
-                elements = process_winstonlutz(file_path, bb_size)
+                analysis, params = 'winston-lutz', {'bb_size': bb_size}
             elif qa_type == 'CatPhantom':
-                from Analysis.catphantom import process_catphantom
                 phantom_type = self.phantom_type_combobox.get()
-                elements = process_catphantom(file_path, phantom_type)
+                analysis, params = 'catphantom', {'phantom_type': phantom_type}
             elif qa_type == 'PicketFence':
-                from Analysis.picketfenceqa import process_picketfence
-                from Analysis.Picketfence_batch import analyze_picketfence_multiple
                 try:
                     tolerance = float(self.tolerance_entry.get()) if self.tolerance_entry else 0.2
                     action_level = float(self.action_level_entry.get()) if self.action_level_entry else 0.1
                     mlc_type = self.mlc_type_combobox.get()
                     separate_leaves = self.separate_leaves_var.get()
-                    selected_path = self.file_path_label['text']
+                    file_path = self.file_path_label['text']
 
                     # Convert nominal_gap to float if separate_leaves is true
                     nominal_gap = float(
@@ -354,41 +451,124 @@ class pyRTQAApp:
                     messagebox.showerror("Error",
                                          "Please enter valid numeric values for tolerance, action level, and nominal gap.")
                     return
-                if self.pf_type_var.get() == 'Multiple':
-                    elements = analyze_picketfence_multiple(selected_path, tolerance, action_level, mlc_type,
-                                                            separate_leaves=separate_leaves, nominal_gap=nominal_gap)
-                else:
-                    # Call the function with nominal_gap if separate_leaves is true, otherwise pass None
-                    elements = process_picketfence(selected_path, tolerance, action_level, mlc_type,
-                                               separate_leaves=separate_leaves, nominal_gap=nominal_gap)
+                analysis = 'picket-fence-multiple' if self.pf_type_var.get() == 'Multiple' else 'picket-fence'
+                params = {'tolerance': tolerance, 'action_level': action_level, 'mlc_type': mlc_type,
+                          'separate_leaves': separate_leaves, 'nominal_gap': nominal_gap}
             elif qa_type == 'StarShot':
-                from Analysis.StarShot import process_starshot
-                elements = process_starshot(file_path)
+                analysis, params = 'starshot', {}
 
             elif qa_type == 'LeedsTOR':
+                analysis, params = 'leeds-tor', {}
+            else:
+                return
 
-                from Analysis.Leeds_TOR import process_leedsTOR
-                elements = process_leedsTOR(file_path)
-
-            # Display results
-            self.results_text.insert(tk.END,
-                                     "Processing complete. Click 'Download PDF' to review the results and   save the report.")
-            self.generated_elements = elements
-            log.info("QA Process completed.")
+            self.start_job(analysis, file_path, params)
         except Exception as e:
             # log with exception information for easier debugging
             log.error(f"Error in QA Processing: {e}", exc_info=True)
             # give the user a friendly message too
             messagebox.showerror("Processing Error", f"An error occurred during QA processing:\n{str(e)}")
 
+    def start_job(self, analysis, file_path, params):
+        from Analysis.background import BackgroundJob
+
+        if self.job is not None:
+            # Its process holds the previous analysis for reports; the new one replaces it
+            self.job.close()
+        self.generated_results = None
+        self.analysis_started = datetime.now()
+        self.results_recorded = False
+        self.results_text.insert(tk.END, "Processing... Please wait.\n")
+        self.progress_bar['value'] = 0
+        self.set_job_buttons(running=True)
+
+        self.job_step = 'analysis'
+        self.job = BackgroundJob(analysis, file_path, params).start()
+        self.root.after(JOB_POLL_MS, self.poll_job)
+
+    def set_job_buttons(self, running):
+        state = tk.DISABLED if running else tk.NORMAL
+        self.process_button.config(state=state)
+        self.download_button.config(state=state)
+        self.cancel_button.config(state=tk.NORMAL if running else tk.DISABLED)
+
+    def poll_job(self):
+        """Apply the background job's progress and results (of the analysis, or of a report) on the Tk thread."""
+        job = self.job
+        for event in job.poll():
+            kind = event[0]
+            if kind == 'progress':
+                _, stage, fraction = event
+                self.progress_bar['value'] = fraction * 100
+                self.results_text.delete(1.0, tk.END)
+                action = "Writing report" if self.job_step == 'report' else "Processing"
+                self.results_text.insert(tk.END, f"{action}... {stage}\n")
+            elif kind == 'done':
+                self.generated_results = event[1]
+                self.progress_bar['value'] = 100
+                self.results_text.delete(1.0, tk.END)
+                self.results_text.insert(tk.END,
+                                         "Processing complete. Click 'Download PDF' to review the results and   save the report.")
+                log.info("QA Process completed.")
+            elif kind == 'report':
+                self.progress_bar['value'] = 100
+                self.results_text.delete(1.0, tk.END)
+                self.results_text.insert(tk.END, f"Report saved to {event[1]}\n")
+                self.record_results(self.report_linac_ID)
+                log.info("PDF generation completed")
+                messagebox.showinfo("Success", "PDF report generated successfully!")
+            elif kind == 'cancelled':
+                self.progress_bar['value'] = 0
+                self.results_text.delete(1.0, tk.END)
+                if self.job_step == 'report':
+                    self.results_text.insert(tk.END, "Report cancelled.\n")
+                    log.info("PDF generation cancelled.")
+                else:
+                    self.results_text.insert(tk.END, "Processing cancelled.\n")
+                    log.info("QA Process cancelled.")
+            elif kind == 'error':
+                self.results_text.delete(1.0, tk.END)
+                if self.job_step == 'report':
+                    log.error(f"Error in report generation: {event[1]}")
+                    messagebox.showerror("PDF Error", f"Failed to generate PDF:\n{event[1]}")
+                else:
+                    log.error(f"Error in QA Processing: {event[1]}")
+                    messagebox.showerror("Processing Error", f"An error occurred during QA processing:\n{event[1]}")
+
+        if job.is_running:
+            self.root.after(JOB_POLL_MS, self.poll_job)
+        else:
+            self.set_job_buttons(running=False)
+
+    def prewarm(self):
+        """
+        Once the window is up, start a standby analysis process that imports the heavy analysis stack
+        for the next job. PYRTQA_PREWARM=0 turns it off.
+        """
+        if os.getenv('PYRTQA_PREWARM', '1') == '0':
+            return
+        try:
+            from Analysis.background import prewarm
+            prewarm()
+        except Exception as e:
+            log.warning(f"Could not start the standby analysis process: {e}", exc_info=True)
+
+    def cancel_job(self):
+        if self.job is not None and self.job.is_running:
+            self.results_text.delete(1.0, tk.END)
+            self.results_text.insert(tk.END, "Cancelling...\n")
+            self.job.cancel()
 
     def download_pdf(self):
+        """Write the PDF report in the analysis' background process (see BackgroundJob.report)."""
         log.info("PDF generation started")
         try:
-            if not getattr(self, 'generated_elements', None):
+            if self.job is not None and self.job.is_running:
+                messagebox.showinfo("Busy", "Wait for the analysis or report to finish, or cancel it.")
+                return
+            if self.job is None or not self.job.can_report:
                 messagebox.showwarning("No Results", "No generated report elements to save. Run Process first.")
                 return
-            from Analysis.generatepdf import generate_pdf
             institution = self.institution_entry.get()
             department = self.department_entry.get()
             linac_ID = self.linac_ID_entry.get()
@@ -399,13 +579,27 @@ class pyRTQAApp:
 
             pdf_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
             if pdf_path:
-                generate_pdf(self.generated_elements, institution, department, linac_ID, measured_by, pdf_path)
-                messagebox.showinfo("Success", "PDF report generated successfully!")
-            log.info("PDF generation completed")
+                self.job.report(institution, department, linac_ID, measured_by, pdf_path, self.quality_var.get())
+                self.job_step, self.report_linac_ID = 'report', linac_ID
+                self.progress_bar['value'] = 0
+                self.results_text.delete(1.0, tk.END)
+                self.results_text.insert(tk.END, "Writing report... Please wait.\n")
+                self.set_job_buttons(running=True)
+                self.root.after(JOB_POLL_MS, self.poll_job)
         except Exception as e:
             log.error(f"Error in report generation: {e}", exc_info=True)
             messagebox.showerror("PDF Error", f"Failed to generate PDF:\n{str(e)}")
 
+    def record_results(self, linac_ID):
+        """Keep the analysis' numbers in the local results database for trending, once; never blocks the report."""
+        try:
+            from Analysis.results_db import record_results
+            if not self.results_recorded:
+                run_id = record_results(self.generated_results, linac_ID, ran_at=self.analysis_started)
+                self.results_recorded = run_id is not None
+        except Exception as e:
+            log.warning(f"Could not store results in the results database: {e}", exc_info=True)
+
     def show_about(self):
         messagebox.showinfo("About pyRTQA", "pyRTQA v3.2.0\n"
         "Developed by Sambasivaselli R, Medical Physicist, India\n"
@@ -446,6 +640,11 @@ class pyRTQAApp:
         text_area.config(state=tk.DISABLED)  # Make text read-only
 
 if __name__ == "__main__":
+    # Analyses run in spawned processes; required for frozen (PyInstaller) builds
+    import multiprocessing
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = pyRTQAApp(root)
+    # Heavy imports start only after the window has been drawn
+    root.after(PREWARM_DELAY_MS, app.prewarm)
     root.mainloop()
@@ -0,0 +1,286 @@
+"""
+Headless command-line runner for the pyRTQA analyses (no Tkinter required).
+
+Examples:
+    python pyRTQA_cli.py starshot star.dcm -o starshot.pdf
+    python pyRTQA_cli.py winston-lutz wl_folder --bb-size 8 --results wl.json --results wl.csv
+    python pyRTQA_cli.py picket-fence pf.dcm --mlc-type MILLENNIUM --tolerance 0.5 --action-level 0.3
+    python pyRTQA_cli.py auto unknown_image.dcm --results unknown.json
+    python pyRTQA_cli.py auto pf_folder --mlc-type AGILITY --config watch.yaml
+    python pyRTQA_cli.py detect exports/*.dcm wl_folder
+    python pyRTQA_cli.py run jobs.yaml --workers 4 --json summary.json
+    python pyRTQA_cli.py watch /exports/epid --output-dir /qa/reports --config watch.yaml
+    python pyRTQA_cli.py receive --output-dir /qa/reports --port 11112 --ae-title PYRTQA --config watch.yaml
+"""
+import argparse
+import os
+import sys
+
+# Render with Agg: no display is needed on a server
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+from Analysis.runner import ANALYSES, AUTO_ANALYSIS, REPORT_QUALITIES, run_jobs, load_job_file, write_json
+
+MLC_TYPES = ['MILLENNIUM', 'HD_MILLENNIUM', 'AGILITY', 'BMOD', 'MLCI', 'HALCYON_DISTAL', 'HALCYON_PROXIMAL']
+PHANTOM_TYPES = ['CatPhan503', 'CatPhan504', 'CatPhan600', 'CatPhan604']
+
+
+def add_report_arguments(parser):
+    parser.add_argument('-o', '--output', help='PDF report path (default: <input>_<analysis>.pdf)')
+    parser.add_argument('--json', help='write a JSON run summary to this path')
+    parser.add_argument('--results', action='append', metavar='PATH',
+                        help='write the structured results to PATH (.json, .csv or .parquet); may be repeated')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help='always re-analyse, ignoring (and not updating) the analysis cache')
+    parser.add_argument('--db', help='record the results for trending in this SQLite database (keyed by --linac-id)')
+    parser.add_argument('--institution', default='', help='institution name for the report header')
+    parser.add_argument('--department', default='', help='department name for the report header')
+    parser.add_argument('--linac-id', dest='linac_ID', default='', help='machine ID/name')
+    parser.add_argument('--measured-by', default='', help='person who measured')
+    parser.add_argument('--quality', choices=REPORT_QUALITIES, default='standard',
+                        help="figure quality: 'draft' (fast, low DPI), 'standard', 'high' or 'vector' (SVG, needs svglib)")
+
+
+def add_energy_depth(parser):
+    parser.add_argument('--energy', type=float, required=True, help='energy (MV)')
+    parser.add_argument('--depth', type=float, required=True, help='depth (cm)')
+    return ['energy', 'depth']
+
+
+def add_fff_2d(parser):
+    params = add_energy_depth(parser)
+    parser.add_argument('--vendor', default='Elekta', help="'Elekta' (inverted profiles) or 'Varian'")
+    parser.add_argument('--invert-profile', action='store_true', help='force profile inversion for other vendors')
+    parser.add_argument('--band-width', type=int, default=1, help='pixels averaged across each profile')
+    parser.add_argument('--auto-centre', action='store_true', help='centre profiles on the detected field')
+    parser.add_argument('--angles', type=float, nargs='*', default=(), help='extra profile angles in degrees')
+    parser.add_argument('--calibration-mm', type=float, help='pixel size at isocentre for TIFF images')
+    return params + ['vendor', 'invert_profile', 'band_width', 'auto_centre', 'angles', 'calibration_mm']
+
+
+def add_fff_2d_batch(parser):
+    params = add_fff_2d(parser)
+    parser.add_argument('--workers', dest='max_workers', type=int, help='worker processes (default: CPU count)')
+    return params + ['max_workers']
+
+
+def add_picket_fence(parser):
+    parser.add_argument('--mlc-type', required=True, choices=MLC_TYPES)
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--action-level', type=float, default=0.1)
+    parser.add_argument('--separate-leaves', action='store_true')
+    parser.add_argument('--nominal-gap', type=float, help='nominal gap (mm) for separate leaves')
+    return ['mlc_type', 'tolerance', 'action_level', 'separate_leaves', 'nominal_gap']
+
+
+def add_picket_fence_multiple(parser):
+    params = add_picket_fence(parser)
+    parser.add_argument('--workers', dest='max_workers', type=int, help='worker processes analysing the images (default: CPU count, at most 4)')
+    return params + ['max_workers']
+
+
+def add_winston_lutz(parser):
+    parser.add_argument('--bb-size', type=float, default=8.0, help='ball bearing size (mm)')
+    return ['bb_size']
+
+
+def add_catphantom(parser):
+    parser.add_argument('--phantom-type', required=True, choices=PHANTOM_TYPES)
+    return ['phantom_type']
+
+
+# Analysis name -> (help, function adding its arguments and returning the parameter names)
+ANALYSIS_ARGUMENTS = {
+    'fff-rfa': ('FFF profile analysis of an RFA export', add_energy_depth),
+    'fff-2d': ('FFF profile analysis of a 2D EPID image (DICOM/TIFF)', add_fff_2d),
+    'fff-2d-batch': ('FFF profile analysis of every image in a folder or glob', add_fff_2d_batch),
+    'field-analysis': ('Field profile analysis', add_energy_depth),
+    'winston-lutz': ('Winston-Lutz analysis of a folder of images', add_winston_lutz),
+    'picket-fence': ('Picket Fence analysis of a single image', add_picket_fence),
+    'picket-fence-multiple': ('Picket Fence analysis of a folder of images', add_picket_fence_multiple),
+    'starshot': ('Starshot analysis', lambda parser: []),
+    'catphantom': ('CatPhan analysis of a CBCT folder', add_catphantom),
+    'leeds-tor': ('Leeds TOR analysis', lambda parser: []),
+}
+
+
+class AutoArguments:
+    """
+    Stands in for an analysis' parser to give the auto parser the options of every analysis, each once,
+    optional and without defaults; options[analysis] keeps (name, required, default) to apply once the
+    analysis is detected.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.options = {}
+        self.analysis = None
+
+    def add_argument(self, *flags, **kwargs):
+        name = kwargs.get('dest') or flags[0].lstrip('-').replace('-', '_')
+        default = kwargs.get('default', False if kwargs.get('action') == 'store_true' else None)
+        self.options[self.analysis].append((name, kwargs.get('required', False), default))
+        if flags[0] not in self.parser._option_string_actions:
+            kwargs.update(required=False, default=argparse.SUPPRESS)
+            self.parser.add_argument(*flags, **kwargs)
+
+    def add_analyses(self):
+        for analysis, (_, add_arguments) in ANALYSIS_ARGUMENTS.items():
+            self.analysis, self.options[analysis] = analysis, []
+            add_arguments(self)
+
+
+def auto_params(args, analysis, options):
+    """
+    The parameters for the analysis detected by auto: its options given on the command line, else
+    params.<analysis> of --config, else the option's default. Raises ValueError when a required one is missing.
+    """
+    config = {}
+    if args.config:
+        from Analysis.runner import read_config_file
+        config = (read_config_file(args.config).get('params') or {}).get(analysis) or {}
+    params = {}
+    for name, required, default in options[analysis]:
+        value = getattr(args, name, config.get(name, default))
+        if value is None and required:
+            raise ValueError(f"{analysis} needs --{name.replace('_', '-')} (or params.{analysis}.{name} in --config)")
+        if value is not None:
+            params[name] = value
+    return params
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='pyRTQA_cli', description='Run pyRTQA analyses without the GUI.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='run every job in a JSON/YAML job file')
+    run_parser.add_argument('job_file')
+    run_parser.add_argument('--workers', type=int, default=1, help='jobs run in parallel (default: 1)')
+    run_parser.add_argument('--json', help='write a JSON summary of all jobs to this path')
+
+    watch_parser = subparsers.add_parser('watch', help='analyse DICOM acquisitions as they arrive in a folder')
+    watch_parser.add_argument('folder', help='folder the imaging system exports DICOM into')
+    watch_parser.add_argument('--output-dir', required=True, help='reports and results go to <output-dir>/<machine>/')
+    watch_parser.add_argument('--work-dir', help='where acquisitions are staged (default: <output-dir>/work)')
+    watch_parser.add_argument('--config', help='JSON/YAML settings: params per analysis, report fields, quality, db')
+    watch_parser.add_argument('--workers', type=int, default=2, help='analyses run at once (default: 2)')
+    watch_parser.add_argument('--settle-s', type=float, default=10.0,
+                              help='seconds a folder must stay unchanged before its files are taken (default: 10)')
+    watch_parser.add_argument('--move', action='store_true', help='move acquisitions out of the folder instead of copying')
+
+    receive_parser = subparsers.add_parser('receive', help='DICOM storage SCP: analyse series pushed to it')
+    receive_parser.add_argument('--output-dir', required=True, help='reports and results go to <output-dir>/<machine>/')
+    receive_parser.add_argument('--spool-dir', help='where complete series are written (default: <output-dir>/spool)')
+    receive_parser.add_argument('--ae-title', default='PYRTQA', help='AE title to accept (default: PYRTQA)')
+    receive_parser.add_argument('--port', type=int, default=11112, help='port to listen on (default: 11112)')
+    receive_parser.add_argument('--config', help='JSON/YAML settings, as for watch')
+    receive_parser.add_argument('--workers', type=int, default=2, help='analyses run at once (default: 2)')
+    receive_parser.add_argument('--settle-s', type=float, default=5.0,
+                                help='seconds without new instances after which a series is complete (default: 5)')
+
+    times_parser = subparsers.add_parser('import-times', help='report module import times (startup regressions)')
+    times_parser.add_argument('modules', nargs='*', help='modules to time (default: GUI, libraries and analyses)')
+    times_parser.add_argument('--budget-ms', type=float,
+                              help='fail if a GUI startup module takes longer than this to import')
+    times_parser.add_argument('--json', help='write the import times to this path')
+
+    detect_parser = subparsers.add_parser('detect', help='print the QA type detected from DICOM files or folders')
+    detect_parser.add_argument('paths', nargs='+', help='DICOM files, or folders holding one acquisition')
+
+    auto_parser = subparsers.add_parser(AUTO_ANALYSIS, help='analysis detected from the images (see detect)')
+    auto_parser.add_argument('input', help='input file or folder')
+    auto_parser.add_argument('--config', help='JSON/YAML settings: params per analysis, as for watch')
+    auto_arguments = AutoArguments(auto_parser)
+    auto_arguments.add_analyses()
+    add_report_arguments(auto_parser)
+    auto_parser.set_defaults(param_names=[], auto_options=auto_arguments.options)
+
+    for analysis in ANALYSES:
+        help_text, add_arguments = ANALYSIS_ARGUMENTS[analysis]
+        sub = subparsers.add_parser(analysis, help=help_text)
+        sub.add_argument('input', help='input file or folder')
+        params = add_arguments(sub)
+        add_report_arguments(sub)
+        sub.set_defaults(param_names=params)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == 'watch':
+        from Analysis.runner import read_config_file
+        from Analysis.watcher import WatchFolder
+        config = read_config_file(args.config) if args.config else {}
+        if args.move:
+            config['move'] = True
+        WatchFolder(args.folder, args.output_dir, args.work_dir, config, workers=args.workers,
+                    settle_s=args.settle_s).run()
+        return 0
+
+    if args.command == 'receive':
+        from Analysis.runner import read_config_file
+        from Analysis.storescp import StoreSCP
+        config = read_config_file(args.config) if args.config else {}
+        StoreSCP(args.output_dir, ae_title=args.ae_title, port=args.port, spool_dir=args.spool_dir, config=config,
+                 workers=args.workers, settle_s=args.settle_s).serve_forever()
+        return 0
+
+    if args.command == 'import-times':
+        from Analysis.importtimes import import_report, format_report, over_budget
+        budget_s = args.budget_ms / 1000 if args.budget_ms is not None else None
+        rows = import_report(args.modules)
+        print(format_report(rows, budget_s))
+        if args.json:
+            write_json(args.json, rows)
+        return 1 if budget_s is not None and over_budget(rows, budget_s) else 0
+
+    if args.command == 'detect':
+        from Analysis.routing import detect_path
+        detected = {path: detect_path(path) for path in args.paths}
+        for path, analysis in detected.items():
+            print(f"{analysis or 'unknown'}\t{path}")
+        return 0 if all(detected.values()) else 1
+
+    if args.command == 'run':
+        summaries = run_jobs(load_job_file(args.job_file), max_workers=args.workers)
+        if args.json:
+            write_json(args.json, summaries)
+    else:
+        analysis = args.command
+        params = {name: getattr(args, name) for name in args.param_names if getattr(args, name) is not None}
+        if analysis == AUTO_ANALYSIS:
+            from Analysis.runner import resolve_analysis
+            try:
+                analysis = resolve_analysis(analysis, args.input)
+                params = auto_params(args, analysis, args.auto_options)
+            except ValueError as e:
+                print(f"[error] {AUTO_ANALYSIS}: {args.input}: {e}", file=sys.stderr)
+                return 1
+        job = {
+            'analysis': analysis,
+            'input': args.input,
+            'params': params,
+            'output': args.output,
+            'json': args.json,
+            'results': args.results,
+            'db': args.db,
+            'cache': args.cache,
+            'institution': args.institution,
+            'department': args.department,
+            'linac_ID': args.linac_ID,
+            'measured_by': args.measured_by,
+            'quality': args.quality,
+        }
+        summaries = run_jobs([job])
+
+    for summary in summaries:
+        if summary['status'] == 'ok':
+            print(f"[ok] {summary['analysis']}: {summary['input']} -> {summary['pdf']} ({summary['elapsed_s']} s)")
+        else:
+            print(f"[error] {summary['analysis']}: {summary['input']}: {summary['error']}", file=sys.stderr)
+    return 0 if all(summary['status'] == 'ok' for summary in summaries) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRBigEndian, ExplicitVRLittleEndian, ImplicitVRLittleEndian, generate_uid
+
+RT_IMAGE_STORAGE = '1.2.840.10008.5.1.4.1.1.481.1'
+
+
+def make_rt_image(pixels, transfer_syntax=ExplicitVRLittleEndian, series_uid=None, **attributes):
+    """A minimal RT Image dataset holding pixels (uint16), ready to be written with write_like_original=False."""
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = transfer_syntax
+    ds.file_meta.MediaStorageSOPClassUID = ds.SOPClassUID = RT_IMAGE_STORAGE
+    ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID = generate_uid()
+    ds.SeriesInstanceUID = series_uid or generate_uid()
+    ds.StudyInstanceUID = generate_uid()
+    ds.Modality = 'RTIMAGE'
+    ds.Rows, ds.Columns = pixels.shape
+    ds.BitsAllocated = ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 0
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = 'MONOCHROME2'
+    ds.PixelData = pixels.astype(np.uint16).tobytes()
+    ds.is_little_endian = transfer_syntax != ExplicitVRBigEndian
+    ds.is_implicit_VR = transfer_syntax == ImplicitVRLittleEndian
+    for keyword, value in attributes.items():
+        setattr(ds, keyword, value)
+    return ds
+
+
+def without_dates(data):
+    """pylinac results without the analysis timestamps, which differ between two runs."""
+    if isinstance(data, dict):
+        return {key: without_dates(value) for key, value in data.items() if key != 'date_of_analysis'}
+    if isinstance(data, list):
+        return [without_dates(value) for value in data]
+    return data
+
+
+@pytest.fixture
+def gradient_pixels():
+    return (np.arange(64 * 48, dtype=np.uint32).reshape(64, 48) * 7 % 65535).astype(np.uint16)
+
+
+@pytest.fixture(scope='session')
+def wl_folder(tmp_path_factory):
+    """Six simulated Winston-Lutz images (20 mm field, 5 mm BB), made by pylinac's image generator."""
+    image_generator = pytest.importorskip('pylinac.core.image_generator')
+    folder = tmp_path_factory.mktemp('wl')
+    image_generator.generate_winstonlutz(
+        image_generator.AS1200Image(sid=1000), image_generator.PerfectFieldLayer, dir_out=str(folder),
+        final_layers=[image_generator.GaussianFilterLayer(sigma_mm=1)], field_size_mm=(20, 20), bb_size_mm=5,
+        image_axes=[(0, 0, 0), (90, 0, 0), (180, 0, 0), (270, 0, 0), (0, 90, 0), (0, 270, 0)])
+    return str(folder)
+
+
+@pytest.fixture(scope='session')
+def pf_folder(tmp_path_factory):
+    """Simulated Picket Fence images at three gantry angles, made by pylinac's image generator."""
+    image_generator = pytest.importorskip('pylinac.core.image_generator')
+    folder = tmp_path_factory.mktemp('pf')
+    for gantry in (0, 90, 270):
+        image_generator.generate_picketfence(
+            simulator=image_generator.AS1200Image(sid=1500), field_layer=image_generator.FilteredFieldLayer,
+            file_out=str(folder / f'pf_g{gantry}.dcm'), final_layers=[image_generator.GaussianFilterLayer(sigma_mm=1)],
+            gantry_angle=gantry)
+    return str(folder)
@@ -0,0 +1,45 @@
+import os
+import time
+from Analysis.background import BackgroundJob
+
+PF_PARAMS = {'mlc_type': 'MILLENNIUM', 'tolerance': 0.5, 'action_level': 0.3}
+REPORT_FIELDS = ('Institution', 'Department', 'LA1', 'Tester')
+
+
+def wait_for(job, timeout_s=180):
+    """The events of the job's current step, up to the one that ends it."""
+    events = []
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        events += job.poll()
+        if not job.is_running:
+            return events
+        time.sleep(0.1)
+    raise TimeoutError(f"Background job still running after {timeout_s} s: {events}")
+
+
+def test_reports_are_written_in_the_analysis_process(pf_folder, tmp_path):
+    job = BackgroundJob('picket-fence-multiple', pf_folder, PF_PARAMS, use_cache=False).start()
+    try:
+        events = wait_for(job)
+        assert events[-1][0] == 'done'
+        assert [row['gantry'] for row in events[-1][1].rows] == [0, 90, 270]
+
+        first = str(tmp_path / 'first.pdf')
+        job.report(*REPORT_FIELDS, first, 'draft')
+        events = wait_for(job)
+        assert events[-1] == ('report', first)
+        assert any(event[0] == 'progress' for event in events)
+        assert os.path.getsize(first) > 0
+
+        # A cancelled report leaves the analysis ready for the next one
+        job.report(*REPORT_FIELDS, str(tmp_path / 'cancelled.pdf'), 'draft')
+        job.cancel()
+        assert wait_for(job)[-1] == ('cancelled',)
+        assert job.can_report
+        second = str(tmp_path / 'second.pdf')
+        job.report(*REPORT_FIELDS, second, 'draft')
+        assert wait_for(job)[-1] == ('report', second)
+    finally:
+        job.close()
+    assert job.finished and not job.can_report
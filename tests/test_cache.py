@@ -0,0 +1,61 @@
+import os
+import pytest
+from Analysis.cache import AnalysisCache, renders_at
+from Analysis.figures import DeferredFigure
+from Analysis.generatepdf import generate_pdf
+from Analysis.runner import run_analysis
+
+ANALYSES = {
+    'picket-fence-multiple': ('pf_folder', {'mlc_type': 'MILLENNIUM', 'tolerance': 0.5, 'action_level': 0.3}),
+    'winston-lutz': ('wl_folder', {'bb_size': 5}),
+}
+
+
+def deferred(elements):
+    return [element for element in elements if isinstance(element, DeferredFigure)]
+
+
+@pytest.mark.parametrize('analysis', ANALYSES)
+def test_built_report_round_trips_through_the_cache(request, tmp_path, analysis):
+    folder_fixture, params = ANALYSES[analysis]
+    input_path = request.getfixturevalue(folder_fixture)
+    cache = AnalysisCache(str(tmp_path / 'cache'))
+    report = ('Institution', 'Department', 'LA1', 'Tester')
+
+    elements = run_analysis(analysis, input_path, cache=cache, **params)
+    assert elements.cache_key is not None
+    # Nothing is stored until the figures are rendered
+    assert cache.get(elements.cache_key) is None
+    generate_pdf(elements, *report, str(tmp_path / 'first.pdf'), cache=cache)
+    # The rendered figures went to the cache entry, not back onto the live elements
+    assert all(not figure.rendered for figure in deferred(elements))
+
+    cached = run_analysis(analysis, input_path, cache=cache, **params)
+    assert cached.results.data == elements.results.data
+    figures = deferred(cached)
+    assert len(figures) == len(deferred(elements))
+    assert all(figure.plot is None and figure.rendered for figure in figures)
+    generate_pdf(cached, *report, str(tmp_path / 'second.pdf'), cache=cache)
+    assert os.path.getsize(tmp_path / 'second.pdf') > 0
+
+
+def test_other_quality_is_a_cache_miss(pf_folder, tmp_path):
+    analysis, (_, params) = 'picket-fence-multiple', ANALYSES['picket-fence-multiple']
+    cache = AnalysisCache(str(tmp_path / 'cache'))
+    report = ('Institution', 'Department', 'LA1', 'Tester')
+    generate_pdf(run_analysis(analysis, pf_folder, cache=cache, **params), *report, str(tmp_path / 'standard.pdf'),
+                 cache=cache)
+
+    cached = run_analysis(analysis, pf_folder, cache=cache, **params)
+    assert renders_at(cached) and not renders_at(cached, 'draft')
+    # Never drawn from the standard renderings
+    with pytest.raises(ValueError):
+        generate_pdf(cached, *report, str(tmp_path / 'wrong.pdf'), quality='draft')
+
+    draft = run_analysis(analysis, pf_folder, cache=cache, quality='draft', **params)
+    assert all(figure.plot is not None for figure in deferred(draft))
+    generate_pdf(draft, *report, str(tmp_path / 'draft.pdf'), quality='draft', cache=cache)
+    assert all(figure.plot is None for figure in deferred(run_analysis(analysis, pf_folder, cache=cache,
+                                                                       quality='draft', **params)))
+    # The standard entry is still there
+    assert renders_at(run_analysis(analysis, pf_folder, cache=cache, **params))
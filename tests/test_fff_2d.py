@@ -0,0 +1,118 @@
+import numpy as np
+import pydicom
+import pytest
+from pydicom.uid import (DeflatedExplicitVRLittleEndian, ExplicitVRBigEndian, ExplicitVRLittleEndian,
+                         ImplicitVRLittleEndian)
+from Analysis.dicom_headers import memmap_dicom_pixels
+from Analysis.FFF_FA_2D import (DEFAULT_PIXEL_SPACING_MM, extract_profile_points, extract_profiles, find_field_centre,
+                                read_dicom, read_pixel_spacing)
+from conftest import make_rt_image
+
+
+@pytest.mark.parametrize('transfer_syntax', [ExplicitVRLittleEndian, ImplicitVRLittleEndian, ExplicitVRBigEndian])
+def test_uncompressed_pixels_are_memory_mapped(tmp_path, gradient_pixels, transfer_syntax):
+    path = str(tmp_path / 'image.dcm')
+    ds = make_rt_image(gradient_pixels, transfer_syntax)
+    if transfer_syntax == ExplicitVRBigEndian:
+        ds.PixelData = gradient_pixels.astype('>u2').tobytes()
+    pydicom.dcmwrite(path, ds, write_like_original=False)
+    pixels = memmap_dicom_pixels(path)
+    assert isinstance(pixels, np.memmap)
+    np.testing.assert_array_equal(pixels, gradient_pixels)
+
+
+def test_deflated_pixels_are_decoded(tmp_path, gradient_pixels):
+    path = str(tmp_path / 'deflated.dcm')
+    pydicom.dcmwrite(path, make_rt_image(gradient_pixels, DeflatedExplicitVRLittleEndian), write_like_original=False)
+    assert memmap_dicom_pixels(path) is None
+    np.testing.assert_array_equal(read_dicom(path), gradient_pixels)
+
+
+def field_image(shape=(400, 600), rows=(80, 181), cols=(350, 451), low=100, high=4000):
+    pixels = np.full(shape, low, dtype=np.uint16)
+    pixels[rows[0]:rows[1], cols[0]:cols[1]] = high
+    return pixels
+
+
+def field_span(points):
+    """x (cm) of the first and last profile points above half the maximum."""
+    inside = [point.x for point in points if point.y > 50]
+    return inside[0], inside[-1]
+
+
+def test_field_centre_of_an_offset_field():
+    assert find_field_centre(field_image()) == pytest.approx((130, 400), abs=2)
+    # Dark field on a bright background (e.g. Elekta iView)
+    assert find_field_centre(field_image(low=4000, high=100), invert=True) == pytest.approx((130, 400), abs=2)
+
+
+def test_auto_centred_profiles_pass_through_the_field():
+    pixels = field_image()
+    profiles, centre = extract_profiles(pixels, auto_centre=True)
+    assert centre == pytest.approx((130, 400), abs=2)
+    inline, crossline = dict(profiles)['Inline'], dict(profiles)['Crossline']
+    # 101 pixels of 0.25 mm either side of the centre
+    for points in (inline, crossline):
+        left, right = field_span(points)
+        assert left == pytest.approx(-1.25, abs=0.05) and right == pytest.approx(1.25, abs=0.05)
+    # Through the image centre the inline profile misses the field altogether
+    centred, centre = extract_profiles(pixels)
+    assert centre is None
+    assert {point.y for point in dict(centred)['Inline']} == {100}
+
+
+def test_band_averages_neighbouring_rows():
+    pixels = (np.arange(50, dtype=np.float32)[:, np.newaxis] * 10 + np.arange(80)).astype(np.uint16)
+    points = extract_profile_points(pixels, axis=0, band_width=5, centre=(20, 40))
+    expected = pixels[18:23].astype(np.float32).mean(axis=0)
+    np.testing.assert_allclose([point.y for point in points], expected / expected.max() * 100, rtol=1e-6)
+
+
+def test_angled_profiles():
+    rows, cols = np.mgrid[:301, :301]
+    pixels = np.where(np.hypot(rows - 150, cols - 150) <= 80, 4000, 100).astype(np.uint16)
+    inline = extract_profile_points(pixels, axis=0, centre=(150, 150))
+    along_row = extract_profile_points(pixels, angle=0, centre=(150, 150))
+    np.testing.assert_allclose([point.y for point in along_row], [point.y for point in inline], atol=1e-4)
+    np.testing.assert_allclose([point.x for point in along_row], [point.x for point in inline])
+    # A round field is as wide along the diagonal: 80 pixels of 0.25 mm either side
+    left, right = field_span(extract_profile_points(pixels, angle=45, centre=(150, 150)))
+    assert left == pytest.approx(-2.0, abs=0.05) and right == pytest.approx(2.0, abs=0.05)
+
+
+def write_image(path, pixels, **attributes):
+    pydicom.dcmwrite(str(path), make_rt_image(pixels, **attributes), write_like_original=False)
+    return str(path)
+
+
+def test_imager_spacing_is_projected_to_the_isocentre(tmp_path, gradient_pixels):
+    image = write_image(tmp_path / 'epid.dcm', gradient_pixels, ImagePlanePixelSpacing=[0.392, 0.4],
+                        RTImageSID=1500, RadiationMachineSAD=1000)
+    assert read_pixel_spacing(image, 'DICOM') == pytest.approx((0.392 / 1.5, 0.4 / 1.5))
+    # No SID: the imager spacing as stored
+    image = write_image(tmp_path / 'no_sid.dcm', gradient_pixels, ImagePlanePixelSpacing=[0.392, 0.4])
+    assert read_pixel_spacing(image, 'DICOM') == pytest.approx((0.392, 0.4))
+
+
+def test_pixel_spacing_fallbacks(tmp_path, gradient_pixels, caplog):
+    # PixelSpacing is already at the isocentre, so SID/SAD do not apply
+    image = write_image(tmp_path / 'plane.dcm', gradient_pixels, PixelSpacing=[0.3, 0.35],
+                        RTImageSID=1500, RadiationMachineSAD=1000)
+    assert read_pixel_spacing(image, 'DICOM') == pytest.approx((0.3, 0.35))
+    image = write_image(tmp_path / 'bare.dcm', gradient_pixels)
+    assert read_pixel_spacing(image, 'DICOM', calibration_mm=0.2) == (0.2, 0.2)
+    assert read_pixel_spacing('film.tif', 'TIFF', calibration_mm=(0.2, 0.3)) == (0.2, 0.3)
+    assert read_pixel_spacing('film.tif', 'TIFF') == DEFAULT_PIXEL_SPACING_MM
+    assert 'No pixel spacing for film.tif' in caplog.text
+
+
+def test_profile_positions_follow_the_pixel_spacing():
+    pixels = field_image((400, 600), rows=(150, 251), cols=(250, 351))
+    options = dict(centre=(200, 300), pixel_spacing_mm=(0.2, 0.5))
+    inline = extract_profile_points(pixels, axis=0, **options)
+    crossline = extract_profile_points(pixels, axis=1, **options)
+    # Inline runs along a row (column spacing), crossline down a column (row spacing); x is in cm
+    assert inline[1].x - inline[0].x == pytest.approx(0.05)
+    assert crossline[1].x - crossline[0].x == pytest.approx(0.02)
+    assert field_span(inline) == pytest.approx((-2.5, 2.5), abs=0.06)
+    assert field_span(crossline) == pytest.approx((-1.0, 1.0), abs=0.03)
@@ -0,0 +1,80 @@
+import threading
+import matplotlib.pyplot as plt
+import pytest
+from matplotlib.figure import Figure
+from Analysis import figures
+from Analysis.figures import DeferredFigure, FigureRenderer, render_figure
+
+
+def line_plot(values):
+    fig = Figure()
+    fig.add_subplot().plot(values)
+    return fig
+
+
+def report_figures(count, picklable=True):
+    lock = threading.Lock()
+    plot = line_plot if picklable else (lambda values, lock=lock: line_plot(values))
+    return [DeferredFigure(plot, [i, i + 1], width=100, height=80) for i in range(count)]
+
+
+@pytest.fixture
+def pooled(monkeypatch):
+    """FigureRenderer._render_parallel calls, recorded instead of starting a pool."""
+    calls = []
+    monkeypatch.setattr(FigureRenderer, '_render_parallel', lambda self, pending, workers: calls.append(pending) or {})
+    return calls
+
+
+def test_only_picklable_figures_go_to_the_pool(monkeypatch, pooled):
+    monkeypatch.setattr(figures, 'POOL_START_S', 0.0)
+    portable, local = report_figures(20), report_figures(20, picklable=False)
+    with FigureRenderer(max_workers=4) as renderer:
+        data = renderer.render(local + portable)
+    assert len(data) == 40
+    # The first is timed here
+    assert pooled == [portable[1:]]
+
+
+def test_drawn_figures_and_bound_methods_stay_here(monkeypatch, pooled):
+    monkeypatch.setattr(figures, 'POOL_START_S', 0.0)
+    drawn = [DeferredFigure.from_figure(line_plot([i, 0]), width=100, height=80) for i in range(20)]
+    bound = [DeferredFigure(Figure().savefig, width=100, height=80) for _ in range(20)]
+    assert not any(figures._portable(figure) for figure in drawn + bound)
+    with FigureRenderer(max_workers=4) as renderer:
+        renderer.render(drawn)
+    assert pooled == []
+
+
+def test_returned_pyplot_figures_are_closed():
+    def pyplot_plot():
+        fig, ax = plt.subplots()
+        ax.plot([0, 1])
+        return fig
+
+    before = len(plt.get_fignums())
+    render_figure(pyplot_plot)
+    assert len(plt.get_fignums()) == before
+
+
+def test_pool_is_not_started_when_it_would_be_slower(pooled):
+    with FigureRenderer(max_workers=4) as renderer:
+        renderer.render(report_figures(20))
+    assert pooled == []
+
+
+def test_few_figures_are_rendered_here(monkeypatch, pooled):
+    monkeypatch.setattr(figures, 'POOL_START_S', 0.0)
+    with FigureRenderer(max_workers=4) as renderer:
+        renderer.render(report_figures(figures.MIN_PARALLEL_FIGURES - 1))
+    assert pooled == []
+
+
+def test_rendered_data_is_only_kept_when_asked():
+    report = report_figures(2)
+    with FigureRenderer(max_workers=1) as renderer:
+        renderer.render(report)
+    assert all(not figure.rendered for figure in report)
+    with FigureRenderer(max_workers=1, keep=True) as renderer:
+        data = [buffer.getvalue() for buffer in renderer.render(report)]
+    assert [figure.rendered[('png', None)] for figure in report] == data
@@ -0,0 +1,35 @@
+import pickle
+import pandas as pd
+from matplotlib.figure import Figure
+from Analysis.dicom_headers import build_header_index
+from Analysis.figures import DeferredFigure
+from Analysis.Picketfence_batch import analyze_picketfence_file, analyze_picketfence_multiple
+from conftest import without_dates
+
+ARGS = {'tolerance': 0.5, 'action_level': 0.3, 'mlc_type': 'MILLENNIUM'}
+
+
+def test_pooled_batch_matches_serial(pf_folder, caplog):
+    serial = analyze_picketfence_multiple(pf_folder, **ARGS, max_workers=1)
+    pooled = analyze_picketfence_multiple(pf_folder, **ARGS, max_workers=2)
+    assert without_dates(pooled.results.data) == without_dates(serial.results.data)
+    assert [row['gantry'] for row in serial.results.rows] == [0, 90, 270]
+    assert 'Worker failed' not in caplog.text
+
+
+def test_pooled_figures_are_drawn_by_the_workers(pf_folder):
+    elements = pickle.loads(pickle.dumps(analyze_picketfence_multiple(pf_folder, **ARGS, max_workers=2)))
+    figures = [element for element in elements if isinstance(element, DeferredFigure)]
+    assert len(figures) == 6
+    # Each holds its drawn figure, so drawing the report never analyses the image again
+    assert all(isinstance(figure.args[0], Figure) for figure in figures)
+    assert figures[0].render().getvalue().startswith(b'\x89PNG')
+    assert figures[1].render().getvalue().startswith(b'\x89PNG')
+
+
+def test_missing_gantry_is_none(pf_folder):
+    header = {**build_header_index(pf_folder)[0], 'GantryAngle': None}
+    row = analyze_picketfence_file(header, 0.5, 0.3, 'MILLENNIUM')
+    assert row['gantry'] is None and row['gantry_str'] == 'N/A'
+    # A numeric column, so the rows can be written as Parquet
+    assert pd.DataFrame([row, {**row, 'gantry': 90.0}])['gantry'].dtype == float
@@ -0,0 +1,104 @@
+from decimal import Decimal
+import numpy as np
+import pytest
+from Analysis import profile_engine
+from Analysis.profile_engine import ShoulderIndex, interpolate_x, predict_x
+
+
+def baseline_calculate(x, dose):
+    """The original point-by-point Process.calculate (nearest samples), with fresh state for one profile."""
+    max_slope, min_slope, y1, y2 = float('-inf'), float('inf'), 0, 0
+    for i in range(len(x) - 1):
+        dx, dy = x[i + 1] - x[i], dose[i + 1] - dose[i]
+        slope = dy / dx if dx != 0 else float('inf')
+        if slope > max_slope:
+            max_slope, y1 = slope, dose[i]
+        if slope < min_slope:
+            min_slope, y2 = slope, dose[i]
+
+    def predict(level, side):
+        best, predicted = float('inf'), float('inf')
+        for px, py in zip(x, dose):
+            if abs(py - level) < best and px * side > 0:
+                best, predicted = abs(py - level), px
+        return predicted
+
+    rdv = (y1 + y2) / 2
+    neg = {name: predict(level, -1) for name, level in (('avg', rdv), ('upper', rdv * 1.6), ('lower', rdv * 0.4),
+                                                       (90, 90), (75, 75), (60, 60))}
+    pos = {name: predict(level, 1) for name, level in (('avg', rdv), ('upper', rdv * 1.6), ('lower', rdv * 0.4),
+                                                      (90, 90), (75, 75), (60, 60))}
+    return {
+        'max_slope': Decimal(max_slope), 'min_slope': Decimal(min_slope), 'RDV': rdv,
+        'PLu': neg['upper'], 'PLd': neg['lower'], 'Penumbra_Left(mm)': abs(neg['lower'] - neg['upper']) * 10,
+        'PRu': pos['upper'], 'PRd': pos['lower'], 'Penumbra_Right(mm)': abs(pos['lower'] - pos['upper']) * 10,
+        'IPL': neg['avg'], 'IPR': pos['avg'], 'Field size(mm)': (pos['avg'] - neg['avg']) * 10,
+        '90-': neg[90], '90+': pos[90], 'X90%': pos[90] - neg[90],
+        '75-': neg[75], '75+': pos[75], 'X75%': pos[75] - neg[75],
+        '60-': neg[60], '60+': pos[60], 'X60%': pos[60] - neg[60],
+    }
+
+
+def sigmoid_profile(half_width=5.0, spacing=0.1, noise=0.0, seed=0):
+    x = np.round(np.arange(-10, 10 + spacing / 2, spacing), 6)
+    dose = 104 / (1 + np.exp((np.abs(x) - half_width) / 0.3))
+    if noise:
+        dose = dose + np.random.default_rng(seed).normal(0, noise, dose.size)
+    return x, dose
+
+
+def trapezoid_profile():
+    """Flat top of 100% to |x| = 4 cm, falling linearly to 0 at 8 cm, sampled every 1 cm."""
+    x = np.arange(-10.0, 11.0)
+    dose = np.clip(100 - 25 * (np.abs(x) - 4), 0, 100)
+    return x, dose
+
+
+@pytest.mark.parametrize('profile', [sigmoid_profile(), sigmoid_profile(noise=1.0), trapezoid_profile()],
+                         ids=['sigmoid', 'noisy', 'flat-top'])
+def test_nearest_sample_mode_matches_the_baseline(profile):
+    x, dose = profile
+    assert profile_engine.calculate(x, dose, interpolate=False) == baseline_calculate(x.tolist(), dose.tolist())
+
+
+def test_interpolated_crossings_of_a_linear_edge():
+    x, dose = trapezoid_profile()
+    results = profile_engine.calculate(x, dose)
+    # Steepest rise starts at 0%, steepest fall at 100%
+    assert results['RDV'] == 50
+    expected = {'90+': 4.4, '75+': 5.0, '60+': 5.6, 'IPR': 6.0, 'PRu': 4.8, 'PRd': 7.2}
+    for key, value in expected.items():
+        assert results[key] == pytest.approx(value)
+        assert results[key.replace('+', '-').replace('R', 'L')] == pytest.approx(-value)
+    assert results['Field size(mm)'] == pytest.approx(120)
+    assert results['Penumbra_Left(mm)'] == pytest.approx(24)
+    assert results['X90%'] == pytest.approx(8.8)
+    # Nearest samples: every flat-top sample is as close to 90% as the shoulder, so the first one wins
+    assert profile_engine.calculate(x, dose, interpolate=False)['90+'] == 1.0
+
+
+def test_noisy_crossings_stay_between_their_samples():
+    clean = profile_engine.calculate(*sigmoid_profile())
+    noisy = profile_engine.calculate(*sigmoid_profile(noise=1.0))
+    for key in ('90-', '90+', '75-', '75+', '60-', '60+'):
+        assert abs(noisy[key] - clean[key]) < 0.1
+    assert noisy['90+'] < noisy['75+'] < noisy['60+']
+    assert noisy['60-'] < noisy['75-'] < noisy['90-']
+
+
+def test_shoulder_index_edges():
+    x, dose = trapezoid_profile()
+    index = ShoulderIndex(x, dose, 1)
+    # Above the profile: already crossed at the sample next to the CAX; below it: never crossed
+    above, below = index.crossings([120, -5])
+    assert above == 1.0
+    assert np.isnan(below)
+    # The never-crossed level falls back to the nearest sample
+    assert interpolate_x([-5], x, dose, 1)[0] == predict_x([-5], x, dose, 1)[0] == 8.0
+
+
+def test_calculate_many_keeps_input_order_and_matches_calculate():
+    profiles = [sigmoid_profile(half_width) for half_width in (2.0, 3.0, 5.0, 7.0)] + [trapezoid_profile()]
+    results = profile_engine.calculate_many(profiles, max_workers=4)
+    assert results == [profile_engine.calculate(x, dose) for x, dose in profiles]
+    assert [round(result['Field size(mm)']) for result in results[:4]] == [40, 60, 100, 140]
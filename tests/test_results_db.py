@@ -0,0 +1,58 @@
+from datetime import datetime
+import pydicom
+from Analysis.results import QAResults
+from Analysis.results_db import ResultsStore, record_results
+from conftest import make_rt_image
+
+
+def rfa_results(path='profiles.xlsx'):
+    """A two-energy RFA run, as process_fff_analysis labels it (the run's own energy left unset)."""
+    rows = [{'profile': '6MV d10 Inline', 'energy': 6.0, 'depth': 10.0, 'Field size(mm)': 100.2},
+            {'profile': '10MV d10 Inline', 'energy': 10.0, 'depth': 10.0, 'Field size(mm)': 100.6}]
+    return QAResults('fff-rfa', path, {'profiles': rows}, rows=rows, energy=None, depth=10.0)
+
+
+def test_multi_energy_metrics_keep_each_profiles_energy(tmp_path):
+    with ResultsStore(str(tmp_path / 'results.sqlite')) as store:
+        store.add('LA1', rfa_results(), '2026-05-01T09:00:00')
+        assert store.trend('LA1', 'fff-rfa', '6MV d10 Inline.Field size(mm)', energy=6) == \
+            [('2026-05-01T09:00:00', 100.2)]
+        assert store.trend('LA1', 'fff-rfa', '10MV d10 Inline.Field size(mm)', energy=10) == \
+            [('2026-05-01T09:00:00', 100.6)]
+        assert store.trend('LA1', 'fff-rfa', '10MV d10 Inline.Field size(mm)', energy=6) == []
+        assert store.metrics('LA1', 'fff-rfa') == ['10MV d10 Inline.Field size(mm)', '6MV d10 Inline.Field size(mm)']
+        # Several energies: the run as a whole has none
+        assert store.runs()[0]['energy'] is None
+
+
+def test_single_energy_run_takes_its_rows_energy(tmp_path):
+    results = rfa_results()
+    results.rows = results.rows[:1]
+    with ResultsStore(str(tmp_path / 'results.sqlite')) as store:
+        store.add('LA1', results, '2026-05-01T09:00:00')
+        assert store.runs()[0]['energy'] == 6.0
+
+
+def test_measured_at_is_the_dicom_acquisition_time(tmp_path, gradient_pixels):
+    image = str(tmp_path / 'image.dcm')
+    pydicom.dcmwrite(image, make_rt_image(gradient_pixels, AcquisitionDate='20260304', AcquisitionTime='081500'),
+                     write_like_original=False)
+    results = QAResults('winston-lutz', str(tmp_path), {'max_2d_cax_to_bb_mm': 0.4})
+    # As when it comes back from the analysis cache
+    results.created = '2020-01-01T00:00:00'
+    db = str(tmp_path / 'results.sqlite')
+    record_results(results, 'LA1', db)
+    with ResultsStore(db) as store:
+        assert store.runs()[0]['measured_at'] == '2026-03-04T08:15:00'
+
+
+def test_measured_at_without_acquisition_time_is_the_run_time(tmp_path):
+    results = rfa_results(str(tmp_path / 'profiles.xlsx'))
+    results.created = '2020-01-01T00:00:00'
+    db = str(tmp_path / 'results.sqlite')
+    record_results(results, 'LA1', db, ran_at=datetime(2026, 5, 1, 9, 30))
+    record_results(results, 'LA1', db)
+    with ResultsStore(db) as store:
+        measured = [run['measured_at'] for run in store.runs()]
+    assert measured[0] == '2026-05-01T09:30:00'
+    assert measured[1] > '2026-01-01'
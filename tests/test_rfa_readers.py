@@ -0,0 +1,26 @@
+import pytest
+from Analysis.rfa_readers import parse_profile_label
+
+
+@pytest.mark.parametrize('label, energy, depth', [
+    ('6X FFF d10 Inline', 6.0, 10.0),
+    ('10MV 5cm Crossline', 10.0, 5.0),
+    ('6XFFF depth 1.5 Inline', 6.0, 1.5),
+    ('15 MV Crossline', 15.0, None),
+    ('Inline', None, None),
+])
+def test_parse_profile_label(label, energy, depth):
+    assert parse_profile_label(label) == {'energy': energy, 'depth': depth}
+
+
+@pytest.mark.parametrize('label', ['20x20 Inline', '10 x 10 Crossline', 'FS 20X20 d10'])
+def test_field_size_is_not_an_energy(label):
+    assert parse_profile_label(label)['energy'] is None
+
+
+def test_field_size_next_to_energy():
+    assert parse_profile_label('6X 20x20 d10 Inline') == {'energy': 6.0, 'depth': 10.0}
+
+
+def test_field_size_in_cm_is_not_a_depth():
+    assert parse_profile_label('10MV 10x10cm Inline') == {'energy': 10.0, 'depth': None}
@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pydicom
+import pytest
+from pydicom.uid import DeflatedExplicitVRLittleEndian, ExplicitVRLittleEndian
+from Analysis.qa_detect import read_thumbnail, thumbnail
+from Analysis.routing import route_series
+from conftest import make_rt_image
+import pyRTQA_cli
+
+
+@pytest.mark.parametrize('label, analysis', [
+    ('Starshot G0', 'starshot'),
+    ('STAR 6X', 'starshot'),
+    ('Picket fence', 'picket-fence'),
+    ('WL G90 C0', 'winston-lutz'),
+])
+def test_labels_route_to_their_analysis(label, analysis):
+    assert route_series([{'Modality': 'RTIMAGE', 'RTImageLabel': label}], lambda header: None) == analysis
+
+
+@pytest.mark.parametrize('label', ['Start of day', 'Startup check', 'Stark'])
+def test_words_starting_with_star_are_not_starshots(label):
+    assert route_series([{'Modality': 'RTIMAGE', 'RTImageLabel': label}], lambda header: None) is None
+
+
+@pytest.mark.parametrize('transfer_syntax', [ExplicitVRLittleEndian, DeflatedExplicitVRLittleEndian])
+def test_thumbnail_read_from_the_file_matches_the_dataset(tmp_path, transfer_syntax):
+    pixels = np.zeros((256, 192), dtype=np.uint16)
+    pixels[64:192, 48:144] = 4000
+    path = str(tmp_path / 'image.dcm')
+    ds = make_rt_image(pixels, transfer_syntax, RTImageLabel='Field')
+    pydicom.dcmwrite(path, ds, write_like_original=False)
+    header, image = read_thumbnail(path)
+    assert header['RTImageLabel'] == 'Field'
+    np.testing.assert_allclose(image, thumbnail(ds))
+
+
+def test_detection_does_not_import_the_report_libraries():
+    code = "import sys, Analysis.qa_detect; print([m for m in ('matplotlib', 'reportlab') if m in sys.modules])"
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+    assert output.strip() == '[]'
+
+
+def test_auto_takes_the_detected_analysis_options_from_the_config(tmp_path):
+    config = tmp_path / 'config.json'
+    config.write_text('{"params": {"picket-fence": {"mlc_type": "AGILITY", "tolerance": 0.3}}}')
+    args = pyRTQA_cli.build_parser().parse_args(
+        ['auto', 'pf.dcm', '--config', str(config), '--tolerance', '0.5', '--bb-size', '5'])
+    params = pyRTQA_cli.auto_params(args, 'picket-fence', args.auto_options)
+    assert params == {'mlc_type': 'AGILITY', 'tolerance': 0.5, 'action_level': 0.1, 'separate_leaves': False}
+
+
+def test_auto_needs_the_detected_analysis_required_options():
+    args = pyRTQA_cli.build_parser().parse_args(['auto', 'image.dcm', '--energy', '6'])
+    with pytest.raises(ValueError, match='--depth'):
+        pyRTQA_cli.auto_params(args, 'fff-2d', args.auto_options)
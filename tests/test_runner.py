@@ -0,0 +1,102 @@
+import json
+import os
+import pytest
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import Paragraph
+from Analysis import runner
+from Analysis.results import QAResults, ReportElements
+from Analysis.runner import load_job_file, run_job, run_jobs
+import pyRTQA_cli
+
+CALLS = []
+
+
+def stub_analysis(input_path, value=1.0):
+    """Stands in for an analysis module's entry function."""
+    CALLS.append((input_path, value))
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(input_path)
+    return ReportElements([Paragraph(f"Stub value {value}", getSampleStyleSheet()['Normal'])],
+                          QAResults('stub', input_path, {'value': value}))
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setitem(runner.ANALYSES, 'stub', (__name__, 'stub_analysis'))
+    CALLS.clear()
+    return CALLS
+
+
+def test_job_file_defaults_and_relative_paths(tmp_path):
+    job_file = tmp_path / 'jobs' / 'jobs.json'
+    job_file.parent.mkdir()
+    job_file.write_text(json.dumps({
+        'defaults': {'institution': 'Clinic', 'params': {'bb_size': 5, 'value': 1}, 'output_dir': 'reports'},
+        'jobs': [{'analysis': 'winston-lutz', 'input': 'wl', 'results': 'wl.json'},
+                 {'analysis': 'stub', 'input': '/data/image.dcm', 'params': {'value': 2}, 'institution': 'Other',
+                  'results': ['a.csv', 'b.json']}],
+    }))
+    base = str(job_file.parent)
+    first, second = load_job_file(str(job_file))
+    assert first == {'analysis': 'winston-lutz', 'input': os.path.join(base, 'wl'), 'institution': 'Clinic',
+                     'output_dir': os.path.join(base, 'reports'), 'params': {'bb_size': 5, 'value': 1},
+                     'results': [os.path.join(base, 'wl.json')]}
+    # Job entries override the defaults; absolute paths stay as they are
+    assert second['institution'] == 'Other' and second['input'] == '/data/image.dcm'
+    assert second['params'] == {'bb_size': 5, 'value': 2}
+    assert second['results'] == [os.path.join(base, 'a.csv'), os.path.join(base, 'b.json')]
+
+    # The same jobs as a YAML list
+    yaml_file = tmp_path / 'jobs' / 'jobs.yaml'
+    yaml_file.write_text("- analysis: stub\n  input: image.dcm\n")
+    assert load_job_file(str(yaml_file)) == [{'analysis': 'stub', 'input': os.path.join(base, 'image.dcm'),
+                                              'params': {}}]
+
+
+def test_job_entry_needs_analysis_and_input(tmp_path):
+    job_file = tmp_path / 'jobs.json'
+    job_file.write_text(json.dumps([{'analysis': 'stub'}]))
+    with pytest.raises(ValueError, match="needs 'analysis' and 'input'"):
+        load_job_file(str(job_file))
+
+
+def test_run_job_dispatches_to_the_analysis(stub, tmp_path):
+    image = tmp_path / 'image.dcm'
+    image.write_bytes(b'')
+    summary = run_job({'analysis': 'stub', 'input': str(image), 'params': {'value': 3.5}, 'cache': False,
+                       'results': str(tmp_path / 'results.json'), 'json': str(tmp_path / 'summary.json')})
+    assert stub == [(str(image), 3.5)]
+    assert summary['status'] == 'ok'
+    # Default report path: next to the input
+    assert summary['pdf'] == str(tmp_path / 'image_stub.pdf') and os.path.getsize(summary['pdf']) > 0
+    assert json.loads((tmp_path / 'results.json').read_text())['results'] == {'value': 3.5}
+    assert json.loads((tmp_path / 'summary.json').read_text())['status'] == 'ok'
+
+
+def test_run_jobs_keeps_order_and_records_failures(stub, tmp_path):
+    image = tmp_path / 'image.dcm'
+    image.write_bytes(b'')
+    jobs = [{'analysis': 'stub', 'input': str(tmp_path / 'missing.dcm'), 'cache': False},
+            {'analysis': 'stub', 'input': str(image), 'cache': False, 'output_dir': str(tmp_path)},
+            {'analysis': 'no-such-analysis', 'input': str(image), 'cache': False}]
+    summaries = run_jobs(jobs)
+    assert [summary['status'] for summary in summaries] == ['error', 'ok', 'error']
+    assert [summary['input'] for summary in summaries] == [job['input'] for job in jobs]
+    assert summaries[0]['pdf'] is None and 'missing.dcm' in summaries[0]['error']
+    assert "Unknown analysis 'no-such-analysis'" in summaries[2]['error']
+
+
+def test_cli_runs_a_job_file(stub, monkeypatch, tmp_path, capsys):
+    monkeypatch.setitem(pyRTQA_cli.ANALYSIS_ARGUMENTS, 'stub', ('Stub analysis', lambda parser: []))
+    image = tmp_path / 'image.dcm'
+    image.write_bytes(b'')
+    (tmp_path / 'jobs.json').write_text(json.dumps([
+        {'analysis': 'stub', 'input': 'image.dcm', 'params': {'value': 2}, 'cache': False},
+        {'analysis': 'stub', 'input': 'missing.dcm', 'cache': False},
+    ]))
+    status = pyRTQA_cli.main(['run', str(tmp_path / 'jobs.json'), '--json', str(tmp_path / 'summary.json')])
+    assert status == 1
+    assert stub == [(str(image), 2), (str(tmp_path / 'missing.dcm'), 1.0)]
+    assert [summary['status'] for summary in json.loads((tmp_path / 'summary.json').read_text())] == ['ok', 'error']
+    output = capsys.readouterr()
+    assert f"[ok] stub: {image}" in output.out and "[error] stub:" in output.err
@@ -0,0 +1,45 @@
+import json
+import socket
+import numpy as np
+import pydicom
+import pytest
+from pydicom.uid import generate_uid
+from Analysis.storescp import StoreSCP
+from conftest import RT_IMAGE_STORAGE, make_rt_image
+
+pynetdicom = pytest.importorskip('pynetdicom')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_pushed_series_is_spooled_and_queued(tmp_path, gradient_pixels):
+    port = free_port()
+    scp = StoreSCP(str(tmp_path / 'out'), port=port, address='127.0.0.1', workers=1, settle_s=60).start()
+    try:
+        series_uid = generate_uid()
+        sent = [make_rt_image(gradient_pixels + i, series_uid=series_uid, RTImageLabel='Picket fence')
+                for i in range(2)]
+        ae = pynetdicom.AE(ae_title='LINAC')
+        ae.add_requested_context(RT_IMAGE_STORAGE)
+        assoc = ae.associate('127.0.0.1', port, ae_title='PYRTQA')
+        assert assoc.is_established
+        for ds in sent:
+            assert assoc.send_c_store(ds).Status == 0x0000
+        assoc.release()
+    finally:
+        # Dispatches the series still settling and waits for its analysis
+        scp.stop()
+
+    for ds in sent:
+        spooled = pydicom.dcmread(str(tmp_path / 'out' / 'spool' / series_uid / f"{ds.SOPInstanceUID}.dcm"))
+        assert spooled.SeriesInstanceUID == series_uid
+        np.testing.assert_array_equal(spooled.pixel_array, ds.pixel_array)
+    # Routed by its label; the analysis fails (no MLC type configured) but runs in the spawned queue
+    with open(tmp_path / 'out' / 'receive_log.jsonl') as f:
+        summaries = [json.loads(line) for line in f]
+    assert [(summary['analysis'], summary['series_uid']) for summary in summaries] == \
+           [('picket-fence-multiple', series_uid)]
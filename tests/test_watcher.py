@@ -0,0 +1,49 @@
+import json
+import os
+import time
+import pydicom
+from Analysis.watcher import WatchFolder
+from conftest import make_rt_image
+
+
+def export_image(folder, pixels, name='image.dcm', series_uid=None):
+    """Write a single-image acquisition as an imaging system's export would."""
+    os.makedirs(folder, exist_ok=True)
+    ds = make_rt_image(pixels, series_uid=series_uid, RTImageLabel='Picket fence')
+    pydicom.dcmwrite(os.path.join(folder, name), ds, write_like_original=False)
+    return ds.SeriesInstanceUID
+
+
+def test_acquisition_is_taken_once_it_settles(tmp_path, gradient_pixels):
+    watcher = WatchFolder(str(tmp_path / 'inbox'), str(tmp_path / 'out'), settle_s=0.5)
+    uid = export_image(tmp_path / 'inbox' / 'export', gradient_pixels)
+    assert watcher.scan() == {}
+    time.sleep(0.3)
+    # Still being written: the settle time starts again
+    export_image(tmp_path / 'inbox' / 'export', gradient_pixels + 1, 'image2.dcm', uid)
+    time.sleep(0.3)
+    assert watcher.scan() == {}
+    time.sleep(0.6)
+    ready = watcher.scan()
+    assert list(ready) == [uid]
+    assert sorted(header['filename'] for header in ready[uid]) == ['image.dcm', 'image2.dcm']
+
+
+def test_watched_acquisition_is_staged_and_queued_once(tmp_path, gradient_pixels):
+    inbox, out = tmp_path / 'inbox', tmp_path / 'out'
+    uid = export_image(inbox, gradient_pixels)
+    config = {'db': str(tmp_path / 'results.sqlite')}
+    watcher = WatchFolder(str(inbox), str(out), config=config, workers=1, settle_s=0.2, poll_s=0.1)
+    watcher.run(max_cycles=10)
+    # Nothing new: later scans, and a restarted watcher, leave it alone
+    watcher.run(max_cycles=3)
+    WatchFolder(str(inbox), str(out), config=config, workers=1, settle_s=0, poll_s=0.1).run(max_cycles=3)
+
+    assert os.listdir(out / 'work' / uid) == ['image.dcm']
+    # Copied, not moved
+    assert os.path.exists(inbox / 'image.dcm')
+    assert (out / 'work' / 'processed.txt').read_text().split() == [uid]
+    # Routed by its label; the analysis fails (no MLC type configured) but runs, once, in the queue
+    with open(out / 'watch_log.jsonl') as f:
+        summaries = [json.loads(line) for line in f]
+    assert [(summary['analysis'], summary['series_uid']) for summary in summaries] == [('picket-fence', uid)]
@@ -0,0 +1,9 @@
+from Analysis.figures import DeferredFigure
+from Analysis.winstonlutz import process_winstonlutz
+
+
+def test_winstonlutz_report(wl_folder):
+    elements = process_winstonlutz(wl_folder, 5)
+    assert elements.results.data['num_total_images'] == 6
+    assert elements.results.context == {'bb_size': 5}
+    assert any(isinstance(element, DeferredFigure) for element in elements)